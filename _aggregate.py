@@ -0,0 +1,151 @@
+"""
+This is the aggregate module of expd_analytics.
+Running per case/endpoint/run statistics that get updated with each batch of new rows, so the failure and
+duration rankings don't need a groupby over the whole history every time they're asked for.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+AGGREGATE_KEYS = ('case_id', 'case_endpoint', 'group_uuid')
+# columns that merge by adding, and the ones that merge by taking the larger value
+SUM_STATS = ('rows', 'count', 'sum', 'sum_sq', 'status_count', 'status_sum')
+MAX_STATS = ('max',)
+
+
+def partial_stats(df, key, value_col='case_duration'):
+    """
+    Statistics of one batch of rows grouped by key, in a form that merges with other batches.
+
+    Return:
+    Dataframe indexed by key with columns rows, count/sum/sum_sq/max of value_col (missing values skipped),
+    status_count/status_sum of numeric_status
+    """
+    values = df[value_col].astype(np.float64)
+    status = df.numeric_status.astype(np.float64)
+    parts = pd.DataFrame({
+        'rows': 1,
+        'count': values.notna(),
+        'sum': values.fillna(0),
+        'sum_sq': values.fillna(0) ** 2,
+        'max': values,
+        'status_count': status.notna(),
+        'status_sum': status.fillna(0),
+    }, index=df.index)
+    grouped = parts.groupby(df[key].to_numpy(dtype=object), sort=False)
+    stats = grouped.sum()
+    stats['max'] = grouped['max'].max()
+    stats.index.name = key
+    return stats
+
+
+def merge_stats(left, right):
+    """merge two partial_stats frames of the same key"""
+    if left.empty:
+        return right
+    if right.empty:
+        return left
+    combined = pd.concat([left, right]).groupby(level=0)
+    merged = combined[list(SUM_STATS)].sum()
+    merged['max'] = combined['max'].max()
+    return merged
+
+
+class _StoredColumn:
+    """
+    stands in for a column of a pandas groupby, answering from the stored statistics. results are named after the
+    column, like the ones of a groupby column
+    """
+    def __init__(self, stats, column):
+        self._stats = stats
+        self._column = column
+
+    def _count_sum(self):
+        if self._column == 'numeric_status':
+            return self._stats.status_count, self._stats.status_sum
+        return self._stats['count'], self._stats['sum']
+
+    def _not_kept(self, operation):
+        if self._column == 'numeric_status':
+            raise AttributeError('only the count, sum and mean of numeric_status are kept, not the {}'.format(
+                operation))
+
+    def count(self):
+        return self._count_sum()[0].rename(self._column)
+
+    def sum(self):
+        return self._count_sum()[1].rename(self._column)
+
+    def mean(self):
+        count, total = self._count_sum()
+        return (total / count.where(count > 0)).rename(self._column)
+
+    def std(self):
+        self._not_kept('std')
+        count = self._stats['count']
+        var = (self._stats.sum_sq - self._stats['sum'] ** 2 / count.where(count > 0)) / (count - 1).where(count > 1)
+        return np.sqrt(var.clip(lower=0)).rename(self._column)
+
+    def max(self):
+        self._not_kept('max')
+        return self._stats['max'].rename(self._column)
+
+
+class _StoredGroupBy:
+    """stands in for df.groupby(key), so functions written against a groupby can read from an AggregateStore"""
+    def __init__(self, stats, value_col):
+        self._stats = stats
+        self._value_col = value_col
+
+    def __getattr__(self, column):
+        if column not in ('numeric_status', self._value_col):
+            raise AttributeError('{} is not kept in the aggregate store'.format(column))
+        return _StoredColumn(self._stats, column)
+
+    def __getitem__(self, column):
+        return self.__getattr__(column)
+
+    def size(self):
+        return self._stats.rows
+
+
+class AggregateStore:
+    """Per key running count, sum, sum of squares and max of case_duration, and numeric_status sums.
+
+    update() with each batch of new rows costs a groupby of the batch plus a merge over the groups, not a pass
+    over the history. groupby(key) gives back an object that answers .numeric_status.mean(),
+    .case_duration.mean()/std()/max()/count() like a pandas groupby would, indexed and sorted by key.
+    """
+    def __init__(self, keys=AGGREGATE_KEYS, value_col='case_duration'):
+        self.keys = tuple(keys)
+        self.value_col = value_col
+        self.tables = {key: pd.DataFrame(columns=list(SUM_STATS + MAX_STATS), dtype=np.float64) for key in keys}
+
+    @classmethod
+    def from_frame(cls, df, keys=AGGREGATE_KEYS, value_col='case_duration'):
+        store = cls([key for key in keys if key in df.columns], value_col)
+        store.update(df)
+        return store
+
+    def has(self, key):
+        return key in self.tables
+
+    def update(self, df):
+        """fold a batch of rows (with numeric_status) into the stored statistics"""
+        if df.empty:
+            return
+        for key in self.keys:
+            self.tables[key] = merge_stats(self.tables[key], partial_stats(df, key, self.value_col))
+
+    def merge(self, other):
+        """fold another store's statistics into this one (for stores built from separate chunks)"""
+        for key in self.keys:
+            self.tables[key] = merge_stats(self.tables[key], other.tables[key])
+
+    def groupby(self, key):
+        return _StoredGroupBy(self.tables[key].sort_index(), self.value_col)
+
+    def worst(self, key, count):
+        """the count keys with the lowest mean numeric_status"""
+        return self.groupby(key).numeric_status.mean().sort_values()[:count]
@@ -0,0 +1,185 @@
+"""
+This is the buffer module of expd_analytics.
+Append-only column storage, so new rows can be added to a big dataframe without copying the whole thing.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+# capacity is always reserved in whole chunks of rows
+CHUNK_ROWS = 65536
+GROWTH = 1.5
+
+
+def _round_up(rows):
+    return max(CHUNK_ROWS, -(-rows // CHUNK_ROWS) * CHUNK_ROWS)
+
+
+def _codes_dtype(n_categories):
+    """smallest int type that holds codes for n_categories, the same one pandas picks, so views need no recast"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _fill_value(dtype):
+    """what rows that don't have a value for a column get filled with"""
+    if dtype.kind == 'f':
+        return np.nan
+    if dtype.kind in 'mM':
+        return np.datetime64('NaT')
+    if dtype.kind == 'O':
+        return None
+    return 0
+
+
+class ColumnBuffer:
+    """One numpy array per column with room reserved at the end, a bit like a list's over-allocation.
+
+    Appending writes the new rows into the reserved tail, so it costs time proportional to the new rows, and the
+    arrays only get reallocated (by GROWTH, rounded to CHUNK_ROWS) when the reserve runs out. frame() hands out a
+    DataFrame over views of the filled part of the arrays, nothing gets copied.
+
+    Category columns are stored as their codes plus the list of categories. Values that aren't categories yet get
+    added at the end of the list, so codes already stored never change.
+    """
+    def __init__(self):
+        self._columns = {}
+        self._categories = {}
+        self.size = 0
+        self.capacity = 0
+        self._frame = None
+
+    @classmethod
+    def from_frame(cls, df, capacity=None):
+        buffer = cls()
+        buffer.reserve(max(capacity or 0, len(df)))
+        buffer.append(df)
+        return buffer
+
+    @classmethod
+    def from_frames(cls, frames):
+        """build a buffer sized for all of frames at once. frames is emptied as each one is copied in, so every
+        frame can be freed as soon as it is in the buffer"""
+        buffer = cls()
+        buffer.reserve(sum(len(frame) for frame in frames))
+        if any(len(frame) for frame in frames):
+            # empty partitions tend to have every column typed object, skip them so they don't set the dtypes
+            frames[:] = [frame for frame in frames if len(frame)]
+        while frames:
+            buffer.append(frames.pop(0))
+        return buffer
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, rows):
+        """make sure there is room for at least rows rows without another reallocation"""
+        if rows <= self.capacity:
+            return
+        self.capacity = _round_up(rows)
+        for name, array in self._columns.items():
+            self._columns[name] = self._grow(array, array.dtype)
+
+    def _grow(self, array, dtype):
+        grown = np.empty(self.capacity, dtype=dtype)
+        grown[:self.size] = array[:self.size]
+        return grown
+
+    def _new_column(self, dtype):
+        column = np.empty(self.capacity, dtype=dtype)
+        column[:self.size] = _fill_value(dtype)
+        return column
+
+    def _ensure_dtype(self, name, values):
+        """upcast a stored column if the incoming values don't fit in it (int column getting NaNs etc.).
+        a narrower float column (compact frames) keeps its type, an int column only if the values are in range"""
+        array = self._columns[name]
+        if array.dtype.kind in 'iu' and values.dtype.kind in 'iu':
+            limits = np.iinfo(array.dtype)
+            if not len(values) or (limits.min <= values.min() and values.max() <= limits.max):
+                return
+        elif np.can_cast(values.dtype, array.dtype, casting='same_kind'):
+            return
+        self._columns[name] = self._grow(array, np.result_type(array.dtype, values.dtype))
+
+    def _category_codes(self, name, series):
+        """codes of series against the stored categories of column name, adding any categories it brings"""
+        categories = self._categories[name]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            incoming = series.cat.categories
+        else:
+            incoming = pd.Index(series.dropna().unique())
+        new_categories = incoming.difference(categories, sort=False)
+        if len(new_categories):
+            categories = categories.append(new_categories)
+            self._categories[name] = categories
+            codes_dtype = _codes_dtype(len(categories))
+            if codes_dtype.itemsize > self._columns[name].dtype.itemsize:
+                self._columns[name] = self._grow(self._columns[name], codes_dtype)
+        return pd.Categorical(series, categories=categories).codes
+
+    def append(self, df):
+        """append the rows of df. columns only in df are added (earlier rows get filled), missing ones get filled"""
+        rows = len(df)
+        if not rows and self._columns:
+            # an empty result often comes back with every column as object, don't let it upcast anything
+            return
+        end = self.size + rows
+        if end > self.capacity:
+            self.reserve(max(end, int(self.capacity * GROWTH)))
+        for name in df.columns:
+            if name not in self._columns and isinstance(df[name].dtype, pd.CategoricalDtype):
+                self._categories[name] = df[name].cat.categories[:0]
+                self._columns[name] = np.full(self.capacity, -1, dtype=_codes_dtype(0))
+            if name in self._categories:
+                values = self._category_codes(name, df[name])
+            else:
+                values = df[name].to_numpy()
+            if name not in self._columns:
+                self._columns[name] = self._new_column(values.dtype)
+            elif name not in self._categories:
+                self._ensure_dtype(name, values)
+            self._columns[name][self.size:end] = values
+        for name, array in self._columns.items():
+            if name not in df.columns:
+                array[self.size:end] = -1 if name in self._categories else _fill_value(array.dtype)
+        self.size = end
+        self._frame = None
+
+    def assign(self, df):
+        """set whole columns from df, which has to have one row per row already in the buffer"""
+        if not self._columns:
+            self.size = len(df)
+            self.reserve(self.size)
+        if len(df) != self.size:
+            raise ValueError('assigned columns have {} rows, buffer has {}'.format(len(df), self.size))
+        for name in df.columns:
+            if isinstance(df[name].dtype, pd.CategoricalDtype):
+                self._categories[name] = df[name].cat.categories
+                values = df[name].cat.codes.to_numpy()
+            else:
+                self._categories.pop(name, None)
+                values = df[name].to_numpy()
+            self._columns[name] = np.empty(self.capacity, dtype=values.dtype)
+            self._columns[name][:self.size] = values
+        self._frame = None
+
+    def frame(self):
+        """DataFrame over views of the filled rows. Columns added to it directly are NOT kept by the buffer."""
+        if self._frame is None:
+            self._frame = pd.DataFrame({name: self._column_view(name) for name in self._columns}, copy=False)
+        return self._frame
+
+    def _column_view(self, name):
+        view = self._columns[name][:self.size]
+        if name in self._categories:
+            categorical = pd.Categorical.from_codes(view, dtype=pd.CategoricalDtype(self._categories[name]))
+            return pd.Series(categorical, copy=False)
+        return pd.Series(view, dtype=view.dtype, copy=False)
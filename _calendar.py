@@ -0,0 +1,118 @@
+"""
+This is the calendar module of expd_analytics.
+A sorted index over a timestamp column, so date windows (today, this month, any range) are found with a binary
+search instead of looking at every row.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+import _buffer
+
+NAT = np.iinfo(np.int64).min
+
+
+def _as_ns(timestamps):
+    """int64 nanoseconds of a datetime series/array, NaT becomes NAT (sorts before everything)"""
+    return np.asarray(pd.Series(timestamps).astype('datetime64[ns]')).view(np.int64)
+
+
+def window_bounds(period, when=None):
+    """
+    Return the (start, end) timestamps of the day, month or year that when falls in. end is exclusive.
+
+    Keyword arguments:
+    period -- 'day', 'month' or 'year'
+    when -- any timestamp inside the window (default now)
+    """
+    when = pd.Timestamp(when if when is not None else pd.Timestamp.now())
+    if period == 'day':
+        start = when.normalize()
+        return start, start + pd.Timedelta(days=1)
+    if period == 'month':
+        start = pd.Timestamp(year=when.year, month=when.month, day=1)
+        return start, start + pd.offsets.MonthBegin(1)
+    if period == 'year':
+        start = pd.Timestamp(year=when.year, month=1, day=1)
+        return start, pd.Timestamp(year=when.year + 1, month=1, day=1)
+    raise ValueError('period has to be day, month or year, not {}'.format(period))
+
+
+class CalendarIndex:
+    """Row positions of a timestamp column, sorted by timestamp.
+
+    A window lookup is two binary searches plus the rows in the window. Appending timestamps that are no older
+    than the ones already indexed (the normal refresh) just extends the sorted arrays, older ones force a re-sort.
+    """
+    def __init__(self, timestamps=()):
+        values = _as_ns(timestamps)
+        order = np.argsort(values, kind='stable')
+        self._order_buffer = order
+        self._sorted_buffer = values[order]
+        self.size = len(values)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def _order(self):
+        return self._order_buffer[:self.size]
+
+    @property
+    def _sorted(self):
+        return self._sorted_buffer[:self.size]
+
+    def _reserve(self, rows):
+        """over-allocate like _buffer.ColumnBuffer, so in order appends cost time proportional to the new rows"""
+        if rows <= len(self._order_buffer):
+            return
+        capacity = max(rows, int(len(self._order_buffer) * _buffer.GROWTH), _buffer.CHUNK_ROWS)
+        for name in ('_order_buffer', '_sorted_buffer'):
+            grown = np.empty(capacity, dtype=np.int64)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+
+    def extend(self, timestamps):
+        """index rows appended after the ones already indexed"""
+        values = _as_ns(timestamps)
+        if not len(values):
+            return
+        new_order = np.argsort(values, kind='stable')
+        new_sorted = values[new_order]
+        new_order = new_order + self.size
+        end = self.size + len(values)
+        if not self.size or new_sorted[0] >= self._sorted[-1]:
+            self._reserve(end)
+            self._order_buffer[self.size:end] = new_order
+            self._sorted_buffer[self.size:end] = new_sorted
+        else:
+            merged = np.concatenate([self._sorted, new_sorted])
+            resort = np.argsort(merged, kind='stable')
+            self._order_buffer = np.concatenate([self._order, new_order])[resort]
+            self._sorted_buffer = merged[resort]
+        self.size = end
+
+    def positions(self, start=None, end=None):
+        """sorted row positions with start <= timestamp < end. either end can be None for open ended"""
+        if start is None:
+            # NaT sorts first but is in no window
+            low = np.searchsorted(self._sorted, NAT, side='right')
+        else:
+            low = np.searchsorted(self._sorted, pd.Timestamp(start).value, side='left')
+        high = self.size if end is None else np.searchsorted(self._sorted, pd.Timestamp(end).value, side='left')
+        return np.sort(self._order[low:high])
+
+    def mask(self, start=None, end=None):
+        """boolean array over all rows, True where start <= timestamp < end"""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.positions(start, end)] = True
+        return mask
+
+    def period_positions(self, period, when=None):
+        """sorted row positions in the day, month or year that when falls in (default now)"""
+        return self.positions(*window_bounds(period, when))
+
+    def period_mask(self, period, when=None):
+        """boolean array over all rows, True in the day, month or year that when falls in (default now)"""
+        return self.mask(*window_bounds(period, when))
@@ -0,0 +1,33 @@
+"""
+This is the client module of expd_analytics.
+Talks to a running worker (see _worker) over its Unix socket: one json object per line each way, one request per
+connection. Standard library only, so the client commands start in milliseconds.
+"""
+
+
+import json
+import os
+import socket
+
+
+def default_socket_path():
+    """$EXPD_WORKER_SOCKET, or ~/pynet-data/worker.sock"""
+    return os.environ.get('EXPD_WORKER_SOCKET') or os.path.join(os.path.expanduser('~'), 'pynet-data', 'worker.sock')
+
+
+def request(command, socket_path=None, timeout=None, **params):
+    """
+    Send one request to the worker at socket_path (default default_socket_path()) and return its response map,
+    {'ok': True, 'result': ..., 'seconds': ...} or {'ok': False, 'error': ..., 'seconds': ...}.
+    raises OSError if no worker is listening. A worker that hangs up without answering (it is going down) gives
+    {'ok': False, 'error': ...} too.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(socket_path or default_socket_path())
+        connection.sendall(json.dumps(dict(params, command=command)).encode() + b'\n')
+        with connection.makefile('rb') as reader:
+            line = reader.readline()
+    if not line:
+        return {'ok': False, 'error': 'the worker closed the connection without answering {}'.format(command)}
+    return json.loads(line)
@@ -6,13 +6,22 @@ Functions for modifying pandas dataframes/useful things for Expeditors analytics
 __author__ = 'Jessi Shank <jessica.shank@expeditors.com>'
 
 
+import re
 import socket
 from datetime import datetime
 
 import numpy as np
+import pandas as pd
+
+import _calendar
+import _instrument
+import _resolver
 
 REGEX_PATTERN_GCI = r'[A-Z]\w{5,7}'
 REGEX_PATTERN_DB_ID = r'[0-9]{15}'
+STATUS_CODES = {"passed": 1, "failed": 0, "running": 3, "skipped": 2}
+# string columns of test_result that only take a handful of distinct values
+COMPACT_CATEGORY_COLS = ('case_status', 'case_action', 'case_endpoint', 'case_service_name', 'case_id', 'group_uuid')
 
 
 def get_failed_mask(dataframe):
@@ -20,43 +29,110 @@ def get_failed_mask(dataframe):
     return (dataframe.case_status == 'failed') | ( dataframe.case_status == 'skipped')
 
 
+@_instrument.instrumented()
+def numeric_status_frame(dataframe, dummies=True):
+    """return numeric_status (from STATUS_CODES) plus one dummy column per status for the rows of dataframe.
+    The dummy columns are always the same four, so frames built from different batches line up.
+
+    Keyword arguments:
+    dataframe -- pandas dataframe with a case_status column
+    dummies -- include the dummy columns (default True). Without them numeric_status is the smallest int type
+        that fits, which is all a compact frame keeps.
+    """
+    status = pd.Categorical(dataframe.case_status, categories=list(STATUS_CODES))
+    codes = np.array(list(STATUS_CODES.values()))[status.codes]
+    if (status.codes == -1).any():
+        codes = np.where(status.codes == -1, np.nan, codes)
+    numeric = pd.DataFrame({'numeric_status': codes}, index=dataframe.index)
+    if not dummies:
+        return numeric.apply(pd.to_numeric, downcast='integer')
+    status_dummies = pd.get_dummies(status)
+    status_dummies.index = dataframe.index
+    status_dummies.columns = list(STATUS_CODES)
+    return pd.concat([numeric, status_dummies], axis=1)
+
+
+@_instrument.instrumented()
+def compact_frame(dataframe, category_cols=COMPACT_CATEGORY_COLS):
+    """
+    Return a copy of dataframe that takes less memory: the repeated string columns become categories and the
+    numeric columns are downcast to the smallest type that holds their values.
+
+    Keyword arguments:
+    dataframe -- pandas dataframe
+    category_cols -- columns to turn into categories (default COMPACT_CATEGORY_COLS)
+    """
+    compact = {}
+    for name in dataframe.columns:
+        column = dataframe[name]
+        if name in category_cols:
+            column = column.astype('category')
+        elif column.dtype.kind == 'f':
+            column = pd.to_numeric(column, downcast='float')
+        elif column.dtype.kind in 'iu':
+            column = pd.to_numeric(column, downcast='integer')
+        compact[name] = column
+    return pd.DataFrame(compact, index=dataframe.index)
+
+
+def memory_per_row(dataframe):
+    """bytes of memory used per row of dataframe, counting the contents of string columns"""
+    if not len(dataframe):
+        return 0.
+    return dataframe.memory_usage(deep=True, index=False).sum() / len(dataframe)
+
+
+def date_integer(series):
+    """integer nanoseconds since epoch of a datetime series"""
+    return series.astype('datetime64[ns]').astype(np.int64)
+
+
 def this_month(df, time_col):
-    return df[time_col].map(lambda x: x.month) == datetime.now().month
+    """mask of df where time_col is in the current month of the current year, the window PynetData.this_month uses"""
+    start, end = _calendar.window_bounds('month')
+    return (df[time_col] >= start) & (df[time_col] < end)
 
 
 def this_year(df, time_col):
-    return df[time_col].map(lambda x: x.year) == datetime.now().year
+    return df[time_col].dt.year == datetime.now().year
 
 
 def today(df, time_col):
-    today = datetime.now()
-    return df[time_col].map(lambda x: x.day + x.month + x.year) == today.day + today.month + today.year
+    """mask of df where time_col is on the current date"""
+    start = pd.Timestamp(datetime.now().date())
+    return (df[time_col] >= start) & (df[time_col] < start + pd.Timedelta(days=1))
 
 
 def any_day(df, time_col, day):
-    return df[time_col].map(lambda x: x.day) == day
+    return df[time_col].dt.day == day
 
 
 def any_month(df, time_col, month):
-    return df[time_col].map(lambda x: x.month) == month
+    return df[time_col].dt.month == month
 
 
 def any_year(df, time_col, year):
-    return df[time_col].map(lambda x: x.year) == year
+    return df[time_col].dt.year == year
 
 
-def return_in_norm_df(df, col, sigma):
-    """given a column of a dataframe, return a mask that is within sigma standard deviations of the mean."""
-    return np.abs(df[col] - df[col].mean()) <= (sigma*df[col].std())
+def return_in_norm_df(df, col, sigma, stats=None):
+    """given a column of a dataframe, return a mask that is within sigma standard deviations of the mean.
+    if _stats.ColumnStats kept for the column are given as stats, the mean/std come from them instead of a pass
+    over the column"""
+    return return_in_norm_series(df[col], sigma, stats)
 
 
-def return_in_norm_series(series, sigma):
-    """return a mask for pandas series that is within sigma standard deviations of the mean."""
+def return_in_norm_series(series, sigma, stats=None):
+    """return a mask for pandas series that is within sigma standard deviations of the mean (of stats if given)."""
+    if stats is not None:
+        return np.abs(series - stats.mean) <= (sigma*stats.std)
     return np.abs(series - series.mean()) <= (sigma*series.std())
 
 
-def normalize_series(series):
-    """normalize a pandas series to 1"""
+def normalize_series(series, stats=None):
+    """normalize a pandas series to 1 (by the mean/min/max of _stats.ColumnStats if given as stats)"""
+    if stats is not None:
+        return (series - stats.mean) / (stats.max - stats.min)
     return (series - series.mean()) / (series.max() - series.min())
 
 
@@ -81,39 +157,75 @@ def return_guuid_latest(result_df):
     return latest_run.group_uuid.values[0]
 
 
-def get_hostname(ip):
-    """get resolved host name by IP address"""
-    hostname, aliases, ipaddresses = socket.gethostbyaddr(ip)
+def get_hostname(ip, resolver=None):
+    """get resolved host name by IP address, through the cache of resolver (default _resolver.default_resolver()).
+    raises socket.herror if it has none"""
+    hostname = (resolver or _resolver.default_resolver()).resolve(ip)
+    if hostname is None:
+        raise socket.herror('no host name for {}'.format(ip))
     return hostname
 
 
-def create_mean_col_from_unique_vals(dataframe, mean_col, unique_col, include=None):
+def add_hostname_column(dataframe, resolver=None, timeout=None):
+    """dataframe with a hostname column of the case_endpoint IPs resolved, see _resolver.HostnameResolver"""
+    return (resolver or _resolver.default_resolver()).add_hostname_column(dataframe, timeout=timeout)
+
+
+def group_stats(dataframe, key, mean_col, first_cols=()):
+    """
+    Group dataframe by key with a single hash pass (pd.factorize), no masking per unique value.
+
+    Keyword arguments:
+    dataframe -- pandas dataframe
+    key -- column to group by. missing values count as a group of their own
+    mean_col -- column to take the mean of in each group, missing values are skipped
+    first_cols -- columns to take the value of each group's first row of (default none)
+
+    Return:
+    Dataframe indexed by the key values in order of first appearance, with a mean_col column and first_cols columns
+    """
+    codes, uniques = pd.factorize(dataframe[key], use_na_sentinel=False)
+    n_groups = len(uniques)
+    values = dataframe[mean_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = ~np.isnan(values)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=n_groups)
+    counts = np.bincount(codes[valid], minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    stats = pd.DataFrame({mean_col: means}, index=pd.Index(uniques, name=key))
+    if first_cols:
+        # factorize numbers groups in order of first appearance, so a group starts wherever the code is a new max
+        starts = np.ones(len(codes), dtype=bool)
+        starts[1:] = codes[1:] > np.maximum.accumulate(codes)[:-1]
+        first_rows = dataframe.iloc[np.flatnonzero(starts)]
+        for col in first_cols:
+            stats[col] = first_rows[col].to_numpy()
+    return stats
+
+
+@_instrument.instrumented()
+def create_mean_col_from_unique_vals(dataframe, mean_col, unique_col, include=None, as_frame=False):
     """Return a small dataframe from a different one when you want to generate a number from the average of each unique
     value in a different column
 
     Keyword arguments:
     Dataframe -- pandas dataframe
     mean_col -- column you want to get mean value of (str)
-    unique col -- column name that has repeating values. function will mask the dataframe on unique values of
-        column, then save the mean of each of those masks (str)
+    unique col -- column name that has repeating values. function will group the dataframe on unique values of
+        column, then save the mean of each of those groups (str)
     include -- column to include along with mean and unique values, if those values are unique as well (default None)
+    as_frame -- return the group_stats dataframe instead of a dictionary (default False)
 
     Return:
     dictionary of unique values and the mean of mean_col's values
     """
-    mean_col_by_unique_col = {mean_col: [], unique_col: [], 'index': []}
-    ind = 0
+    stats = group_stats(dataframe, unique_col, mean_col, [include] if include else [])
+    if as_frame:
+        return stats
+    mean_col_by_unique_col = {mean_col: list(stats[mean_col]), unique_col: list(stats.index),
+                              'index': list(range(len(stats)))}
     if include:
-        mean_col_by_unique_col[include] = []
-    for unique_val in dataframe[unique_col].unique():
-        if include:
-            included_value = dataframe[include][dataframe[unique_col] == unique_val].unique()[0]
-            mean_col_by_unique_col[include].append(included_value)
-        mean_col_by_unique_col[unique_col].append(unique_val)
-        mean_val = dataframe[mean_col][dataframe[unique_col] == unique_val].mean()
-        mean_col_by_unique_col[mean_col].append(mean_val)
-        mean_col_by_unique_col['index'].append(ind)
-        ind += 1
+        mean_col_by_unique_col[include] = list(stats[include])
     return mean_col_by_unique_col
 
 
@@ -123,17 +235,50 @@ def return_norm_number_vs_string(dataframe, number_col, sigma):
     return normed_df
 
 
-def endpoint_v_duration(dataframe, endpoint):
-    # time series analysis of server -- mean of each test run over time.
-    server_specific_dframe = dataframe[dataframe.case_endpoint.str.contains(endpoint)]
-    guids = server_specific_dframe.group_uuid.unique()
-    mean_duration = []
-    timestamp = []
-    for uid in guids:
-        uid_df = dataframe[dataframe.group_uuid == uid]
-        mean_duration.append(uid_df.case_duration.mean())
-        timestamp.append(uid_df.iloc[0].case_timestamp)
-    return mean_duration, timestamp
+@_instrument.instrumented()
+def endpoint_v_duration(dataframe, endpoint, as_frame=False, exact=False):
+    """
+    Time series analysis of server -- mean duration of each test run that hit endpoint, over time.
+
+    Keyword arguments:
+    dataframe -- pandas dataframe
+    endpoint -- pattern matched against case_endpoint
+    as_frame -- return a dataframe of case_duration and case_timestamp by group_uuid instead (default False)
+    exact -- only runs whose case_endpoint is endpoint, not a regex match of it (default False)
+
+    Return:
+    Tuple of (list of mean run durations, list of the timestamp of each run's first row)
+    """
+    if exact:
+        hits = dataframe.case_endpoint == endpoint
+    else:
+        hits = dataframe.case_endpoint.str.contains(endpoint)
+    guids = dataframe.group_uuid[hits].unique()
+    # runs are averaged over all their rows, not just the ones on endpoint
+    run_rows = dataframe[dataframe.group_uuid.isin(guids)]
+    runs = group_stats(run_rows, 'group_uuid', 'case_duration', ['case_timestamp']).loc[guids]
+    if as_frame:
+        return runs
+    return list(runs.case_duration), list(runs.case_timestamp)
+
+
+@_instrument.instrumented()
+def endpoints_v_duration(dataframe, endpoints=None, as_frame=False):
+    """
+    endpoint_v_duration for every endpoint, matched exactly.
+
+    Keyword arguments:
+    dataframe -- pandas dataframe
+    endpoints -- endpoints to run (default every distinct case_endpoint)
+    as_frame -- see endpoint_v_duration (default False)
+
+    Return:
+    dictionary of endpoint : endpoint_v_duration result, in sorted endpoint order
+    """
+    if endpoints is None:
+        endpoints = dataframe.case_endpoint.dropna().unique()
+    # endpoints are names, not patterns: 10.0.0.1 isn't 10.0.0.11
+    return {endpoint: endpoint_v_duration(dataframe, endpoint, as_frame, exact=True) for endpoint in sorted(endpoints)}
 
 
 def return_specific_case_over_time(df, case):
@@ -141,29 +286,90 @@ def return_specific_case_over_time(df, case):
     return duration_over_time
 
 
-def return_longest_case_over_time(df, aggregation):
+@_instrument.instrumented()
+def return_longest_case_over_time(df, aggregation, store=None):
     """Find the case id with the largest mean duration, then return a dataframe of that case for analysis
 
     Keyword Arguments:
     df -- pandas Dataframe to find longest mean case duration of
     aggregation -- dictionary to aggregate the groupby frame
+    store -- _aggregate.AggregateStore kept for df, to read the mean durations from instead of grouping df
+        (default None). aggregation isn't used then.
 
     Return:
     Dataframe of highest mean case run time
     """
+    if store is not None and store.has('case_id'):
+        mean_duration = store.groupby('case_id').case_duration.mean().dropna()
+        return return_specific_case_over_time(df, mean_duration.idxmax())
     # finds the case id with the largest mean duration, then returns a dataframe  of just that case
     # agg dict should maybe be pulled out
-    groupby_id = df.groupby('case_id')
-    mean_duration_df = groupby_id.agg(aggregation).dropna()
-    max_duration = mean_duration_df[(mean_duration_df.case_duration.mean_duration ==
-                                                   mean_duration_df.case_duration.mean_duration.max())]
-    max_duration_over_time = return_specific_case_over_time(df, max_duration.index.values[0])
+    groupby_id = df.groupby('case_id', observed=True)
+    max_duration_over_time = return_specific_case_over_time(df, longest_case_id(groupby_id.agg(aggregation)))
     return max_duration_over_time
 
 
+def longest_case_id(aggregated_df):
+    """case id with the largest case_duration.mean_duration in df.groupby('case_id').agg(aggregation)"""
+    mean_duration_df = aggregated_df.dropna()
+    max_duration = mean_duration_df[(mean_duration_df.case_duration.mean_duration ==
+                                     mean_duration_df.case_duration.mean_duration.max())]
+    return max_duration.index.values[0]
+
+
+class RegexPruner:
+    """All the patterns of a prune compiled into one alternation, with the verdict remembered per distinct value.
+
+    Only the distinct values of a column get matched (the categories of a categorical column, the factorized
+    uniques of anything else), and a value that has been matched once is never run through the regex again, so
+    pruning each refresh batch only costs regex time for case actions that haven't been seen before.
+    """
+    # forget the verdicts once there are this many, so unique ids in case actions can't grow it forever
+    max_cached = 1000000
+
+    def __init__(self, regex_list):
+        self.regex = re.compile('|'.join('(?:{})'.format(pattern) for pattern in regex_list))
+        self._verdicts = {}
+
+    def _verdicts_for(self, values):
+        if len(self._verdicts) > self.max_cached:
+            self._verdicts = {}
+        verdicts = self._verdicts
+        result = np.empty(len(values), dtype=bool)
+        for i, value in enumerate(values):
+            verdict = verdicts.get(value)
+            if verdict is None:
+                verdict = isinstance(value, str) and self.regex.search(value) is not None
+                verdicts[value] = verdict
+            result[i] = verdict
+        return result
+
+    def matches(self, series):
+        """boolean array, True where a value of series matches any of the patterns. missing values don't match"""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            codes, uniques = pd.factorize(series)
+        verdicts = self._verdicts_for(uniques)
+        return (codes >= 0) & verdicts[codes] if len(verdicts) else np.zeros(len(series), dtype=bool)
+
+
+_pruners = {}
+
+
+def get_pruner(regex_list):
+    """the shared RegexPruner for regex_list, so every prune with the same patterns shares its verdicts"""
+    key = tuple(regex_list)
+    if key not in _pruners:
+        _pruners[key] = RegexPruner(regex_list)
+    return _pruners[key]
+
+
+@_instrument.instrumented()
 def prune(df, regex_list):
     """
-    Remove items from dataframe based on a regex pattern in the case action
+    Remove items from dataframe based on a regex pattern in the case action.
+    The patterns are matched in one pass, once per distinct case action (see RegexPruner).
 
     Keyword Arguments:
     df -- pandas Dataframe to prune
@@ -172,33 +378,68 @@ def prune(df, regex_list):
     Return:
     Pruned dataframe
     """
-    for regex_pattern in regex_list:
-        df = df[~df.case_action.str.contains(regex_pattern)]
-    return df
+    if not regex_list:
+        return df
+    return df[~get_pruner(regex_list).matches(df.case_action)]
 
 
-def remove_totally_failed_tests(df):
+@_instrument.instrumented()
+def remove_totally_failed_tests(df, passing_runs=None, failed_runs=None, fetch_runs=None):
     """Remove all test runs that completely failed, as they are likely garbage.
-    This takes a while, should only be run on initialization of the dataframe/when appending new dataframes"""
-    all_runs = df.group_uuid.unique()
-    removed_guuids = []
-    for test_run in all_runs:
-        overall_status = df[(df.group_uuid == test_run) & ~get_failed_mask(df)]
-        if not len(overall_status):
-            df = df[df.group_uuid != test_run]
-            removed_guuids.append(test_run)
-    return df, removed_guuids
+    Every run is evaluated in one pass: the runs that have at least one case that didn't fail/skip are collected
+    once, and the frame is masked once against them.
+
+    Keyword arguments:
+    df -- pandas Dataframe of test results
+    passing_runs -- set of group_uuids already known to have a passing case (default None). Incremental mode:
+        runs in the set are kept without being re-evaluated, so only the runs that show up in df for the first
+        time are checked. The set is updated in place with the passing runs found in df.
+    failed_runs -- set of group_uuids removed so far for having no passing case (default None), updated in place.
+        A run of a batch can still be going: when one of these gets a passing case in df, its rows that were
+        removed with earlier batches belong in the result again
+    fetch_runs -- function of a list of group_uuids returning their rows from before df (the earlier batches),
+        to bring back the runs that leave failed_runs. they are put in front of df's rows
+
+    Return:
+    Tuple of (filtered dataframe, list of removed group_uuids)
+    """
+    keep_runs = df.group_uuid[~get_failed_mask(df)].unique()
+    if passing_runs is not None:
+        passing_runs.update(keep_runs)
+        keep_runs = [run for run in df.group_uuid.unique() if run in passing_runs]
+    keep = df.group_uuid.isin(keep_runs)
+    removed_guuids = list(df.group_uuid[~keep].unique())
+    kept = df[keep]
+    if failed_runs is not None:
+        revived = failed_runs.intersection(keep_runs)
+        failed_runs.difference_update(revived)
+        failed_runs.update(removed_guuids)
+        if revived and fetch_runs is not None:
+            kept = pd.concat([fetch_runs(sorted(revived)), kept], ignore_index=True)
+    return kept, removed_guuids
 
 
 def highest_failures_by_groupby_count(groupby_df, count):
+    """the count groups with the lowest mean numeric_status. groupby_df can be a pandas groupby or
+    AggregateStore.groupby(key)"""
     mean_status = groupby_df.numeric_status.mean()
     worst = mean_status.sort_values()[:count]
     return worst
 
 
-def highest_failures_by_df_stdev(df, groupby_key, sigma=0):
-    groupby_df = df.groupby(groupby_key)
-    vals = groupby_df.numeric_status.mean()
+@_instrument.instrumented()
+def highest_failures_by_df_stdev(df, groupby_key, sigma=0, store=None):
+    """groups whose mean numeric_status is more than sigma standard deviations off, that aren't all passing/failing.
+    if an _aggregate.AggregateStore for df is given as store, the group means are read from it"""
+    if store is not None and store.has(groupby_key):
+        groupby_df = store.groupby(groupby_key)
+    else:
+        groupby_df = df.groupby(groupby_key, observed=True)
+    return failures_outside_norm(groupby_df.numeric_status.mean(), sigma)
+
+
+def failures_outside_norm(vals, sigma):
+    """the group mean numeric_status values of vals more than sigma standard deviations off, that aren't 0 or 1"""
     normed_vals = vals[~return_in_norm_series(vals, sigma)]
     not_pass_fail_100 = normed_vals[(normed_vals <= 0.95) & (normed_vals != 0)]
     return not_pass_fail_100
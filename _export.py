@@ -0,0 +1,125 @@
+"""
+This is the export module of expd_analytics.
+Write result frames for downstream readers (the luigi pipeline etc.) as csv, parquet, feather or arrow files.
+Files are written whole then renamed into place, and a result that hasn't changed isn't written again.
+"""
+
+
+import datetime
+import hashlib
+import os
+
+import pandas as pd
+
+import helper
+
+# format name : file extension
+FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather', 'arrow': '.arrow'}
+BINARY_FORMATS = ('parquet', 'feather', 'arrow')
+
+
+def available_formats():
+    """formats that can be written here, the binary ones need pyarrow (pandas imports it when writing them)"""
+    return [fmt for fmt in FORMATS if fmt not in BINARY_FORMATS or helper.has_module('pyarrow')]
+
+
+def content_hash(df):
+    """sha1 of the values, index, column names and dtypes of df"""
+    digest = hashlib.sha1()
+    digest.update(repr([(str(name), str(dtype)) for name, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _as_frame(result):
+    if isinstance(result, pd.Series):
+        return result.to_frame(name=result.name if result.name is not None else 'value')
+    return result
+
+
+def _write(df, path, fmt):
+    if fmt == 'csv':
+        df.to_csv(path)
+        return
+    if not helper.has_module('pyarrow'):
+        raise ImportError('writing {} needs pyarrow'.format(fmt))
+    # the binary formats keep columns only, so a meaningful index becomes columns
+    if not isinstance(df.index, pd.RangeIndex):
+        df = df.reset_index()
+    df = df.rename(columns=str)
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    elif fmt == 'feather':
+        df.to_feather(path)
+    else:
+        # uncompressed arrow ipc file, readers can memory map it
+        df.to_feather(path, compression='uncompressed')
+
+
+def atomic_write(df, path, fmt='csv'):
+    """write df to a temp file next to path, then rename it over path so readers never see a partial file"""
+    helper.direc_check(os.path.dirname(os.path.abspath(path)))
+    tmp_path = '{}.tmp-{}'.format(path, os.getpid())
+    try:
+        _write(df, tmp_path, fmt)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class Exporter:
+    """Writes result frames in one format.
+
+    Keyword arguments:
+    fmt -- one of FORMATS (default 'csv')
+    partition_by_day -- instead of overwriting path, add a new file under path/day=YYYY-MM-DD/ on every export
+        that changed, so the output is append only (default False)
+    skip_unchanged -- don't write a result whose content hash matches the last one written (default True)
+
+    The hash of the last written result is kept in a .sha1 file next to the output, so unchanged results are
+    skipped across restarts too.
+    """
+    def __init__(self, fmt='csv', partition_by_day=False, skip_unchanged=True):
+        if fmt not in FORMATS:
+            raise ValueError('unknown export format {}, use one of {}'.format(fmt, ', '.join(FORMATS)))
+        self.fmt = fmt
+        self.partition_by_day = partition_by_day
+        self.skip_unchanged = skip_unchanged
+
+    def target(self, path, now=None):
+        """the file an export to path goes to right now"""
+        stem = os.path.splitext(path)[0]
+        if not self.partition_by_day:
+            return stem + FORMATS[self.fmt]
+        now = now or datetime.datetime.now()
+        name = '{}-{}{}'.format(os.path.basename(stem), now.strftime('%H%M%S%f'), FORMATS[self.fmt])
+        return os.path.join(stem, 'day={}'.format(now.strftime('%Y-%m-%d')), name)
+
+    def _hash_path(self, path):
+        stem = os.path.splitext(path)[0]
+        if self.partition_by_day:
+            return os.path.join(stem, '.last-{}.sha1'.format(self.fmt))
+        return stem + FORMATS[self.fmt] + '.sha1'
+
+    def export(self, result, path):
+        """
+        Export a result frame (or series).
+
+        Return:
+        path of the file written, or None if the result was unchanged and skipped
+        """
+        df = _as_frame(result)
+        hash_path = self._hash_path(path)
+        digest = content_hash(df)
+        written = self.partition_by_day or os.path.exists(self.target(path))
+        if self.skip_unchanged and written and os.path.exists(hash_path):
+            with open(hash_path) as hash_file:
+                if hash_file.read().strip() == digest:
+                    return None
+        target = self.target(path)
+        atomic_write(df, target, self.fmt)
+        helper.direc_check(os.path.dirname(os.path.abspath(hash_path)))
+        with open(hash_path, 'w') as hash_file:
+            hash_file.write(digest)
+        return target
@@ -1,17 +1,42 @@
+"""
+This is the graphs module of expd_analytics.
+Plots of test results. Frames bigger than max_points aren't scattered point by point: they are sampled down or
+binned into a density grid with numpy first, and categorical axes get at most max_ticks deduplicated tick labels,
+so a plot of a million rows renders about as fast as one of a few thousand. Plots that are saved are drawn on
+figures of their own (not pyplot's), so many of them can be rendered in one process, see save_all.
+"""
+
+__author__ = 'Jessi Shank <jessica.shank@expeditors.com>'
+
+
+import collections
+import os
+
 import matplotlib
-# fix
 import matplotlib.pyplot as plt
-import collections
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+import numpy as np
+import pandas as pd
+
+# points drawn as is, above this a plot is sampled or binned
+MAX_POINTS = 20000
+# most tick labels put on a categorical axis
+MAX_TICKS = 60
+DENSITY_BINS = 200
+MODES = ('auto', 'scatter', 'sample', 'density')
 
 
 def create_uniform_tcks(array):
-    return [i for i in range(len(array))]
+    return np.arange(len(array))
 
 
 def create_degenerate_tcks(array):
     # http://stackoverflow.com/questions/22095746/scatter-plots-with-string-arrays-in-matplotlib#comment33515033_22096070
-    arr_map = dict((sn, i) for i, sn in enumerate(set(array)))
-    return [array[l] for l in array]
+    # one tick per distinct value instead of per row
+    codes, _ = pd.factorize(np.asarray(array, dtype=object))
+    return codes
 
 
 def create_useful_hist_xtcks_map(series):
@@ -20,18 +45,155 @@ def create_useful_hist_xtcks_map(series):
     return hist_map
 
 
-def plot_string_2d(string_col, numeric_col, rotation, xtick_font_size=5, save_path=None):
-    # plot a scatter 2d plot with a string column as x and numeric as y.
-    fig, ax = plt.subplots(figsize=(20, 10))
-    xticks = create_uniform_tcks(string_col)
-    ax.scatter(x=xticks, y=numeric_col)
-    plt.xlim([0,len(xticks)])
-    plt.xticks(xticks)
-    ax.set_xticklabels(string_col, rotation=rotation)
-    for item in ax.get_xticklabels():
-        item.set_fontsize(xtick_font_size)
+def capped_ticks(labels, max_ticks=MAX_TICKS):
+    """
+    (positions, labels) of at most max_ticks ticks, evenly spread over labels.
+    labels are the categories in axis order, position i being labels[i].
+    """
+    labels = np.asarray(labels, dtype=object)
+    if len(labels) <= max_ticks:
+        return np.arange(len(labels)), labels
+    positions = np.unique(np.linspace(0, len(labels) - 1, max_ticks).round().astype(np.int64))
+    return positions, labels[positions]
+
+
+def sample_positions(size, max_points, seed=0):
+    """sorted positions of at most max_points of size rows, picked at random but the same every time"""
+    if size <= max_points:
+        return np.arange(size)
+    return np.sort(np.random.default_rng(seed).choice(size, max_points, replace=False))
+
+
+def downsample(x, y, max_points=MAX_POINTS, seed=0):
+    """x and y (aligned arrays) cut down to at most max_points of their points"""
+    x, y = np.asarray(x), np.asarray(y)
+    positions = sample_positions(len(x), max_points, seed)
+    return x[positions], y[positions]
+
+
+def density_grid(x, y, bins=DENSITY_BINS, x_range=None):
+    """
+    2d histogram of the points, missing ones left out.
+
+    Return:
+    (counts, x edges, y edges) like np.histogram2d, counts[i, j] being the points in x bin i and y bin j
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    keep = np.isfinite(x) & np.isfinite(y)
+    x, y = x[keep], y[keep]
+    bin_range = None
+    if x_range is not None and len(y):
+        bin_range = [x_range, (y.min(), y.max())]
+    return np.histogram2d(x, y, bins=bins, range=bin_range)
+
+
+def pick_mode(rows, mode='auto', max_points=MAX_POINTS, overlay=False):
+    """
+    How rows points are drawn: 'scatter' every one, 'sample' max_points of them, 'density' binned.
+    auto scatters up to max_points and bins above that, or samples when several frames are drawn over each other.
+    """
+    if mode not in MODES:
+        raise ValueError('mode has to be one of {}, not {}'.format(', '.join(MODES), mode))
+    if mode != 'auto':
+        return mode
+    if rows <= max_points:
+        return 'scatter'
+    return 'sample' if overlay else 'density'
+
+
+def new_figure(figsize=(20, 10), headless=False):
+    """
+    (fig, ax). A headless figure is drawn on an Agg canvas and never registered with pyplot, so it doesn't need
+    closing and is freed as soon as it isn't referenced.
+    """
+    if not headless:
+        return plt.subplots(figsize=figsize)
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot(111)
+
+
+def draw_density(ax, counts, x_edges, y_edges, cmap='viridis'):
+    """draw a density grid from density_grid, empty bins left blank and counts on a log scale"""
+    counts = np.ma.masked_equal(counts, 0)
+    if counts.count() == 0:
+        return None
+    mesh = ax.pcolormesh(x_edges, y_edges, counts.T, cmap=cmap, norm=LogNorm(vmin=1, vmax=counts.max()))
+    ax.figure.colorbar(mesh, ax=ax, label='points')
+    return mesh
+
+
+def save_figure(fig, save_path, **kwargs):
+    """save fig to save_path and release it"""
+    kwargs.setdefault('bbox_inches', 'tight')
+    fig.savefig(save_path, **kwargs)
+    # a no-op for headless figures, pyplot never held them
+    plt.close(fig)
+
+
+def save_all(plots, directory, fmt='png', **savefig_kwargs):
+    """
+    Render and save many plots in one go, each on a headless figure that is freed once written.
+
+    Keyword arguments:
+    plots -- iterable of (name, plot function, args, kwargs). The function is one of the plots of this module (or
+        anything taking a headless keyword and returning its figure)
+    directory -- where to save, as directory/name.fmt
+    fmt -- image format (default png)
+
+    Return:
+    list of the paths written
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, plot, args, kwargs in plots:
+        fig = plot(*args, **dict(kwargs or {}, headless=True))
+        path = os.path.join(directory, '{}.{}'.format(name, fmt))
+        save_figure(fig, path, **savefig_kwargs)
+        paths.append(path)
+    return paths
+
+
+def plot_string_2d(string_col, numeric_col, rotation, xtick_font_size=5, save_path=None, mode='auto',
+                   max_points=MAX_POINTS, max_ticks=MAX_TICKS, headless=None):
+    """
+    Plot a scatter 2d plot with a string column as x and numeric as y.
+    Scattered, every row gets its own x. Sampled or binned (see pick_mode), each distinct string gets one x.
+    Either way at most max_ticks x values are labelled.
+    Returns the figure.
+    """
+    headless = bool(save_path) if headless is None else headless
+    fig, ax = new_figure(headless=headless)
+    mode = pick_mode(len(string_col), mode, max_points)
+    if mode == 'scatter':
+        xticks = create_uniform_tcks(string_col)
+        ax.scatter(x=xticks, y=numeric_col)
+        ax.set_xlim([0, len(xticks)])
+        # tick labels, not points, are what make a plot of many rows slow. each distinct string is labelled once,
+        # at the first row that has it
+        codes, labels = pd.factorize(np.asarray(string_col, dtype=object))
+        _, first_rows = np.unique(codes[codes >= 0], return_index=True)
+        first_rows = np.flatnonzero(codes >= 0)[first_rows]
+        which, tick_labels = capped_ticks(labels, max_ticks)
+        ax.set_xticks(first_rows[which])
+        ax.set_xticklabels(tick_labels, rotation=rotation, fontsize=xtick_font_size)
+    else:
+        codes, labels = pd.factorize(np.asarray(string_col, dtype=object))
+        if mode == 'sample':
+            x, y = downsample(codes, numeric_col, max_points)
+            ax.scatter(x=x, y=y, alpha=0.6)
+        else:
+            # one x bin per string unless there are more of them than bins
+            x_bins = min(len(labels), DENSITY_BINS) or 1
+            draw_density(ax, *density_grid(codes, numeric_col, bins=(x_bins, DENSITY_BINS),
+                                           x_range=(-0.5, len(labels) - 0.5)))
+        positions, tick_labels = capped_ticks(labels, max_ticks)
+        ax.set_xlim([-0.5, len(labels) - 0.5])
+        ax.set_xticks(positions)
+        ax.set_xticklabels(tick_labels, rotation=rotation, fontsize=xtick_font_size)
     if save_path:
-        plt.savefig(save_path)
+        save_figure(fig, save_path, bbox_inches=None)
+    return fig
 
 
 def autolabel(rects, ax):
@@ -52,8 +214,16 @@ def build_service_name_title(front_title, df):
     return front_title + title_string
 
 
+def _tick_map(dataframes, col, label_col, max_ticks):
+    """capped (positions, labels) of the distinct col values and their label_col labels over all dataframes"""
+    pairs = pd.concat([dataframe[[col, label_col]] for dataframe in dataframes]).drop_duplicates(col)
+    pairs = pairs.sort_values(col)
+    positions, _ = capped_ticks(np.arange(len(pairs)), max_ticks)
+    return pairs[col].to_numpy()[positions], pairs[label_col].to_numpy()[positions]
+
+
 def generic_scatter_over_plot(dataframes, x, y, labels, xtick_label=None, ytick_label=None, loc=None, save_name=None,
-                              style=None):
+                              style=None, mode='auto', max_points=MAX_POINTS, max_ticks=MAX_TICKS, headless=None):
     """Generic scatter plotting.
        :param dataframes: dataframes to include in plot
        :type dataframes: list
@@ -63,32 +233,65 @@ def generic_scatter_over_plot(dataframes, x, y, labels, xtick_label=None, ytick_
        :type x: string
        :param y: y axis column of dataframe
        :type y: string
-       :param xtick_label: If the plot data has been mapped to numbers from string values, provide column of string values here
+       :param xtick_label: If the plot data has been mapped to numbers from string values, provide column of string
+           values here
        :type xtick_label: String
        :param ytick_label: Same as xtick_label
        :param loc: location of legend on plot
        :type loc: int
        :param save_name: if specified, location and name of plot to be saved
        :type save_name: string
+       :param mode: 'auto', 'scatter', 'sample' or 'density', see pick_mode. max_points are shared by the dataframes
+       :type mode: string
+       :param max_ticks: most tick labels put on an axis labelled from xtick_label/ytick_label
+       :type max_ticks: int
+       :param headless: draw on a figure pyplot doesn't know about (default when save_name is given)
+       :type headless: bool
+       :return: the figure
     """
     if style:
         matplotlib.style.use('ggplot')
-    fig, ax = plt.subplots(figsize=(20, 10))
-    for dataframe, label in zip(dataframes, labels):
-        ax.scatter(dataframe[x], dataframe[y], label=label, alpha=0.6)
-    if loc:
-        ax.legend(loc)
+    headless = bool(save_name) if headless is None else headless
+    fig, ax = new_figure(headless=headless)
+    rows = sum(len(dataframe) for dataframe in dataframes)
+    mode = pick_mode(rows, mode, max_points, overlay=len(dataframes) > 1)
+    if mode == 'density':
+        frame = pd.concat([dataframe[[x, y]] for dataframe in dataframes])
+        draw_density(ax, *density_grid(frame[x], frame[y]))
+        ax.set_title(', '.join(str(label) for label in labels))
     else:
-        ax.legend()
+        share = max(1, max_points // max(1, len(dataframes)))
+        for dataframe, label in zip(dataframes, labels):
+            x_values, y_values = dataframe[x], dataframe[y]
+            if mode == 'sample':
+                x_values, y_values = downsample(x_values, y_values, share)
+            ax.scatter(x_values, y_values, label=label, alpha=0.6)
+        if loc:
+            ax.legend(loc=loc)
+        else:
+            ax.legend()
     if xtick_label:
-        ax.set_xticklabels(xtick_label, rotation=70)
+        if isinstance(xtick_label, str) and all(xtick_label in dataframe for dataframe in dataframes):
+            positions, tick_labels = _tick_map(dataframes, x, xtick_label, max_ticks)
+            ax.set_xticks(positions)
+        else:
+            # labels of the values 0, 1, 2... the column was mapped to
+            positions, tick_labels = capped_ticks(list(dict.fromkeys(xtick_label)), max_ticks)
+            ax.set_xticks(positions)
+        ax.set_xticklabels(tick_labels, rotation=70)
     if ytick_label:
-        ax.set_yticklabels(ytick_label)
+        if isinstance(ytick_label, str) and all(ytick_label in dataframe for dataframe in dataframes):
+            positions, tick_labels = _tick_map(dataframes, y, ytick_label, max_ticks)
+            ax.set_yticks(positions)
+        else:
+            positions, tick_labels = capped_ticks(list(dict.fromkeys(ytick_label)), max_ticks)
+            ax.set_yticks(positions)
+        ax.set_yticklabels(tick_labels)
     if save_name:
-        fig.save(save_name, bbox_inches='tight')
-    else:
+        save_figure(fig, save_name)
+    elif not headless:
         fig.show()
-    # this bs is a lot of if/else which is lame.
+    return fig
 
 
 #
@@ -104,4 +307,4 @@ def generic_scatter_over_plot(dataframes, x, y, labels, xtick_label=None, ytick_
 #   ax.hist(masked_df[endpoint].mask(mapper), bins=1.5*len(mapper), color='b', alpha=0.7)
 #   ax.set_xticks(list(mapper.values()))
 #   ax.set_xticklabels(list(mapper.keys()), rotation=70)
-#   ax.set_title(title_str)
\ No newline at end of file
+#   ax.set_title(title_str)
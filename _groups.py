@@ -0,0 +1,183 @@
+"""
+This is the groups module of expd_analytics.
+Resolves the groups of a PYNET config once: every group's full case list (its own cases plus all of its
+dependencies', transitively, without duplicates) and the groups each case belongs to, so test results can be
+rolled up by group with one groupby.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+import _data
+
+
+# joins service and case id in the key of a case given as both, a character neither of them has
+SEPARATOR = '\x1f'
+
+
+def qualified_key(service, case_id):
+    return '{}{}{}'.format(service, SEPARATOR, case_id)
+
+
+def case_key(case):
+    """
+    The key a config case entry is matched on: a case_id string as is, a (service, id) pair or a
+    {'service': ..., 'id': ...} map as service and id joined by SEPARATOR, so service a1 + id 2 and service a +
+    id 12 stay apart
+    """
+    if isinstance(case, dict):
+        return qualified_key(case.get('service', ''), case['id'])
+    if isinstance(case, (list, tuple)):
+        return qualified_key(*case)
+    return str(case)
+
+
+def _qualified(case):
+    return isinstance(case, (dict, list, tuple))
+
+
+def _unique(items):
+    """items without duplicates, first appearance kept"""
+    return list(dict.fromkeys(items))
+
+
+def topological_order(dependencies):
+    """
+    Groups ordered so every group comes after all of its dependencies.
+    Raises ValueError on a cycle or on a dependency on a group that doesn't exist.
+
+    Keyword arguments:
+    dependencies -- map of group name : list of the group names it depends on
+    """
+    order = []
+    state = {}  # 1 while a group's dependencies are being visited, 2 once it is in order
+    for root in dependencies:
+        if state.get(root) == 2:
+            continue
+        path = [root]
+        stack = [(root, iter(dependencies[root]))]
+        state[root] = 1
+        while stack:
+            group, remaining = stack[-1]
+            dependency = next(remaining, None)
+            if dependency is None:
+                stack.pop()
+                path.pop()
+                state[group] = 2
+                order.append(group)
+                continue
+            if dependency not in dependencies:
+                raise ValueError('group {} depends on unknown group {}'.format(group, dependency))
+            if state.get(dependency) == 1:
+                cycle = path[path.index(dependency):] + [dependency]
+                raise ValueError('dependency cycle between groups: {}'.format(' -> '.join(cycle)))
+            if state.get(dependency) is None:
+                state[dependency] = 1
+                path.append(dependency)
+                stack.append((dependency, iter(dependencies[dependency])))
+    return order
+
+
+class DependencyIndex:
+    """The groups of a PYNET config with their dependencies resolved.
+
+    Keyword arguments:
+    config -- PYNET config map, with 'groups': {name: {'cases': [...], 'dependencies': [...]}}. The config isn't
+        modified.
+
+    order is every group after its dependencies. cases[group] is the case_key of the group's own cases followed by
+    the ones of its dependencies (in the order they're listed, recursively), each case once, and entries[key] the
+    config entry of a key. groups_of_case[key] is every group whose case list has the case, and home_group[key] the
+    first group (in order) that lists it itself. A case given as a plain case_id matches that case_id of any service.
+    """
+    def __init__(self, config):
+        groups = config.get('groups') or {}
+        self.dependencies = {name: _unique(group.get('dependencies') or []) for name, group in groups.items()}
+        self.order = topological_order(self.dependencies)
+        self.entries = {}
+        for group in groups.values():
+            for case in group.get('cases') or []:
+                self.entries.setdefault(case_key(case), case)
+        own_cases = {name: _unique(case_key(case) for case in group.get('cases') or [])
+                     for name, group in groups.items()}
+        # a case given as service + id has to be matched on case_service_name + case_id
+        self.qualified = any(_qualified(case) for group in groups.values() for case in group.get('cases') or [])
+        self.cases = {}
+        for name in self.order:
+            closure = list(own_cases[name])
+            for dependency in self.dependencies[name]:
+                closure.extend(self.cases[dependency])
+            self.cases[name] = _unique(closure)
+        self.groups_of_case = {}
+        self.home_group = {}
+        for name in self.order:
+            for case in self.cases[name]:
+                self.groups_of_case.setdefault(case, []).append(name)
+            for case in own_cases[name]:
+                self.home_group.setdefault(case, name)
+        self.group_dtype = pd.CategoricalDtype(self.order)
+
+    def case_lists(self):
+        """map of group name : full case list (the config's entries, each case once), in config order"""
+        return {name: [self.entries[key] for key in self.cases[name]] for name in self.dependencies}
+
+    def membership(self):
+        """dataframe with a (case, group) row for every case of every group's full case list"""
+        pairs = [(case, name) for name in self.order for case in self.cases[name]]
+        bridge = pd.DataFrame(pairs, columns=['case', 'group'])
+        bridge['group'] = bridge.group.astype(self.group_dtype)
+        return bridge
+
+    def _row_keys(self, df):
+        """
+        (code of each row's case, list of the case keys each distinct case counts under) of df, -1 where the case is
+        missing. A row counts under its case_id, and under service + case_id when the config has cases given so.
+        """
+        if not self.qualified:
+            codes, uniques = pd.factorize(df.case_id)
+            return codes, [[str(case)] for case in uniques]
+        codes, uniques = pd.MultiIndex.from_arrays([df.case_service_name, df.case_id]).factorize()
+        return codes, [[qualified_key(service, case), str(case)] for service, case in uniques]
+
+    def _home_group(self, keys):
+        for key in keys:
+            if key in self.home_group:
+                return self.home_group[key]
+        return None
+
+    def case_group_column(self, df):
+        """categorical series over df's rows of the group each row's case belongs to (its home group)"""
+        codes, row_keys = self._row_keys(df)
+        key_groups = pd.Categorical([self._home_group(keys) for keys in row_keys], dtype=self.group_dtype)
+        group_codes = np.asarray(key_groups.codes)[codes] if len(row_keys) else np.full(len(codes), -1)
+        group_codes = np.where(codes >= 0, group_codes, -1)
+        return pd.Series(pd.Categorical.from_codes(group_codes, dtype=self.group_dtype), index=df.index,
+                         name='case_group')
+
+    def rollup(self, df):
+        """
+        Coverage and failures of every group over the rows of df, counting each case in all of the groups that
+        have it (through their dependencies too). One pass over df, then a groupby of the small case/group table.
+
+        Return:
+        Dataframe indexed by group of cases (in the full case list), cases_seen (with at least one row in df),
+        coverage, rows, failures (failed/skipped rows) and failure_rate
+        """
+        codes, row_keys = self._row_keys(df)
+        valid = codes >= 0
+        failed = _data.get_failed_mask(df).to_numpy(dtype=bool)
+        rows = np.bincount(codes[valid], minlength=len(row_keys))
+        failures = np.bincount(codes[valid], weights=failed[valid], minlength=len(row_keys)).astype(np.int64)
+        # every distinct case once per key it counts under
+        positions = [position for position, keys in enumerate(row_keys) for _ in keys]
+        keys = [key for keys in row_keys for key in keys]
+        per_case = pd.DataFrame({'rows': rows[positions], 'failures': failures[positions]},
+                                index=pd.Index(keys, name='case', dtype=object)).groupby(level=0).sum()
+        joined = self.membership().join(per_case, on='case')
+        grouped = joined.groupby('group', observed=False)
+        rollup = pd.DataFrame({'cases': grouped.size(), 'cases_seen': grouped.rows.count(),
+                               'rows': grouped.rows.sum(), 'failures': grouped.failures.sum()})
+        rollup['coverage'] = rollup.cases_seen / rollup.cases.where(rollup.cases > 0)
+        rollup['failure_rate'] = rollup.failures / rollup.rows.where(rollup.rows > 0)
+        return rollup
@@ -0,0 +1,257 @@
+"""
+This is the instrument module of expd_analytics.
+Switchable timing of the hot paths: wall time, rows in/out and memory change of each call of an instrumented
+function, kept in an in-process registry (and optionally written as json lines), plus a sampling profiler that can
+be set to run for chosen calls. While disabled an instrumented call costs one flag check.
+
+    import _instrument
+    _instrument.enable()
+    test_result.strict_startup()
+    print(_instrument.REGISTRY.summary())
+
+EXPD_INSTRUMENT=1 enables it from the start, EXPD_INSTRUMENT_LOG=path logs every call to path,
+EXPD_PROFILE=name1,name2 profiles those calls.
+"""
+
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+_enabled = os.environ.get('EXPD_INSTRUMENT', '') not in ('', '0')
+_profiled = set(filter(None, os.environ.get('EXPD_PROFILE', '').split(',')))
+_local = threading.local()
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def profile(*names):
+    """run the sampling profiler during every call of the instrumented functions called names, see Sampler"""
+    _profiled.update(names)
+
+
+def stop_profiling(*names):
+    """stop profiling names (default all of them)"""
+    if names:
+        _profiled.difference_update(names)
+    else:
+        _profiled.clear()
+
+
+def memory_bytes():
+    """bytes currently traced by tracemalloc if it is tracing, otherwise the resident set size (linux), or None"""
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def count_rows(value):
+    """rows of a frame/series, of the first one in a tuple, or of a PynetData's data. None if it has no rows"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple) and value and isinstance(value[0], (pd.DataFrame, pd.Series)):
+        return len(value[0])
+    buffer = getattr(value, '_buffer', None)
+    if buffer is not None:
+        return buffer.size
+    return None
+
+
+class Registry:
+    """Totals per instrumented name, and the latest calls as structured events.
+
+    Keyword arguments:
+    max_events -- how many of the latest events to keep (default 10000)
+    log_path -- append every event to this file as a json line (default None)
+    """
+    def __init__(self, max_events=10000, log_path=None):
+        self.totals = {}
+        self.events = collections.deque(maxlen=max_events)
+        self.profiles = {}
+        self.log_path = log_path
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, rows_in=None, rows_out=None, memory_delta=None, parent=None, error=None):
+        event = {'name': name, 'at': time.time(), 'seconds': seconds, 'rows_in': rows_in, 'rows_out': rows_out,
+                 'memory_delta': memory_delta, 'parent': parent, 'error': error}
+        with self._lock:
+            total = self.totals.get(name)
+            if total is None:
+                total = self.totals[name] = {'calls': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                             'rows_in': 0, 'rows_out': 0, 'memory_delta': 0}
+            total['calls'] += 1
+            total['errors'] += error is not None
+            total['seconds'] += seconds
+            total['max_seconds'] = max(total['max_seconds'], seconds)
+            total['rows_in'] += rows_in or 0
+            total['rows_out'] += rows_out or 0
+            total['memory_delta'] += memory_delta or 0
+            self.events.append(event)
+            if self.log_path:
+                with open(self.log_path, 'a') as log:
+                    log.write(json.dumps(event) + '\n')
+        return event
+
+    def summary(self):
+        """dataframe of the totals by name, slowest first"""
+        if not self.totals:
+            return pd.DataFrame()
+        table = pd.DataFrame.from_dict(self.totals, orient='index')
+        table['mean_seconds'] = table.seconds / table.calls
+        return table.sort_values('seconds', ascending=False)
+
+    def reset(self):
+        with self._lock:
+            self.totals = {}
+            self.events.clear()
+            self.profiles = {}
+
+
+REGISTRY = Registry(log_path=os.environ.get('EXPD_INSTRUMENT_LOG') or None)
+
+
+class Sampler:
+    """Sampling profiler of one thread: every interval seconds, count the stack it is in.
+
+    Keyword arguments:
+    thread_id -- thread to sample (default the calling thread)
+    interval -- seconds between samples (default 0.005)
+
+    samples holds 'outer;...;inner' stacks (function file:line) and their counts, the collapsed format flame graph
+    tools read.
+    """
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='expd-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} {}:{}'.format(code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def top(self, count=20):
+        """the count innermost functions seen most often, with their share of the samples"""
+        inner = collections.Counter()
+        for stack, hits in self.samples.items():
+            inner[stack.rsplit(';', 1)[-1]] += hits
+        total = sum(inner.values()) or 1
+        return [(function, hits / total) for function, hits in inner.most_common(count)]
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as collapsed:
+            for stack, hits in self.samples.items():
+                collapsed.write('{} {}\n'.format(stack, hits))
+
+
+@contextlib.contextmanager
+def span(name, rows_in=None):
+    """
+    Instrument a block. Yields a dict, set 'rows_out' in it to record the rows the block produced.
+    Does nothing but yield while instrumentation is disabled.
+    """
+    out = {}
+    if not _enabled:
+        yield out
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(name)
+    sampler = Sampler().start() if name in _profiled else None
+    memory_before = memory_bytes()
+    started = time.perf_counter()
+    error = None
+    try:
+        yield out
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        memory_after = memory_bytes()
+        stack.pop()
+        memory_delta = memory_after - memory_before if memory_before is not None and memory_after is not None \
+            else None
+        REGISTRY.record(name, seconds, rows_in, out.get('rows_out'), memory_delta, parent, error)
+        if sampler is not None:
+            REGISTRY.profiles[name] = sampler.stop()
+
+
+def instrumented(name=None):
+    """
+    Decorator: instrument every call of the function as a span called name (default its qualified name).
+    rows in are the rows of the first argument (a frame, or the PynetData of a method), rows out the rows of the
+    result, or of the PynetData after the call if the method returns nothing.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            rows_in = count_rows(args[0]) if args else None
+            with span(span_name, rows_in) as out:
+                result = func(*args, **kwargs)
+                out['rows_out'] = count_rows(result if result is not None or not args else args[0])
+            return result
+        return wrapper
+    return decorator
+
+
+def record(name, seconds, rows_out=None):
+    """record a call timed elsewhere (like the per partition read/parse timings of _loader)"""
+    if _enabled:
+        REGISTRY.record(name, seconds, rows_out=rows_out)
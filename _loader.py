@@ -0,0 +1,183 @@
+"""
+This is the loader module of expd_analytics.
+Read a whole database table as several range partitions at once instead of one long chunked read.
+"""
+
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import _instrument
+import helper
+
+sa = helper.lazy_import('sqlalchemy')
+
+# rows where the partition column is NULL don't fall in any range, they get read as their own partition
+NULL_PARTITION = 'NULL'
+
+
+def pick_partition_col(disk_engine, sql_table, fallback=None):
+    """return the table's primary key if it is a single integer column, otherwise fallback"""
+    inspector = sa.inspect(disk_engine)
+    pk_cols = inspector.get_pk_constraint(sql_table).get('constrained_columns') or []
+    if len(pk_cols) == 1:
+        col_types = {column['name']: column['type'] for column in inspector.get_columns(sql_table)}
+        if isinstance(col_types.get(pk_cols[0]), sa.Integer):
+            return pk_cols[0]
+    return fallback
+
+
+def partition_bounds(low, high, partitions, date_fmt=None):
+    """
+    Split the range low..high into evenly sized ranges.
+
+    Keyword arguments:
+    low, high -- smallest and largest value of the partition column, as the database returned them
+    partitions -- number of ranges to split into
+    date_fmt -- if the column holds date strings, their format. bounds are built as timestamps then formatted
+        back, so they compare the same way the stored strings do
+
+    Return:
+    list of partitions + 1 bounds, low first and high last, or None if the column can't be split
+    """
+    if isinstance(low, str):
+        if not date_fmt:
+            return None
+        low_ns = pd.Timestamp(pd.to_datetime(low, format=date_fmt)).value
+        high_ns = pd.Timestamp(pd.to_datetime(high, format=date_fmt)).value
+        edges = np.linspace(low_ns, high_ns, partitions + 1).astype(np.int64)
+        bounds = [pd.Timestamp(edge).strftime(date_fmt) for edge in edges]
+    elif isinstance(low, (int, np.integer)):
+        bounds = [int(edge) for edge in np.linspace(low, high, partitions + 1)]
+    elif isinstance(low, (pd.Timestamp, np.datetime64)) or hasattr(low, 'timestamp'):
+        edges = np.linspace(pd.Timestamp(low).value, pd.Timestamp(high).value, partitions + 1).astype(np.int64)
+        bounds = [pd.Timestamp(edge).to_pydatetime() for edge in edges]
+    else:
+        return None
+    bounds[0], bounds[-1] = low, high
+    return bounds
+
+
+def _partition_query(sql_table, partition_col, part):
+    """select for one partition. part is (lower, upper, upper is inclusive), NULL_PARTITION or None for everything"""
+    if part is None:
+        return sa.select(sa.literal_column('*')).select_from(sa.table(sql_table))
+    table = sa.table(sql_table, sa.column(partition_col))
+    query = sa.select(sa.literal_column('*')).select_from(table)
+    column = table.c[partition_col]
+    if part is NULL_PARTITION:
+        return query.where(column.is_(None))
+    lower, upper, inclusive = part
+    return query.where(column >= lower).where(column <= upper if inclusive else column < upper)
+
+
+def stored_latest(frame, col):
+    """largest value of col in frame as read from the database (before any date parsing), None if it has none"""
+    if col not in frame.columns or not frame[col].notna().any():
+        return None
+    return frame[col].max()
+
+
+def latest_of(values):
+    """largest of values, None ones left out"""
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def shares_connections(disk_engine):
+    """
+    False if reader threads wouldn't see the same database through disk_engine: in memory sqlite, or a pool
+    (SingletonThreadPool) that opens a connection per thread.
+    """
+    if isinstance(disk_engine.pool, sa.pool.SingletonThreadPool):
+        return False
+    url = disk_engine.url
+    if url.get_backend_name() != 'sqlite':
+        return True
+    return url.database not in (None, '', ':memory:') and url.query.get('mode') != 'memory'
+
+
+def parse_dates(frame, date_dict):
+    """
+    parse the columns of date_dict (Map of columns : date string format) in frame, in place.
+    raises ValueError if a value doesn't match its format, rather than loading it as NaT
+    """
+    for col, fmt in (date_dict or {}).items():
+        if col not in frame.columns:
+            continue
+        parsed = pd.to_datetime(frame[col], format=fmt, errors='coerce')
+        bad = frame[col][parsed.isna() & frame[col].notna()]
+        if len(bad):
+            raise ValueError("{} value(s) of {} don't match the date format {}, like {!r}".format(
+                len(bad), col, fmt, bad.iloc[0]))
+        frame[col] = parsed
+    return frame
+
+
+def _read_partition(sql_table, disk_engine, partition_col, part, date_dict):
+    """read one partition and parse its dates. returns (frame, stats)"""
+    started = time.perf_counter()
+    frame = pd.read_sql_query(_partition_query(sql_table, partition_col, part), disk_engine)
+    read_done = time.perf_counter()
+    # the raw date strings compare the way the database compares them, keep the largest for high-water marks
+    latest = {col: stored_latest(frame, col) for col in (date_dict or {})}
+    parse_dates(frame, date_dict)
+    label = 'all' if part is None else ('NULL' if part is NULL_PARTITION else '{} - {}'.format(*part[:2]))
+    stats = {'partition': label, 'rows': len(frame), 'read_s': read_done - started,
+             'parse_s': time.perf_counter() - read_done, 'latest': latest}
+    _instrument.record('sql_read', stats['read_s'], len(frame))
+    _instrument.record('parse_dates', stats['parse_s'], len(frame))
+    return frame, stats
+
+
+def load_partitioned(sql_table, disk_engine, date_dict=None, partitions=5, partition_col=None, workers=None):
+    """
+    Load a table by reading ranges of partition_col concurrently through disk_engine's connection pool.
+    Each partition parses its own dates, so that work is spread over the threads too. Engines whose threads don't
+    share one database (see shares_connections) get one plain read on the calling thread instead.
+
+    Keyword arguments:
+    sql_table -- table to read
+    disk_engine -- sqlalchemy engine
+    date_dict -- Map of columns : date string format to parse into type(pd.Timestamp) (default None)
+    partitions -- number of ranges to split the table into (default 5)
+    partition_col -- column to split on, an integer key or a timestamp column (default None, one plain read)
+    workers -- number of reader threads (default partitions)
+
+    Return:
+    Tuple of (list of dataframes in partition order, list of per partition stats dicts). stats['latest'] maps each
+    date_dict column to its largest value as stored in the database
+    """
+    parts = [None]
+    if not shares_connections(disk_engine):
+        frame, stats = _read_partition(sql_table, disk_engine, partition_col, None, date_dict)
+        return [frame], [stats]
+    if partition_col and partitions > 1:
+        column = sa.column(partition_col)
+        bounds_query = sa.select(sa.func.min(column), sa.func.max(column)).select_from(sa.table(sql_table, column))
+        with disk_engine.connect() as conn:
+            low, high = conn.execute(bounds_query).one()
+        if low is not None and low != high:
+            bounds = partition_bounds(low, high, partitions, (date_dict or {}).get(partition_col))
+            if bounds:
+                last = len(bounds) - 2
+                parts = [(lower, upper, i == last) for i, (lower, upper) in enumerate(zip(bounds[:-1], bounds[1:]))]
+                parts.append(NULL_PARTITION)
+    with ThreadPoolExecutor(max_workers=workers or len(parts)) as pool:
+        futures = [pool.submit(_read_partition, sql_table, disk_engine, partition_col, part, date_dict)
+                   for part in parts]
+        results = [future.result() for future in futures]
+    frames = [frame for frame, _ in results]
+    stats = [partition_stats for _, partition_stats in results]
+    return frames, stats
+
+
+def print_load_stats(sql_table, stats):
+    """print a line per partition so the partition count can be tuned"""
+    total_rows = sum(partition['rows'] for partition in stats)
+    print('loaded {} rows from {} in {} partitions'.format(total_rows, sql_table, len(stats)))
+    for partition in stats:
+        print('    {partition}: {rows} rows, read {read_s:.2f} s, parse {parse_s:.2f} s'.format(**partition))
@@ -0,0 +1,139 @@
+"""
+This is the memo module of expd_analytics.
+Caches the results of analysis functions run over a PynetData's data, so asking for the same view twice doesn't
+scan the data twice. Results are tied to the data_version they were computed from.
+"""
+
+
+import collections
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+
+def freeze(value):
+    """
+    A hashable stand in for an argument value: lists/tuples/sets/dicts are frozen recursively.
+    Raises TypeError for values that can't be part of a key (dataframes, arrays...).
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index, np.ndarray)):
+        raise TypeError('{} arguments are not cached'.format(type(value).__name__))
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return 'set', frozenset(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return 'dict', tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    hash(value)
+    return value
+
+
+def result_size(result):
+    """rough number of bytes a cached result holds on to"""
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(index=True, deep=True).sum())
+    if isinstance(result, (pd.Series, pd.Index)):
+        return int(result.memory_usage(deep=True))
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, dict):
+        return sys.getsizeof(result) + sum(result_size(key) + result_size(item) for key, item in result.items())
+    if isinstance(result, (list, tuple, set, frozenset)):
+        return sys.getsizeof(result) + sum(result_size(item) for item in result)
+    return sys.getsizeof(result)
+
+
+def func_key(func):
+    """module.qualname of func, plus the function itself for lambdas and nested functions, which share names"""
+    name = '{}.{}'.format(getattr(func, '__module__', None), getattr(func, '__qualname__', repr(func)))
+    return (name, func) if '<' in name else (name,)
+
+
+class QueryCache:
+    """LRU cache of function results for one version of the data.
+
+    Keyword arguments:
+    max_entries -- most results kept (default DEFAULT_MAX_ENTRIES)
+    max_bytes -- most bytes of results kept, measured with memory_usage(deep=True) for pandas results
+        (default DEFAULT_MAX_BYTES). a single result bigger than this is returned but not kept
+
+    Entries are keyed on (function name, arguments, data version). A lookup with a newer version drops everything
+    computed from older versions. Cached results are handed out as is, don't modify them in place.
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.uncacheable = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        """dict of hit/miss/eviction counts, hit rate, entries and bytes held"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions, 'invalidations': self.invalidations, 'uncacheable': self.uncacheable,
+                'entries': len(self._entries), 'bytes': self.bytes}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _set_version(self, version):
+        if version != self.version:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+            self.version = version
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def call(self, func, data, args=(), kwargs=None, version=None):
+        """
+        Return func(data, *args, **kwargs), from the cache if it was already computed for this version.
+        Calls with arguments that can't be frozen into a key (see freeze) are just run.
+        """
+        kwargs = kwargs or {}
+        try:
+            key = (func_key(func), freeze(args), freeze(kwargs))
+        except TypeError:
+            self.uncacheable += 1
+            return func(data, *args, **kwargs)
+        with self._lock:
+            self._set_version(version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        result = func(data, *args, **kwargs)
+        size = result_size(result)
+        with self._lock:
+            # the data may have changed while func ran, then the result is already stale
+            if version != self.version or size > self.max_bytes:
+                return result
+            if key in self._entries:
+                self.bytes -= self._entries[key][1]
+            self._entries[key] = (result, size)
+            self.bytes += size
+            self._evict()
+        return result
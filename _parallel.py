@@ -0,0 +1,223 @@
+"""
+This is the parallel module of expd_analytics.
+Runs the per case/per endpoint analyses on a pool of processes. The columns a task needs are written once per
+data version as .npy files that every worker memory maps, so frames never get pickled to the workers, and the rows
+are split by a stable hash of the key so every key is handled by exactly one worker. Results are merged back into
+the order the serial _data functions return them in.
+"""
+
+
+import os
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import _data
+
+
+def stable_hash(values):
+    """crc32 of each value's str, the same in every process and every run (unlike hash() of a str)"""
+    return np.array([zlib.crc32(str(value).encode('utf8')) for value in values], dtype=np.int64)
+
+
+def partition_positions(key_series, partitions):
+    """
+    Row positions of each of partitions hash partitions of key_series, every key entirely in one partition.
+    Missing keys go to partition 0.
+    """
+    codes, uniques = pd.factorize(key_series)
+    unique_parts = stable_hash(uniques) % partitions
+    row_parts = np.where(codes >= 0, unique_parts[codes], 0)
+    return [np.flatnonzero(row_parts == part) for part in range(partitions)]
+
+
+def write_column(directory, number, series):
+    """
+    Save a column as .npy file(s) in directory, return what read_column needs to rebuild it.
+    numpy typed columns are saved as is, categoricals as codes + categories, anything else (str, object, nullable)
+    factorized into codes + distinct values.
+    """
+    path = os.path.join(directory, 'col{}'.format(number))
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        np.save(path + '.npy', series.cat.codes.to_numpy())
+        return 'category', path, dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufM':
+        np.save(path + '.npy', series.to_numpy())
+        return 'numpy', path, dtype
+    codes, uniques = pd.factorize(series)
+    np.save(path + '.npy', codes)
+    np.save(path + '.uniques.npy', np.asarray(uniques, dtype=object), allow_pickle=True)
+    return 'factorized', path, dtype
+
+
+def read_column(kind, path, dtype, positions=None):
+    """rebuild a column saved by write_column, only the rows at positions (default all)"""
+    values = np.load(path + '.npy', mmap_mode='r')
+    values = values[positions] if positions is not None else np.asarray(values)
+    if kind == 'category':
+        return pd.Categorical.from_codes(values, dtype=dtype)
+    if kind == 'numpy':
+        return values
+    uniques = np.load(path + '.uniques.npy', allow_pickle=True)
+    rebuilt = uniques.take(values) if len(uniques) else np.full(len(values), None, dtype=object)
+    rebuilt[values < 0] = None
+    return pd.array(rebuilt, dtype=dtype)
+
+
+def read_frame(layout, positions=None):
+    """dataframe of the columns in layout (name: write_column result), only the rows at positions"""
+    rows = layout.pop('__rows__')
+    index = pd.RangeIndex(rows) if positions is None else pd.Index(positions)
+    columns = {name: read_column(kind, path, dtype, positions) for name, (kind, path, dtype) in layout.items()}
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def _run_task(task, layout, positions_path, args):
+    """what a worker runs: open its rows of the shared columns and run task over them"""
+    positions = np.load(positions_path) if positions_path else None
+    return task(read_frame(dict(layout), positions), *args)
+
+
+def _task_agg(frame, key, aggregation):
+    return frame.groupby(key, observed=True).agg(aggregation)
+
+
+def _task_mean(frame, key, col):
+    return frame.groupby(key, observed=True)[col].mean()
+
+
+def _task_endpoints(frame, endpoints, as_frame):
+    return _data.endpoints_v_duration(frame, endpoints, as_frame)
+
+
+def in_serial_order(merged, key_series):
+    """put the merged per partition groupby results in the order df.groupby(key) would have them"""
+    if isinstance(key_series.dtype, pd.CategoricalDtype):
+        # categorical keys come out in category order, not sorted
+        categories = key_series.cat.categories
+        order = categories[categories.isin(merged.index)]
+        merged = merged.loc[list(order)]
+        merged.index = pd.CategoricalIndex(order, dtype=key_series.dtype, name=key_series.name)
+        return merged
+    return merged.sort_index()
+
+
+class _SharedFrame:
+    """columns of one data version written to a temp directory, with the hash partitions of each key"""
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        self.directory = tempfile.mkdtemp(prefix='expd-parallel-')
+        self.columns = {}
+        self.partitions = {}
+
+    def layout(self, df, names):
+        for name in names:
+            if name not in self.columns:
+                self.columns[name] = write_column(self.directory, len(self.columns), df[name])
+        layout = {name: self.columns[name] for name in names}
+        layout['__rows__'] = self.rows
+        return layout
+
+    def partition_paths(self, df, key, partitions):
+        if (key, partitions) not in self.partitions:
+            paths = []
+            for part, positions in enumerate(partition_positions(df[key], partitions)):
+                path = os.path.join(self.directory, 'part-{}-{}-{}.npy'.format(len(self.partitions), partitions,
+                                                                                  part))
+                np.save(path, positions)
+                paths.append(path)
+            self.partitions[(key, partitions)] = paths
+        return self.partitions[(key, partitions)]
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ProcessBackend:
+    """Runs per case/endpoint analyses of a frame on a process pool, giving the same results as the serial path.
+
+    Keyword arguments:
+    workers -- number of processes (default os.cpu_count())
+    mp_context -- multiprocessing context for the pool (default the platform default)
+
+    Every method takes the frame and its data version, which has to tell the frames of different objects apart too
+    (PynetData.data_key): the shared column files are rewritten only when the version or the row count changes.
+    close() shuts the pool down and removes the files.
+    """
+    def __init__(self, workers=None, mp_context=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._mp_context = mp_context
+        self._pool = None
+        self._shared = None
+
+    def _share(self, df, version):
+        shared = self._shared
+        if shared is None or version is None or shared.version != version or shared.rows != len(df):
+            if self._shared is not None:
+                self._shared.remove()
+            self._shared = _SharedFrame(version, len(df))
+        return self._shared
+
+    def _map(self, task, df, version, columns, args, key=None):
+        """run task on every hash partition of key (or on the whole frame once per item of args)"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=self._mp_context)
+        shared = self._share(df, version)
+        layout = shared.layout(df, columns)
+        if key is None:
+            jobs = [(task, layout, None, task_args) for task_args in args]
+        else:
+            jobs = [(task, layout, path, args) for path in shared.partition_paths(df, key, self.workers)]
+        futures = [self._pool.submit(_run_task, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._shared is not None:
+            self._shared.remove()
+            self._shared = None
+
+    def group_agg(self, df, version, key, aggregation):
+        """df.groupby(key, observed=True).agg(aggregation), one partition of keys per worker"""
+        columns = [key] + [col for col in aggregation if col != key]
+        parts = self._map(_task_agg, df, version, columns, (key, aggregation), key=key)
+        return in_serial_order(pd.concat(parts), df[key])
+
+    def group_mean(self, df, version, key, col):
+        """df.groupby(key, observed=True)[col].mean(), one partition of keys per worker"""
+        parts = self._map(_task_mean, df, version, [key, col], (key, col), key=key)
+        return in_serial_order(pd.concat(parts), df[key])
+
+    def longest_case_over_time(self, df, version, aggregation):
+        """_data.return_longest_case_over_time"""
+        case = _data.longest_case_id(self.group_agg(df, version, 'case_id', aggregation))
+        return _data.return_specific_case_over_time(df, case)
+
+    def highest_failures_by_df_stdev(self, df, version, groupby_key, sigma=0):
+        """_data.highest_failures_by_df_stdev"""
+        return _data.failures_outside_norm(self.group_mean(df, version, groupby_key, 'numeric_status'), sigma)
+
+    def endpoints_v_duration(self, df, version, endpoints=None, as_frame=False):
+        """
+        _data.endpoints_v_duration. A run is averaged over all its rows, so every worker sees every row and the
+        endpoints are what gets split between them.
+        """
+        if endpoints is None:
+            endpoints = df.case_endpoint.dropna().unique()
+        endpoints = sorted(endpoints)
+        parts = [[endpoint for endpoint, part in zip(endpoints, stable_hash(endpoints) % self.workers)
+                  if part == worker] for worker in range(self.workers)]
+        columns = ['case_endpoint', 'group_uuid', 'case_duration', 'case_timestamp']
+        results = self._map(_task_endpoints, df, version, columns, [(part, as_frame) for part in parts if part])
+        merged = {}
+        for result in results:
+            merged.update(result)
+        return {endpoint: merged[endpoint] for endpoint in endpoints}
@@ -0,0 +1,178 @@
+"""
+This is the resolver module of expd_analytics.
+Reverse DNS of endpoint IPs with a cache: every distinct address of a column is looked up once, concurrently and
+with a timeout, and the answers (failures too) are kept for a while so the next frame doesn't wait on them again.
+"""
+
+
+import collections
+import ipaddress
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_TTL = 3600.0
+# failed lookups are retried sooner than good answers expire
+DEFAULT_NEGATIVE_TTL = 300.0
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TIMEOUT = 5.0
+
+
+def reverse_lookup(address):
+    """host name of address from the system resolver. raises OSError (socket.herror) if there is none"""
+    return socket.gethostbyaddr(address)[0]
+
+
+def is_ip(value):
+    try:
+        ipaddress.ip_address(value)
+    except ValueError:
+        return False
+    return True
+
+
+class HostnameResolver:
+    """Reverse lookups through a TTL'd LRU cache, done on a thread pool.
+
+    Keyword arguments:
+    lookup -- function of an address returning its host name, raising OSError when it has none
+        (default reverse_lookup, swap in a stub for tests)
+    ttl -- seconds a host name is kept (default DEFAULT_TTL)
+    negative_ttl -- seconds a failed lookup is kept (default DEFAULT_NEGATIVE_TTL)
+    max_entries -- most addresses kept, least recently used go first (default DEFAULT_MAX_ENTRIES)
+    workers -- lookup threads (default 16)
+    timeout -- seconds resolve_many waits for lookups (default DEFAULT_TIMEOUT)
+    clock -- function giving the time in seconds (default time.monotonic)
+
+    A lookup that is still running when the timeout passes is resolved as None for that call, and its answer
+    is cached whenever it comes in. Lookups of an address already in flight are shared.
+    """
+    def __init__(self, lookup=reverse_lookup, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES, workers=16, timeout=DEFAULT_TIMEOUT, clock=time.monotonic):
+        self.lookup = lookup
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.workers = workers
+        self.timeout = timeout
+        self.clock = clock
+        self._cache = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'failures': self.failures, 'timeouts': self.timeouts,
+                'entries': len(self._cache)}
+
+    def _cached(self, address, now):
+        """(True, host name or None) if address has an unexpired answer, else (False, None). call with the lock"""
+        entry = self._cache.get(address)
+        if entry is None:
+            return False, None
+        hostname, expires = entry
+        if expires <= now:
+            del self._cache[address]
+            return False, None
+        self._cache.move_to_end(address)
+        return True, hostname
+
+    def _store(self, address, hostname):
+        ttl = self.ttl if hostname is not None else self.negative_ttl
+        with self._lock:
+            self.failures += hostname is None
+            self._cache[address] = (hostname, self.clock() + ttl)
+            self._cache.move_to_end(address)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            self._pending.pop(address, None)
+
+    def _lookup(self, address):
+        try:
+            hostname = self.lookup(address)
+        except OSError:
+            hostname = None
+        except Exception:
+            with self._lock:
+                self._pending.pop(address, None)
+            raise
+        self._store(address, hostname)
+        return hostname
+
+    def resolve_many(self, addresses, timeout=None):
+        """
+        Map of each distinct address to its host name, None where it has none or didn't answer within timeout
+        seconds (default self.timeout). Only addresses not in the cache are looked up.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        resolved = {}
+        futures = {}
+        with self._lock:
+            now = self.clock()
+            for address in dict.fromkeys(addresses):
+                found, hostname = self._cached(address, now)
+                if found:
+                    self.hits += 1
+                    resolved[address] = hostname
+                    continue
+                self.misses += 1
+                if address not in self._pending:
+                    if self._pool is None:
+                        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='expd-resolver')
+                    self._pending[address] = self._pool.submit(self._lookup, address)
+                futures[address] = self._pending[address]
+        if futures:
+            wait(futures.values(), timeout=timeout)
+        for address, future in futures.items():
+            if future.done():
+                resolved[address] = future.result()
+            else:
+                self.timeouts += 1
+                resolved[address] = None
+        return resolved
+
+    def resolve(self, address, timeout=None):
+        """host name of one address, None if it has none"""
+        return self.resolve_many([address], timeout)[address]
+
+    def hostname_column(self, df, col='case_endpoint', name='hostname', timeout=None):
+        """
+        Series over df's rows of the host name of col. Values that aren't IPs are host names already and are kept
+        as is, IPs without a host name are missing. Each distinct IP is resolved once.
+        """
+        codes, uniques = pd.factorize(df[col])
+        uniques = np.asarray(uniques, dtype=object)
+        addresses = [value for value in uniques if isinstance(value, str) and is_ip(value)]
+        resolved = self.resolve_many(addresses, timeout)
+        hostnames = np.array([resolved.get(value, value) for value in uniques] + [None], dtype=object)
+        # code -1 (missing value) picks the None at the end
+        return pd.Series(pd.Categorical(hostnames[codes]), index=df.index, name=name)
+
+    def add_hostname_column(self, df, col='case_endpoint', name='hostname', timeout=None):
+        """df with a name column of col's host names (see hostname_column)"""
+        return df.assign(**{name: self.hostname_column(df, col, name, timeout)})
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+_default_resolver = None
+
+
+def default_resolver():
+    """the HostnameResolver shared by everything that doesn't bring its own"""
+    global _default_resolver
+    if _default_resolver is None:
+        _default_resolver = HostnameResolver()
+    return _default_resolver
@@ -0,0 +1,245 @@
+"""
+This is the rollup module of expd_analytics.
+Hourly, daily and weekly buckets of case_duration and status per case_id, per case_endpoint and overall, built from
+date_int. Over time queries read the coarsest resolution that still answers them, so a year of history comes back
+as a few thousand bucket rows instead of every raw row. Appending rows only recomputes the buckets they fall in.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+HOUR = 3600 * 10 ** 9
+# resolution : bucket width in nanoseconds, finest first
+RESOLUTIONS = {'hour': HOUR, 'day': 24 * HOUR, 'week': 7 * 24 * HOUR}
+# the epoch was a thursday, weeks start on the monday after it
+BUCKET_OFFSETS = {'hour': 0, 'day': 0, 'week': 4 * 24 * HOUR}
+ROLLUP_KEYS = ('case_id', 'case_endpoint')
+PERCENTILES = (0.5, 0.9, 0.99)
+# fewest buckets an automatically picked resolution has to give over the queried range
+MIN_BUCKETS = 24
+NAT = np.iinfo(np.int64).min
+
+
+def bucket_starts(date_int, resolution):
+    """start (int nanoseconds) of the resolution bucket each date_int falls in"""
+    width, offset = RESOLUTIONS[resolution], BUCKET_OFFSETS[resolution]
+    return (np.asarray(date_int, dtype=np.int64) - offset) // width * width + offset
+
+
+def is_aligned(timestamp, resolution):
+    """True if timestamp (None means open ended) is the start of a resolution bucket"""
+    if timestamp is None:
+        return True
+    value = pd.Timestamp(timestamp).value
+    return bucket_starts([value], resolution)[0] == value
+
+
+def group_quantiles(group_ids, values, quantiles, groups, by_value=None):
+    """
+    Linearly interpolated quantiles (like pandas' default) of values within each group, missing values skipped.
+    One sort of all the values instead of a quantile per group.
+
+    Keyword arguments:
+    by_value -- np.argsort(values, kind='stable'), if it is already known (default None)
+
+    Return:
+    array of groups x len(quantiles), NaN for a group without values
+    """
+    if by_value is None:
+        by_value = np.argsort(values, kind='stable')
+    # sorted by group, then by value with the missing values last
+    ordered = values[by_value[np.argsort(group_ids[by_value], kind='stable')]]
+    sizes = np.bincount(group_ids, minlength=groups)
+    counts = np.bincount(group_ids, weights=~np.isnan(values), minlength=groups).astype(np.int64)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    result = np.full((groups, len(quantiles)), np.nan)
+    has_values = counts > 0
+    starts, counts = starts[has_values], counts[has_values]
+    for column, q in enumerate(quantiles):
+        position = q * (counts - 1)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, counts - 1)
+        low, high = ordered[starts + below], ordered[starts + above]
+        result[has_values, column] = low + (high - low) * (position - below)
+    return result
+
+
+class _Rows:
+    """the columns of a frame that bucket_stats reads, converted once for every resolution and key"""
+    def __init__(self, df, keys=()):
+        date_int = np.asarray(df.date_int, dtype=np.int64)
+        valid = date_int != NAT
+        self.date_int = date_int[valid]
+        self.duration = np.asarray(df.case_duration, dtype=np.float64)[valid]
+        self.passed = np.asarray(df.case_status == 'passed', dtype=bool)[valid]
+        self.codes = {}
+        self.uniques = {}
+        for key in keys:
+            codes, uniques = pd.factorize(df[key])
+            # renumbered in key order (categories or not), so ordering by code orders by key. missing keys are -1
+            uniques = np.asarray(uniques, dtype=object)
+            order = np.argsort(uniques)
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            self.codes[key] = np.where(codes >= 0, rank[codes], -1)[valid]
+            self.uniques[key] = uniques[order]
+        self.by_duration = np.argsort(self.duration, kind='stable')
+
+    def since(self, start):
+        """the rows at or after start (int nanoseconds)"""
+        return self.subset(self.date_int >= start)
+
+    def subset(self, keep):
+        """the rows where the boolean array keep is True"""
+        rows = object.__new__(_Rows)
+        rows.date_int, rows.duration, rows.passed = self.date_int[keep], self.duration[keep], self.passed[keep]
+        rows.codes = {key: codes[keep] for key, codes in self.codes.items()}
+        rows.uniques = self.uniques
+        # positions among the kept rows, in the same order
+        new_position = np.cumsum(keep) - 1
+        rows.by_duration = new_position[self.by_duration[keep[self.by_duration]]]
+        return rows
+
+
+def bucket_stats(df, resolution, key=None):
+    """
+    Statistics of the rows of df (with date_int, case_duration and case_status) by resolution bucket and key.
+    Rows without a time or key are left out.
+
+    Return:
+    Dataframe indexed by bucket (int nanoseconds), or by key and bucket if key is given, sorted, with rows,
+    count (durations that aren't missing), mean, p50/p90/p99 of case_duration and pass_rate (share that passed)
+    """
+    rows = df if isinstance(df, _Rows) else _Rows(df, [key] if key is not None else [])
+    if key is not None and (rows.codes[key] < 0).any():
+        rows = rows.subset(rows.codes[key] >= 0)
+    width, offset = RESOLUTIONS[resolution], BUCKET_OFFSETS[resolution]
+    first = bucket_starts([rows.date_int.min()], resolution)[0] if len(rows.date_int) else offset
+    # bucket number from the first bucket, and (key code, bucket number) packed in one int so np.unique sorts by both
+    bucket_numbers = (bucket_starts(rows.date_int, resolution) - first) // width
+    span = int(bucket_numbers.max()) + 1 if len(bucket_numbers) else 1
+    packed = bucket_numbers if key is None else rows.codes[key].astype(np.int64) * span + bucket_numbers
+    group_keys, group_ids = np.unique(packed, return_inverse=True)
+    buckets = first + group_keys % span * width
+    if key is None:
+        index = pd.Index(buckets, name='bucket')
+    else:
+        # key first, so the buckets of one case/endpoint are one slice
+        index = pd.MultiIndex.from_arrays([rows.uniques[key].take(group_keys // span), buckets],
+                                          names=[key, 'bucket'])
+    groups = len(index)
+    present = ~np.isnan(rows.duration)
+    row_counts = np.bincount(group_ids, minlength=groups)
+    counts = np.bincount(group_ids, weights=present, minlength=groups)
+    sums = np.bincount(group_ids, weights=np.where(present, rows.duration, 0), minlength=groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = pd.DataFrame({'rows': row_counts, 'count': counts.astype(np.int64), 'mean': sums / counts},
+                             index=index)
+    percentiles = group_quantiles(group_ids, rows.duration, PERCENTILES, groups, rows.by_duration)
+    for column, q in enumerate(PERCENTILES):
+        stats['p{:g}'.format(q * 100)] = percentiles[:, column]
+    stats['pass_rate'] = np.bincount(group_ids, weights=rows.passed, minlength=groups) / row_counts
+    return stats
+
+
+class RollupStore:
+    """Bucket statistics (see bucket_stats) of every resolution, overall and per ROLLUP_KEYS.
+
+    tables[(resolution, key)] is the bucket_stats table, key None being the overall one. update() with appended
+    rows recomputes the buckets from the earliest one they touch onwards, out of the rows in those buckets, so a
+    refresh costs (at most) the rows of the last week instead of the history.
+    """
+    def __init__(self, keys=ROLLUP_KEYS):
+        self.keys = tuple(keys)
+        self.tables = {}
+        self.first = None
+        self.last = None
+
+    @classmethod
+    def from_frame(cls, df, keys=ROLLUP_KEYS):
+        store = cls([key for key in keys if key in df.columns])
+        store._build(df)
+        return store
+
+    def _build(self, df, since=None):
+        """(re)compute the buckets at or after since (default all of them) from df, which has all of their rows"""
+        all_rows = _Rows(df, self.keys)
+        if len(all_rows.date_int):
+            low, high = all_rows.date_int.min(), all_rows.date_int.max()
+            self.first = low if self.first is None else min(self.first, low)
+            self.last = high if self.last is None else max(self.last, high)
+        for resolution in RESOLUTIONS:
+            start = None if since is None else bucket_starts([since], resolution)[0]
+            rows = all_rows if start is None else all_rows.since(start)
+            for key in (None,) + self.keys:
+                fresh = bucket_stats(rows, resolution, key)
+                kept = self.tables.get((resolution, key))
+                if start is not None and kept is not None:
+                    buckets = kept.index.get_level_values('bucket')
+                    fresh = pd.concat([kept[buckets < start], fresh])
+                    if key is not None:
+                        fresh = fresh.sort_index()
+                self.tables[(resolution, key)] = fresh
+
+    def update(self, new_rows, rows_since):
+        """
+        Fold appended rows in.
+
+        Keyword arguments:
+        new_rows -- the appended rows, with date_int
+        rows_since -- function of a timestamp (int nanoseconds) returning every row, old and new, at or after it
+        """
+        date_int = np.asarray(new_rows.date_int, dtype=np.int64)
+        date_int = date_int[date_int != NAT]
+        if not len(date_int):
+            return
+        since = date_int.min()
+        # the week bucket starts first, so its rows cover the day and hour buckets too
+        self._build(rows_since(bucket_starts([since], 'week')[0]), since)
+
+    def pick_resolution(self, start=None, end=None, min_buckets=MIN_BUCKETS):
+        """
+        The coarsest resolution whose buckets line up with start and end and give at least min_buckets buckets
+        between them (open ends are the first/last row). hour if none does.
+        """
+        if self.first is None:
+            return 'hour'
+        low = pd.Timestamp(start).value if start is not None else self.first
+        high = pd.Timestamp(end).value if end is not None else self.last
+        for resolution in reversed(list(RESOLUTIONS)):
+            if not (is_aligned(start, resolution) and is_aligned(end, resolution)):
+                continue
+            if (high - low) / RESOLUTIONS[resolution] >= min_buckets:
+                return resolution
+        return 'hour'
+
+    def over_time(self, key=None, value=None, start=None, end=None, resolution=None, min_buckets=MIN_BUCKETS):
+        """
+        Buckets of one case_id/case_endpoint (or of everything) between start and end.
+
+        Keyword arguments:
+        key -- case_id or case_endpoint, None for all rows (default None)
+        value -- the case id or endpoint to give the buckets of, when key is given
+        start -- first bucket is the one start falls in (default the first one)
+        end -- buckets starting before end (default up to the last one)
+        resolution -- hour, day or week (default pick_resolution(start, end, min_buckets))
+
+        Return:
+        Dataframe indexed by bucket start timestamp, with the bucket_stats columns and the resolution in attrs
+        """
+        resolution = resolution or self.pick_resolution(start, end, min_buckets)
+        table = self.tables[(resolution, key)]
+        if key is not None:
+            try:
+                table = table.loc[value]
+            except KeyError:
+                table = table.iloc[:0].droplevel(key)
+        buckets = np.asarray(table.index, dtype=np.int64)
+        low = 0 if start is None else np.searchsorted(buckets, bucket_starts([pd.Timestamp(start).value],
+                                                                             resolution)[0], side='left')
+        high = len(buckets) if end is None else np.searchsorted(buckets, pd.Timestamp(end).value, side='left')
+        window = table.iloc[low:high]
+        window = window.set_axis(pd.DatetimeIndex(buckets[low:high].astype('datetime64[ns]'), name='bucket'))
+        window.attrs['resolution'] = resolution
+        return window
@@ -0,0 +1,124 @@
+"""
+This is the scheduler module of expd_analytics.
+Runs periodic export jobs (csv dumps and the like) on a background thread, so they never hold up the caller.
+"""
+
+
+import threading
+import time
+import traceback
+
+
+class ExportJob:
+    """one registered job, and how it has gone so far"""
+    def __init__(self, name, func, interval, version=None, first_delay=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.version = version
+        self.next_run = time.monotonic() + (interval if first_delay is None else first_delay)
+        self.last_version = None
+        self.runs = 0
+        self.skips = 0
+        self.last_error = None
+
+    def due_version(self):
+        """
+        The version of the job's inputs if it should run now, or None to skip it.
+        Jobs without a version callable always run. A version of None means there's nothing to export yet.
+        """
+        if self.version is None:
+            return True
+        current = self.version()
+        if current is None or current == self.last_version:
+            return None
+        return current
+
+
+class ExportScheduler:
+    """Runs registered jobs on one daemon thread, each on its own interval.
+
+    A job can give a version callable: when the version it returns hasn't changed since the job last ran (or is
+    None), that run is skipped. The thread sleeps on a condition until the next job is due, so registering a job
+    or stopping takes effect right away instead of after the current sleep.
+    """
+    def __init__(self, name='export-scheduler'):
+        self.name = name
+        self.jobs = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def register(self, name, func, interval, version=None, first_delay=None):
+        """
+        Register (or replace) a job.
+
+        Keyword arguments:
+        name -- name of the job
+        func -- callable run with no arguments
+        interval -- seconds between runs
+        version -- callable returning a token for the job's inputs, the run is skipped while it doesn't change
+            (default None, always run)
+        first_delay -- seconds until the first run (default interval)
+        """
+        with self._condition:
+            self.jobs[name] = ExportJob(name, func, interval, version, first_delay)
+            self._condition.notify()
+
+    def unregister(self, name):
+        with self._condition:
+            self.jobs.pop(name, None)
+            self._condition.notify()
+
+    def start(self):
+        """start the background thread, returns right away"""
+        if self.running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """stop the thread once the job it is running (if any) finishes"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _next_due(self):
+        """(job, seconds until it is due) for the job that is due first, or (None, None) if there are no jobs"""
+        if not self.jobs:
+            return None, None
+        job = min(self.jobs.values(), key=lambda registered: registered.next_run)
+        return job, job.next_run - time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                job, wait = self._next_due()
+                while not self._stopping and (job is None or wait > 0):
+                    self._condition.wait(wait)
+                    job, wait = self._next_due()
+                if self._stopping:
+                    return
+                job.next_run = time.monotonic() + job.interval
+            self._run_job(job)
+
+    def _run_job(self, job):
+        try:
+            version = job.due_version()
+            if version is None:
+                job.skips += 1
+                return
+            job.func()
+            job.last_version = version
+            job.runs += 1
+        except Exception:
+            job.last_error = traceback.format_exc()
+            print('export job {} failed:\n{}'.format(job.name, job.last_error))
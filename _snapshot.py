@@ -0,0 +1,104 @@
+"""
+This is the snapshot module of expd_analytics.
+Local columnar copies of database tables, so startup only has to pull the rows that are newer than the copy.
+Snapshots are uncompressed Feather (Arrow IPC) files that get memory mapped on load; they need pyarrow.
+"""
+
+
+import json
+import os
+
+import helper
+
+# bump this whenever the layout of the snapshot files changes, every existing snapshot gets rebuilt
+SNAPSHOT_VERSION = 1
+
+
+def table_schema(disk_engine, table):
+    """return a list of [column name, column type] for table, used to notice schema changes"""
+    from sqlalchemy import inspect
+    return [[column['name'], str(column['type'])] for column in inspect(disk_engine).get_columns(table)]
+
+
+def format_watermark(timestamp, date_fmt=None):
+    """
+    format a pd.Timestamp with the format it was parsed with. this only gives back the stored string if the
+    database has every digit the format writes (%f is always 6), use the stored value itself where there is one
+    """
+    if date_fmt:
+        return timestamp.strftime(date_fmt)
+    return str(timestamp)
+
+
+class Snapshot:
+    """Snapshot of one table, stored as <directory>/<table>.feather with a <table>.json sidecar of metadata
+    (<table>.compact.* for compact frames).
+
+    The sidecar holds the snapshot version, the table schema and the date parsing that produced the frame, so any
+    change to those forces a rebuild, and the high-water mark of the time column (as the database stores it) so only
+    newer rows are fetched.
+    """
+    def __init__(self, directory, table, compact=False):
+        self.directory = directory
+        self.table = table
+        # a compact frame (see _data.compact_frame) is lossy, it gets files of its own so the modes never mix
+        self.compact = compact
+        name = table + ('.compact' if compact else '')
+        self.data_path = os.path.join(directory, name + '.feather')
+        self.meta_path = os.path.join(directory, name + '.json')
+
+    @property
+    def available(self):
+        return helper.has_module('pyarrow')
+
+    def _key(self, schema, date_dict):
+        return {'version': SNAPSHOT_VERSION, 'table': self.table, 'schema': schema, 'date_dict': date_dict,
+                'compact': self.compact}
+
+    def load(self, schema, date_dict):
+        """
+        Load the snapshot if it is still valid for this schema/date parsing.
+
+        Keyword arguments:
+        schema -- current table schema from table_schema()
+        date_dict -- Map of columns : date string format the frame was parsed with
+
+        Return:
+        Tuple of (dataframe, watermark string), or (None, None) if there is no usable snapshot
+        """
+        if not self.available or not os.path.exists(self.meta_path) or not os.path.exists(self.data_path):
+            return None, None
+        with open(self.meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get('key') != self._key(schema, date_dict):
+            print('snapshot of {} is stale, rebuilding'.format(self.table))
+            self.invalidate()
+            return None, None
+        from pyarrow import feather
+        arrow_table = feather.read_table(self.data_path, memory_map=True)
+        if arrow_table.num_rows != meta.get('rows'):
+            # the data file and the sidecar got out of step (crash mid-save), don't trust either
+            self.invalidate()
+            return None, None
+        return arrow_table.to_pandas(split_blocks=True), meta['watermark']
+
+    def save(self, df, watermark, schema, date_dict):
+        """write df as the new snapshot. data is written to temp files and renamed, so readers never see half of it"""
+        if not self.available:
+            return
+        from pyarrow import feather
+        helper.direc_check(self.directory)
+        data_tmp = self.data_path + '.tmp'
+        meta_tmp = self.meta_path + '.tmp'
+        feather.write_feather(df.reset_index(drop=True), data_tmp, compression='uncompressed')
+        with open(meta_tmp, 'w') as meta_file:
+            json.dump({'key': self._key(schema, date_dict), 'rows': len(df), 'watermark': watermark}, meta_file,
+                      default=str)
+        os.replace(data_tmp, self.data_path)
+        os.replace(meta_tmp, self.meta_path)
+
+    def invalidate(self):
+        """delete the snapshot so the next load reads the whole table again"""
+        for path in (self.data_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,309 @@
+"""
+This is the stats module of expd_analytics.
+Online statistics of a column that get updated with each batch of new rows: Welford mean/variance, min/max, and
+a log bucketed quantile sketch for the median and MAD, overall or per key (case_id). Sigma band and robust z
+masks come from the kept state instead of a pass over the whole column.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+# relative error of the sketch's quantiles
+DEFAULT_ACCURACY = 0.01
+# values closer to 0 than this all go into the 0 bucket
+MIN_INDEXED = 1e-9
+# MAD of a normal distribution is 0.6745 standard deviations
+MAD_SCALE = 0.6745
+
+
+def _values(values):
+    """float64 array of values without the missing ones"""
+    values = np.asarray(pd.Series(values).to_numpy(dtype=np.float64, na_value=np.nan))
+    return values[~np.isnan(values)]
+
+
+def bucket_values(values, accuracy=DEFAULT_ACCURACY):
+    """
+    The representative value of the sketch bucket each value falls in. Buckets grow geometrically, so every value
+    is within accuracy (relative) of its representative, whatever its magnitude.
+    """
+    gamma = (1 + accuracy) / (1 - accuracy)
+    magnitude = np.abs(values)
+    indexed = magnitude >= MIN_INDEXED
+    buckets = np.zeros(len(values))
+    index = np.ceil(np.log(magnitude[indexed]) / np.log(gamma))
+    buckets[indexed] = np.sign(values[indexed]) * 2 * gamma ** index / (gamma + 1)
+    return buckets
+
+
+def weighted_quantile(keys, values, counts, q):
+    """
+    q quantile of values weighted by counts within each key, as a series indexed by key.
+    Uses the lower of the two middle values, like a sketch can only give one of its buckets.
+    """
+    table = pd.DataFrame({'key': keys, 'value': values, 'count': counts})
+    table = table[table['count'] > 0].sort_values(['key', 'value'], kind='stable')
+    cumulative = table.groupby('key', sort=False)['count'].cumsum()
+    totals = table.groupby('key', sort=False)['count'].transform('sum')
+    past = table[cumulative > q * (totals - 1)]
+    return past.groupby('key', sort=False)['value'].first()
+
+
+def robust_z(values, median, mad):
+    """MAD_SCALE * (values - median) / mad. with a MAD of 0, values at the median score 0 and the rest inf"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = MAD_SCALE * (values - median) / mad
+    return np.where((mad == 0) & (values == median), 0.0, z)
+
+
+class RunningStats:
+    """Welford/Chan count, mean, sum of squared deviations, min and max of a column, updated one batch at a time.
+
+    Mergeable, so stats of separate chunks or partitions can be combined. std is the sample standard deviation,
+    like pandas.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = np.nan
+        self.m2 = 0.0
+        self.min = np.nan
+        self.max = np.nan
+
+    def update(self, values):
+        values = _values(values)
+        if not len(values):
+            return
+        batch = RunningStats()
+        batch.count = len(values)
+        batch.mean = values.mean()
+        batch.m2 = ((values - batch.mean) ** 2).sum()
+        batch.min = values.min()
+        batch.max = values.max()
+        self.merge(batch)
+
+    def merge(self, other):
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def var(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+
+class QuantileSketch:
+    """Approximate quantiles of a column: a count per log sized bucket (DDSketch style).
+
+    Every quantile is within accuracy (relative) of a value that really is at that rank. Memory is the number of
+    distinct buckets, a few hundred for durations from milliseconds to hours. Mergeable.
+    """
+    def __init__(self, accuracy=DEFAULT_ACCURACY):
+        self.accuracy = accuracy
+        self.counts = pd.Series(dtype=np.float64)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def update(self, values):
+        values = _values(values)
+        if not len(values):
+            return
+        batch = pd.Series(bucket_values(values, self.accuracy)).value_counts().astype(np.float64)
+        self.counts = self.counts.add(batch, fill_value=0) if len(self.counts) else batch
+
+    def merge(self, other):
+        self.counts = self.counts.add(other.counts, fill_value=0) if len(self.counts) else other.counts.copy()
+
+    def quantile(self, q):
+        if not len(self.counts):
+            return np.nan
+        return weighted_quantile(np.zeros(len(self.counts)), self.counts.index.to_numpy(), self.counts.to_numpy(),
+                                 q).iloc[0]
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+    @property
+    def mad(self):
+        """median absolute deviation from the median"""
+        if not len(self.counts):
+            return np.nan
+        deviations = np.abs(self.counts.index.to_numpy() - self.median)
+        return weighted_quantile(np.zeros(len(deviations)), deviations, self.counts.to_numpy(), 0.5).iloc[0]
+
+
+class ColumnStats:
+    """RunningStats and a QuantileSketch of one column, with the masks built from them"""
+    def __init__(self, accuracy=DEFAULT_ACCURACY):
+        self.running = RunningStats()
+        self.sketch = QuantileSketch(accuracy)
+
+    def update(self, values):
+        self.running.update(values)
+        self.sketch.update(values)
+
+    def merge(self, other):
+        self.running.merge(other.running)
+        self.sketch.merge(other.sketch)
+
+    @property
+    def count(self):
+        return self.running.count
+
+    @property
+    def mean(self):
+        return self.running.mean
+
+    @property
+    def std(self):
+        return self.running.std
+
+    @property
+    def min(self):
+        return self.running.min
+
+    @property
+    def max(self):
+        return self.running.max
+
+    @property
+    def median(self):
+        return self.sketch.median
+
+    @property
+    def mad(self):
+        return self.sketch.mad
+
+    def sigma_mask(self, values, sigma):
+        """mask of values within sigma standard deviations of the mean"""
+        return np.abs(values - self.mean) <= sigma * self.std
+
+    def robust_z(self, values):
+        """(value - median) / MAD, scaled so it matches the z score of normally distributed values"""
+        z = robust_z(values, self.median, self.mad)
+        return pd.Series(z, index=values.index) if isinstance(values, pd.Series) else z
+
+    def robust_mask(self, values, threshold=3.5):
+        """mask of values with a robust z score within threshold"""
+        return np.abs(self.robust_z(values)) <= threshold
+
+
+class KeyedStats:
+    """Running mean/std/min/max and quantile sketches of value_col per value of key, updated a batch at a time.
+
+    Keyword arguments:
+    key -- column to keep separate stats for (default case_id)
+    value_col -- column the stats are of (default case_duration)
+    accuracy -- relative error of the medians/MADs (default DEFAULT_ACCURACY)
+
+    Every update is a few groupbys of the new rows, merged into the per key tables. The masks line each row up with
+    its key's stats, so an outlier is judged against its own case, not against every other case's durations.
+    """
+    def __init__(self, key='case_id', value_col='case_duration', accuracy=DEFAULT_ACCURACY):
+        self.key = key
+        self.value_col = value_col
+        self.accuracy = accuracy
+        self.moments = pd.DataFrame(columns=['count', 'mean', 'm2', 'min', 'max'], dtype=np.float64)
+        self.buckets = pd.Series(dtype=np.float64)
+        self._quantiles = None
+
+    def update(self, df):
+        """fold a batch of rows into the per key stats"""
+        values = df[self.value_col].astype(np.float64)
+        valid = values.notna().to_numpy() & df[self.key].notna().to_numpy()
+        if not valid.any():
+            return
+        keys = df[self.key].to_numpy(dtype=object)[valid]
+        values = values.to_numpy()[valid]
+        grouped = pd.Series(values).groupby(keys)
+        batch = pd.DataFrame({'count': grouped.count().astype(np.float64), 'mean': grouped.mean(),
+                              'm2': grouped.var(ddof=0) * grouped.count(), 'min': grouped.min(),
+                              'max': grouped.max()})
+        self.moments = self._merge_moments(self.moments, batch)
+        batch_buckets = pd.Series(1.0, index=pd.MultiIndex.from_arrays(
+            [keys, bucket_values(values, self.accuracy)])).groupby(level=[0, 1]).sum()
+        self.buckets = self.buckets.add(batch_buckets, fill_value=0) if len(self.buckets) else batch_buckets
+        self._quantiles = None
+
+    def merge(self, other):
+        self.moments = self._merge_moments(self.moments, other.moments)
+        self.buckets = self.buckets.add(other.buckets, fill_value=0) if len(self.buckets) else other.buckets.copy()
+        self._quantiles = None
+
+    @staticmethod
+    def _merge_moments(left, right):
+        """Chan's parallel combination of two per key moment tables"""
+        if left.empty:
+            return right
+        keys = left.index.union(right.index)
+        left = left.reindex(keys)
+        right = right.reindex(keys)
+        left_count = left['count'].fillna(0)
+        right_count = right['count'].fillna(0)
+        count = left_count + right_count
+        delta = (right['mean'] - left['mean']).fillna(0)
+        mean = left['mean'].fillna(0) + delta * right_count / count
+        mean = mean.where(left_count > 0, right['mean'])
+        m2 = left.m2.fillna(0) + right.m2.fillna(0) + delta ** 2 * left_count * right_count / count
+        return pd.DataFrame({'count': count, 'mean': mean, 'm2': m2,
+                             'min': np.fmin(left['min'], right['min']), 'max': np.fmax(left['max'], right['max'])})
+
+    @property
+    def stats(self):
+        """dataframe by key of count, mean, std, min, max, median and mad"""
+        moments = self.moments
+        std = np.sqrt(moments.m2 / (moments['count'] - 1).where(moments['count'] > 1))
+        table = pd.DataFrame({'count': moments['count'], 'mean': moments['mean'], 'std': std,
+                              'min': moments['min'], 'max': moments['max']})
+        return table.join(self._median_mad())
+
+    def _median_mad(self):
+        if self._quantiles is None:
+            if not len(self.buckets):
+                self._quantiles = pd.DataFrame(columns=['median', 'mad'], dtype=np.float64)
+                return self._quantiles
+            keys = self.buckets.index.get_level_values(0).to_numpy()
+            values = self.buckets.index.get_level_values(1).to_numpy()
+            counts = self.buckets.to_numpy()
+            median = weighted_quantile(keys, values, counts, 0.5)
+            deviations = np.abs(values - median.reindex(keys).to_numpy())
+            mad = weighted_quantile(keys, deviations, counts, 0.5)
+            self._quantiles = pd.DataFrame({'median': median, 'mad': mad})
+        return self._quantiles
+
+    def _per_row(self, df):
+        """the stats of each row's key, and the row's values"""
+        per_row = self.stats.reindex(df[self.key].to_numpy(dtype=object))
+        return per_row, df[self.value_col].astype(np.float64).to_numpy()
+
+    def sigma_mask(self, df, sigma):
+        """mask of df's rows within sigma standard deviations of their key's mean"""
+        per_row, values = self._per_row(df)
+        mask = np.abs(values - per_row['mean'].to_numpy()) <= sigma * per_row['std'].to_numpy()
+        return pd.Series(mask, index=df.index)
+
+    def robust_z(self, df):
+        """robust z score of df's rows against their key's median/MAD"""
+        per_row, values = self._per_row(df)
+        return pd.Series(robust_z(values, per_row['median'].to_numpy(), per_row['mad'].to_numpy()), index=df.index)
+
+    def robust_mask(self, df, threshold=3.5):
+        """mask of df's rows with a robust z score within threshold of their key's"""
+        return self.robust_z(df).abs() <= threshold
@@ -0,0 +1,194 @@
+"""
+This is the stream module of expd_analytics.
+Out of core analysis of tables that don't fit in memory: the table is read in chunks that flow through a generator
+pipeline (prune -> drop totally failed runs -> numeric columns) into mergeable statistics, so only one chunk and
+the statistics are ever held at once.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+import _aggregate
+import _data
+import _loader
+import _stats
+import helper
+
+sa = helper.lazy_import('sqlalchemy')
+
+DEFAULT_CHUNK_ROWS = 100000
+
+
+def iter_chunks(sql_table, disk_engine, date_dict=None, chunksize=DEFAULT_CHUNK_ROWS, columns=None):
+    """
+    Yield the rows of sql_table as dataframes of up to chunksize rows, streamed from the database cursor.
+
+    Keyword arguments:
+    sql_table -- table name
+    disk_engine -- sqlalchemy engine
+    date_dict -- Map of columns : date string format to parse into type(pd.Timestamp) (default None). Values that
+        don't match raise ValueError, like a full load (see _loader.parse_dates)
+    chunksize -- rows per chunk (default DEFAULT_CHUNK_ROWS)
+    columns -- only read these columns (default all)
+    """
+    if columns is None:
+        query = sa.select(sa.literal_column('*')).select_from(sa.table(sql_table))
+    else:
+        query = sa.select(*[sa.column(col) for col in columns]).select_from(sa.table(sql_table))
+    parse_dates = {col: fmt for col, fmt in (date_dict or {}).items() if columns is None or col in columns}
+    with disk_engine.connect() as connection:
+        connection = connection.execution_options(stream_results=True)
+        for chunk in pd.read_sql_query(query, connection, chunksize=chunksize):
+            yield _loader.parse_dates(chunk, parse_dates)
+
+
+def pruned(chunks, regex_list):
+    """stage: drop the rows whose case_action matches any of regex_list (see _data.prune)"""
+    for chunk in chunks:
+        yield _data.prune(chunk, regex_list)
+
+
+def without_failed_runs(chunks, passing_runs):
+    """stage: keep the rows of runs in passing_runs, the set from find_passing_runs"""
+    for chunk in chunks:
+        yield chunk[chunk.group_uuid.isin(passing_runs)]
+
+
+def with_numeric_cols(chunks, time_col='case_timestamp'):
+    """stage: add numeric_status and date_int (no dummy columns, to keep chunks small)"""
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        yield pd.concat([chunk, _data.numeric_status_frame(chunk, dummies=False),
+                         pd.DataFrame({'date_int': _data.date_integer(chunk[time_col])})], axis=1)
+
+
+def find_passing_runs(sql_table, disk_engine, regex_list=(), chunksize=DEFAULT_CHUNK_ROWS):
+    """
+    First pass for the failed run filter: the group_uuids with at least one case that didn't fail/skip once
+    regex_list is pruned, the same runs _data.remove_totally_failed_tests keeps after a clean.
+    Only group_uuid, case_status and case_action are read.
+    """
+    passing_runs = set()
+    chunks = iter_chunks(sql_table, disk_engine, chunksize=chunksize,
+                         columns=['group_uuid', 'case_status', 'case_action'])
+    for chunk in pruned(chunks, list(regex_list)):
+        _data.remove_totally_failed_tests(chunk, passing_runs)
+    return passing_runs
+
+
+class _UniqueMeans:
+    """mergeable create_mean_col_from_unique_vals: sum/count of mean_col and first include value per unique value"""
+    def __init__(self, mean_col, unique_col, include=None):
+        self.mean_col = mean_col
+        self.unique_col = unique_col
+        self.include = include
+        self.table = None
+
+    def update(self, chunk):
+        values = chunk[self.mean_col].astype(np.float64)
+        parts = {'sum': values.fillna(0), 'count': values.notna()}
+        if self.include:
+            parts[self.include] = chunk[self.include]
+        grouped = pd.DataFrame(parts, index=chunk.index).groupby(
+            chunk[self.unique_col].to_numpy(dtype=object), sort=False, dropna=False)
+        partial = grouped[['sum', 'count']].sum()
+        if self.include:
+            partial[self.include] = grouped[self.include].first()
+        self.merge_table(partial)
+
+    def merge_table(self, partial):
+        """fold in the sum/count(/include) table of later rows"""
+        if self.table is None:
+            self.table = partial
+            return
+        # groupby(sort=False) keeps the order values first showed up in, so older values stay first
+        combined = pd.concat([self.table, partial]).groupby(level=0, sort=False, dropna=False)
+        merged = combined[['sum', 'count']].sum()
+        if self.include:
+            merged[self.include] = combined[self.include].first()
+        self.table = merged
+
+    def result(self, as_frame=False):
+        """same shape of result as _data.create_mean_col_from_unique_vals over all the chunks"""
+        table = self.table if self.table is not None else pd.DataFrame(columns=['sum', 'count'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = table['sum'].to_numpy(dtype=np.float64) / table['count'].to_numpy(dtype=np.float64)
+        stats = pd.DataFrame({self.mean_col: means}, index=pd.Index(table.index, name=self.unique_col))
+        if self.include:
+            stats[self.include] = table[self.include].to_numpy()
+        if as_frame:
+            return stats
+        mean_col_by_unique_col = {self.mean_col: list(stats[self.mean_col]), self.unique_col: list(stats.index),
+                                  'index': list(range(len(stats)))}
+        if self.include:
+            mean_col_by_unique_col[self.include] = list(stats[self.include])
+        return mean_col_by_unique_col
+
+
+class StreamReport:
+    """Full history statistics built one chunk at a time.
+
+    Keyword arguments:
+    means -- (mean_col, unique_col, include) tuples to keep create_mean_col_from_unique_vals results for
+        (default case_duration by case_id, with case_service_name)
+    moment_cols -- columns to keep the mean/std of, for sigma bands (default case_duration)
+
+    update() every chunk (with numeric_status), or merge() reports built from separate parts of the table.
+    """
+    def __init__(self, means=(('case_duration', 'case_id', 'case_service_name'),), moment_cols=('case_duration',)):
+        self.store = _aggregate.AggregateStore()
+        self.means = {(mean_col, unique_col): _UniqueMeans(mean_col, unique_col, include)
+                      for mean_col, unique_col, include in means}
+        self.moments = {col: _stats.RunningStats() for col in moment_cols}
+        self.rows = 0
+        self.chunks = 0
+
+    def update(self, chunk):
+        if chunk.empty:
+            return
+        self.store.update(chunk)
+        for unique_means in self.means.values():
+            unique_means.update(chunk)
+        for col, moments in self.moments.items():
+            moments.update(chunk[col])
+        self.rows += len(chunk)
+        self.chunks += 1
+
+    def consume(self, chunks):
+        for chunk in chunks:
+            self.update(chunk)
+        return self
+
+    def merge(self, other):
+        """fold in a report of later rows of the table"""
+        self.store.merge(other.store)
+        for key, unique_means in other.means.items():
+            if unique_means.table is not None:
+                self.means[key].merge_table(unique_means.table)
+        for col, moments in other.moments.items():
+            self.moments[col].merge(moments)
+        self.rows += other.rows
+        self.chunks += other.chunks
+
+    def highest_failures_by_groupby_count(self, key, count):
+        return _data.highest_failures_by_groupby_count(self.store.groupby(key), count)
+
+    def highest_failures_by_df_stdev(self, groupby_key, sigma=0):
+        return _data.highest_failures_by_df_stdev(None, groupby_key, sigma, store=self.store)
+
+    def mean_from_unique_vals(self, mean_col, unique_col, as_frame=False):
+        return self.means[(mean_col, unique_col)].result(as_frame)
+
+    def norm_bounds(self, col, sigma):
+        """(low, high) of the values within sigma standard deviations of col's mean over all rows"""
+        moments = self.moments[col]
+        return moments.mean - sigma * moments.std, moments.mean + sigma * moments.std
+
+
+def in_norm(chunks, col, bounds):
+    """stage for a second pass: keep the rows with col inside bounds, from StreamReport.norm_bounds"""
+    low, high = bounds
+    for chunk in chunks:
+        yield chunk[(chunk[col] >= low) & (chunk[col] <= high)]
@@ -0,0 +1,249 @@
+"""
+This is the worker module of expd_analytics.
+A long lived process that keeps a cleaned TestResult in memory, refreshes it on the scheduler, and answers report
+and export requests over a Unix socket, so a query costs a groupby (or a cache hit) instead of a database load.
+The client side is _client.request (and the commands of cli.py).
+"""
+
+
+import json
+import os
+import signal
+import socketserver
+import threading
+import time
+import traceback
+
+import pandas as pd
+
+import _client
+import _data
+import _scheduler
+import helper
+import pn_analyze
+
+DEFAULT_REFRESH_INTERVAL = 300
+AGGREGATION = {'case_duration': [('mean_duration', 'mean')]}
+
+
+def highest_failures(df, groupby_key='case_id', sigma=1.8):
+    return _data.highest_failures_by_df_stdev(df, groupby_key, sigma)
+
+
+def endpoints_v_duration(df, endpoints=None):
+    by_endpoint = _data.endpoints_v_duration(df, endpoints, as_frame=True)
+    if not by_endpoint:
+        return pd.DataFrame()
+    return pd.concat(by_endpoint, names=['case_endpoint'])
+
+
+def longest_case_over_time(df, aggregation=None):
+    return _data.return_longest_case_over_time(df, aggregation or AGGREGATION)
+
+
+def mean_by(df, unique_col='case_id', mean_col='case_duration'):
+    return _data.create_mean_col_from_unique_vals(df, mean_col, unique_col, as_frame=True)
+
+
+def latest_run(df):
+    return df[df.group_uuid == _data.return_guuid_latest(df)]
+
+
+# name : function of the frame and keyword arguments, what AnyData.query and AnyData.export take
+REPORTS = {
+    'highest_failures': highest_failures,
+    'endpoints_v_duration': endpoints_v_duration,
+    'longest_case_over_time': longest_case_over_time,
+    'mean_by': mean_by,
+    'latest_run': latest_run,
+}
+
+
+def encode_result(value):
+    """
+    json-able form of a report result: frames (and series) as {'kind': 'frame', 'columns', 'index', 'data'} like
+    to_json(orient='split') gives, anything else as {'kind': 'value', 'value'}
+    """
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    if isinstance(value, pd.DataFrame):
+        if isinstance(value.columns, pd.MultiIndex):
+            value = value.set_axis(['_'.join(map(str, col)) for col in value.columns], axis=1)
+        encoded = json.loads(value.to_json(orient='split', date_format='iso', default_handler=str))
+        encoded['index_names'] = [str(name) if name is not None else '' for name in value.index.names]
+        encoded['kind'] = 'frame'
+        return encoded
+    return {'kind': 'value', 'value': json.loads(json.dumps(value, default=str))}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        started = time.perf_counter()
+        try:
+            message = json.loads(line)
+            response = {'ok': True, 'result': self.server.worker.handle(message.pop('command', None), **message)}
+        except Exception as exc:
+            response = {'ok': False, 'error': '{}: {}'.format(type(exc).__name__, exc)}
+            if not isinstance(exc, (KeyError, TypeError, ValueError)):
+                traceback.print_exc()
+        response['seconds'] = time.perf_counter() - started
+        self.wfile.write(json.dumps(response, default=str).encode() + b'\n')
+        # only once the answer is out, the process can exit as soon as the shutdown starts
+        if self.server.worker.stop_requested:
+            self.server.worker.stop()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Worker:
+    """A TestResult kept warm for the client commands.
+
+    Keyword arguments:
+    test_result -- TestResult to serve. it is loaded by start() if it has no data yet
+    socket_path -- Unix socket to listen on (default _client.default_socket_path())
+    refresh_interval -- seconds between refresh_metrics runs, 0 never refreshes (default DEFAULT_REFRESH_INTERVAL)
+    strict -- load with strict_startup instead of startup (default True)
+
+    Reports go through test_result.query, so asking again before the next refresh changes the data is a cache hit.
+    Requests and refreshes take turns on one lock.
+    """
+    def __init__(self, test_result, socket_path=None, refresh_interval=DEFAULT_REFRESH_INTERVAL, strict=True):
+        self.test_result = test_result
+        self.socket_path = socket_path or _client.default_socket_path()
+        self.refresh_interval = refresh_interval
+        self.strict = strict
+        self.scheduler = _scheduler.ExportScheduler('worker-refresh')
+        self.started_at = None
+        self.last_refresh = None
+        self.refreshed_rows = 0
+        self.requests = 0
+        self.stop_requested = False
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        """load the data if needed, bind the socket and start refreshing. serve_forever() then answers requests"""
+        if self.test_result.df.empty:
+            if self.strict:
+                self.test_result.strict_startup()
+            else:
+                self.test_result.startup()
+        helper.direc_check(os.path.dirname(os.path.abspath(self.socket_path)))
+        self._remove_stale_socket()
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.worker = self
+        # only this user gets to talk to the worker
+        os.chmod(self.socket_path, 0o600)
+        if self.refresh_interval:
+            self.scheduler.register('refresh', self.refresh, self.refresh_interval)
+            self.scheduler.start()
+        self.started_at = time.time()
+        return self
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        try:
+            _client.request('ping', self.socket_path, timeout=1)
+        except OSError:
+            os.remove(self.socket_path)
+            return
+        raise RuntimeError('a worker is already listening on {}'.format(self.socket_path))
+
+    def serve_forever(self):
+        """answer requests until stop() (the stop command, SIGTERM or ctrl-c)"""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def stop(self):
+        # shutdown waits for serve_forever to return, so it can't run on a handler's (or the signal's) stack
+        server = self._server
+        if server is not None:
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    def close(self):
+        self.scheduler.stop()
+        if self._server is not None:
+            self._server.server_close()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        terminate_dump = getattr(self.test_result, '_terminate_dump', None)
+        if terminate_dump is not None and self.test_result.writing_to_csv:
+            terminate_dump()
+
+    def refresh(self):
+        """pull the rows newer than the data in, returns how many were appended"""
+        with self._lock:
+            appended = self.test_result.refresh_metrics()
+            self.last_refresh = time.time()
+            self.refreshed_rows += appended
+        if appended:
+            print('worker refresh appended {} rows'.format(appended))
+        return appended
+
+    def status(self):
+        test_result = self.test_result
+        latest = test_result._latest
+        return {'pid': os.getpid(), 'rows': len(test_result.df), 'data_version': test_result.data_version,
+                'latest': str(latest) if latest is not None else None, 'started_at': self.started_at,
+                'last_refresh': self.last_refresh, 'refreshed_rows': self.refreshed_rows, 'requests': self.requests,
+                'refresh_interval': self.refresh_interval, 'queries': test_result.queries.stats,
+                'reports': sorted(REPORTS)}
+
+    def handle(self, command, **params):
+        """the result of one request, raises KeyError/TypeError/ValueError on a bad one"""
+        self.requests += 1
+        if command == 'ping':
+            return 'pong'
+        if command == 'status':
+            return self.status()
+        if command == 'reports':
+            return sorted(REPORTS)
+        if command == 'refresh':
+            return self.refresh()
+        if command == 'stop':
+            # the handler calls stop() after answering
+            self.stop_requested = True
+            return 'stopping'
+        if command == 'report':
+            report = self._report(params['name'])
+            with self._lock:
+                return encode_result(self.test_result.query(report, **params.get('kwargs', {})))
+        if command == 'export':
+            report = self._report(params['name'])
+            with self._lock:
+                return self.test_result.export(report, params['path'], params.get('kwargs'),
+                                               fmt=params.get('fmt', 'csv'),
+                                               partition_by_day=params.get('partition_by_day', False))
+        raise ValueError('unknown command {}'.format(command))
+
+    @staticmethod
+    def _report(name):
+        if name not in REPORTS:
+            raise KeyError('no report {}, the reports are {}'.format(name, ', '.join(sorted(REPORTS))))
+        return REPORTS[name]
+
+
+def serve(database_url, socket_path=None, refresh_interval=DEFAULT_REFRESH_INTERVAL, strict=True, snapshot_dir=None,
+          partitions=5, compact=False, dump=False):
+    """load the test_result table of database_url and serve it until stopped"""
+    disk_engine = pn_analyze.sa.create_engine(database_url)
+    test_result = pn_analyze.TestResult(disk_engine, writing_to_csv=dump, snapshot_dir=snapshot_dir,
+                                        partitions=partitions, compact=compact)
+    started = time.perf_counter()
+    worker = Worker(test_result, socket_path, refresh_interval, strict).start()
+    print('worker serving {} rows on {} (ready in {:.1f}s)'.format(len(test_result.df), worker.socket_path,
+                                                                     time.perf_counter() - started))
+    worker.serve_forever()
@@ -0,0 +1,103 @@
+"""
+Micro-benchmark of the grouping in _data.create_mean_col_from_unique_vals and _data.endpoint_v_duration against
+the mask-per-unique-value versions they replaced.
+
+    python benchmarks/bench_aggregation.py 100000 1000000 10000000
+
+The old versions are quadratic, so they are only run up to --legacy-max-rows.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import _data
+
+
+def legacy_create_mean_col_from_unique_vals(dataframe, mean_col, unique_col, include=None):
+    mean_col_by_unique_col = {mean_col: [], unique_col: [], 'index': []}
+    ind = 0
+    if include:
+        mean_col_by_unique_col[include] = []
+    for unique_val in dataframe[unique_col].unique():
+        if include:
+            included_value = dataframe[include][dataframe[unique_col] == unique_val].unique()[0]
+            mean_col_by_unique_col[include].append(included_value)
+        mean_col_by_unique_col[unique_col].append(unique_val)
+        mean_val = dataframe[mean_col][dataframe[unique_col] == unique_val].mean()
+        mean_col_by_unique_col[mean_col].append(mean_val)
+        mean_col_by_unique_col['index'].append(ind)
+        ind += 1
+    return mean_col_by_unique_col
+
+
+def legacy_endpoint_v_duration(dataframe, endpoint):
+    server_specific_dframe = dataframe[dataframe.case_endpoint.str.contains(endpoint)]
+    guids = server_specific_dframe.group_uuid.unique()
+    mean_duration = []
+    timestamp = []
+    for uid in guids:
+        uid_df = dataframe[dataframe.group_uuid == uid]
+        mean_duration.append(uid_df.case_duration.mean())
+        timestamp.append(uid_df.iloc[0].case_timestamp)
+    return mean_duration, timestamp
+
+
+def make_frame(rows, cases=500, runs_per_million=2000, seed=0):
+    """just the columns the two functions touch, with roughly PYNET-like cardinalities"""
+    rng = np.random.default_rng(seed)
+    n_runs = max(10, rows * runs_per_million // 1000000)
+    run_ids = np.sort(rng.integers(0, n_runs, rows))
+    case_ids = rng.integers(0, cases, rows)
+
+    def labels(fmt, count, picks):
+        return np.array([fmt.format(i) for i in range(count)], dtype=object)[picks]
+
+    return pd.DataFrame({
+        'case_id': labels('case_{}', cases, case_ids),
+        # one service per case, so it can be passed as include
+        'case_service_name': labels('svc_{}', cases, case_ids % 37),
+        'case_endpoint': labels('qacombo{:03d}', 20, rng.integers(0, 20, rows)),
+        'group_uuid': labels('{:032x}', n_runs, run_ids),
+        'case_duration': rng.lognormal(0, 1, rows),
+        'case_timestamp': pd.Timestamp('2016-01-01') + pd.to_timedelta(run_ids * 600, unit='s'),
+    })
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rows', nargs='*', type=int, default=[100000, 1000000, 10000000])
+    parser.add_argument('--legacy-max-rows', type=int, default=1000000)
+    args = parser.parse_args(argv)
+    print('{:>10} {:<34} {:>10} {:>10} {:>9}'.format('rows', 'function', 'legacy s', 'new s', 'speedup'))
+    for rows in args.rows:
+        frame = make_frame(rows)
+        cases = [
+            ('create_mean_col_from_unique_vals', legacy_create_mean_col_from_unique_vals,
+             _data.create_mean_col_from_unique_vals, ('case_duration', 'case_id', 'case_service_name')),
+            ('endpoint_v_duration', legacy_endpoint_v_duration, _data.endpoint_v_duration, ('qacombo007',)),
+        ]
+        for name, legacy, new, func_args in cases:
+            new_s = timed(new, frame, *func_args)
+            if rows <= args.legacy_max_rows:
+                legacy_s = timed(legacy, frame, *func_args)
+                print('{:>10} {:<34} {:>10.3f} {:>10.3f} {:>8.1f}x'.format(rows, name, legacy_s, new_s,
+                                                                        legacy_s / new_s))
+            else:
+                print('{:>10} {:<34} {:>10} {:>10.3f} {:>9}'.format(rows, name, 'skipped', new_s, '-'))
+
+
+if __name__ == '__main__':
+    main()
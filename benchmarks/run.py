@@ -0,0 +1,223 @@
+"""
+Benchmark suite for the analytics hot paths, run against synthetic PYNET databases (see synthetic.py).
+
+    python benchmarks/run.py --rows 10000 100000 1000000
+
+Every benchmark is timed (best of --repeat) and then run once more under tracemalloc for its peak memory. The import
+benchmarks (rows 0) time importing a module in a fresh interpreter, their peak is that interpreter's peak RSS. Results
+are appended to a JSON history (default benchmarks/history.json), and each one is printed next to the last
+recorded result of the same benchmark and size, so regressions show up.
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import _data
+import _graphs
+import pn_analyze
+import synthetic
+
+# modules an import benchmark reports if they got loaded, the data-only entry points shouldn't load these
+HEAVY_MODULES = ('matplotlib', 'matplotlib.pyplot', 'sqlalchemy', 'pyarrow')
+IMPORTS = ('pn_analyze', '_graphs')
+IMPORT_PROBE = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+# a module helper.lazy_import hasn't really loaded yet is still a _LazyModule
+loaded = [name for name in {heavy!r} if type(sys.modules.get(name)).__name__ not in ('NoneType', '_LazyModule')]
+# ru_maxrss would carry over the benchmark process' peak through exec, the high water mark of /proc doesn't
+with open('/proc/self/status') as status:
+    peak_kb = next(int(line.split()[1]) for line in status if line.startswith('VmHWM'))
+print(seconds, peak_kb, ','.join(loaded))
+'''
+PRUNE_PATTERNS = [pn_analyze.REGEX_PATTERN_GCI, pn_analyze.REGEX_PATTERN_DB_ID]
+AGGREGATION = {'case_duration': [('mean_duration', 'mean')]}
+
+
+def loaded(disk_engine):
+    """a TestResult with the table loaded, nothing else"""
+    test_result = pn_analyze.TestResult(disk_engine, writing_to_csv=False)
+    test_result.load_up_initial_db(pn_analyze.TIMESTAMP_PARSE_DICT)
+    return test_result
+
+
+def started(disk_engine):
+    test_result = pn_analyze.TestResult(disk_engine, writing_to_csv=False)
+    test_result.strict_startup()
+    return test_result
+
+
+def cold_prune(df):
+    # a fresh pruner, so every run matches the patterns from scratch
+    _data._pruners.clear()
+    return _data.prune(df, PRUNE_PATTERNS)
+
+
+def suite(disk_engine):
+    """
+    (name, setup, benchmark) of every benchmark: setup() runs untimed and builds what benchmark(setup result) needs.
+    setups are shared, so the table is loaded once per size.
+    """
+    cache = {}
+
+    def shared(name, build):
+        def setup():
+            if name not in cache:
+                cache[name] = build()
+            return cache[name]
+        return setup
+
+    raw = shared('raw', lambda: loaded(disk_engine).df)
+    pruned = shared('pruned', lambda: cold_prune(raw()))
+    ready = shared('ready', lambda: started(disk_engine))
+    return [
+        ('load', lambda: disk_engine, loaded),
+        ('strict_startup', lambda: disk_engine, started),
+        ('prune', raw, cold_prune),
+        ('remove_totally_failed_tests', pruned, _data.remove_totally_failed_tests),
+        ('create_mean_col_from_unique_vals', ready,
+         lambda test_result: _data.create_mean_col_from_unique_vals(test_result.df, 'case_duration', 'case_id',
+                                                                     'case_service_name')),
+        ('endpoints_v_duration', ready, lambda test_result: _data.endpoints_v_duration(test_result.df)),
+        ('highest_failures_by_df_stdev', ready,
+         lambda test_result: _data.highest_failures_by_df_stdev(test_result.df, 'case_id', sigma=1.8)),
+        ('highest_failures_from_store', ready,
+         lambda test_result: _data.highest_failures_by_df_stdev(test_result.df, 'case_id', sigma=1.8,
+                                                                store=test_result.aggregates)),
+        ('return_longest_case_over_time', ready,
+         lambda test_result: _data.return_longest_case_over_time(test_result.df, AGGREGATION)),
+        ('date_masks', ready, lambda test_result: (test_result.today, test_result.this_month, test_result.this_year)),
+        ('date_masks_scan', ready,
+         lambda test_result: (_data.this_month(test_result.df, 'case_timestamp'),
+                              _data.this_year(test_result.df, 'case_timestamp'))),
+        ('plot_string_2d', ready,
+         lambda test_result: _graphs.plot_string_2d(test_result.df.case_id, test_result.df.case_duration, 70,
+                                                    headless=True).canvas.draw()),
+    ]
+
+
+def measure_import(module, repeat):
+    """(best seconds of repeat imports of module in a fresh interpreter, its peak RSS in bytes, heavy modules loaded)"""
+    probe = IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', probe], cwd=os.path.dirname(BENCH_DIR)).decode()
+        seconds, peak_kb, loaded = (output.strip().splitlines()[-1].split(' ') + [''])[:3]
+        timings.append(float(seconds))
+    return min(timings), int(peak_kb) * 1024, [name for name in loaded.split(',') if name]
+
+
+def measure(setup, benchmark, repeat):
+    """(best seconds of repeat runs, peak bytes allocated during one more run)"""
+    argument = setup()
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        benchmark(argument)
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        benchmark(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as history_file:
+        return json.load(history_file)
+
+
+def write_history(path, history):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as history_file:
+        json.dump(history, history_file, indent=1)
+    os.replace(tmp_path, path)
+
+
+def last_result(history, name, rows):
+    for record in reversed(history):
+        if record['name'] == name and record['rows'] == rows:
+            return record
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', nargs='*', type=int, default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help='names of the benchmarks to run (default all)')
+    parser.add_argument('--db-dir', default=os.path.join(tempfile.gettempdir(), 'expd-benchmarks'),
+                        help='where the synthetic databases are kept between runs')
+    parser.add_argument('--history', default=os.path.join(BENCH_DIR, 'history.json'))
+    parser.add_argument('--no-history', action='store_true', help="don't record this run")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    history = read_history(args.history)
+    run = {'run_at': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+           'python': platform.python_version(), 'pandas': pd.__version__}
+    # the data ends today, so the date masks have rows to find
+    start = (pd.Timestamp.now().normalize() - pd.Timedelta(days=365)).strftime('%Y-%m-%d')
+    print('{:>9} {:<34} {:>9} {:>9} {:>10} {:>9}'.format('rows', 'benchmark', 'seconds', 'previous', 'peak MB',
+                                                         'previous'))
+    results = []
+
+    def report(name, rows, seconds, peak, note=''):
+        previous = last_result(history, name, rows)
+        print('{:>9} {:<34} {:>9.3f} {:>9} {:>10.1f} {:>9} {}'.format(
+            rows, name, seconds, '{:.3f}'.format(previous['seconds']) if previous else '-', peak / 2 ** 20,
+            '{:.1f}'.format(previous['peak_bytes'] / 2 ** 20) if previous else '-', note).rstrip())
+        results.append(dict(run, name=name, rows=rows, seconds=seconds, peak_bytes=peak))
+
+    for module in IMPORTS:
+        name = 'import ' + module
+        if args.only and name not in args.only:
+            continue
+        seconds, peak, loaded = measure_import(module, args.repeat)
+        report(name, 0, seconds, peak, 'loads ' + ', '.join(loaded) if loaded else '')
+    for rows in args.rows:
+        path = os.path.join(args.db_dir, 'test_result-{}-{}.db'.format(rows, start))
+        disk_engine = synthetic.synthetic_db(rows, path, start=start)
+        for name, setup, benchmark in suite(disk_engine):
+            if args.only and name not in args.only:
+                continue
+            seconds, peak = measure(setup, benchmark, args.repeat)
+            report(name, rows, seconds, peak)
+        disk_engine.dispose()
+    if not args.no_history:
+        write_history(args.history, history + results)
+    return results
+
+
+if __name__ == '__main__':
+    main()
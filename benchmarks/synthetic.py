@@ -0,0 +1,144 @@
+"""
+Synthetic PYNET test_result data, for benchmarks and trying things out without a live PYNET database.
+
+    python benchmarks/synthetic.py 1000000 /tmp/pynet-1m.db
+
+Runs of a few hundred cases each hit one endpoint. Durations are lognormal per case with a tail of huge outliers,
+some runs fail completely, and some case actions look like GCI runs or carry 15 digit database ids, so prune and
+the failed run filter have something to remove.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pn_analyze
+
+DATE_FMT = pn_analyze.TIMESTAMP_PARSE_DICT['case_timestamp']
+# lower case on purpose: REGEX_PATTERN_GCI matches any capitalized word of 6 to 8 characters
+ACTIONS = ('get shipment', 'post booking', 'put invoice', 'get tracking', 'delete draft', 'search orders',
+           'get customs status', 'post document', 'get rates', 'login', 'logout', 'get profile')
+STATUSES = np.array(['passed', 'failed', 'skipped', 'running'], dtype=object)
+
+
+def _hex_ids(rng, count, digits=32):
+    """count random lower case hex ids"""
+    high = rng.integers(0, 2 ** 63, count)
+    low = rng.integers(0, 2 ** 63, count)
+    return np.array(['{:016x}{:016x}'.format(a, b)[:digits] for a, b in zip(high, low)], dtype=object)
+
+
+def _labels(fmt, count):
+    return np.array([fmt.format(i) for i in range(count)], dtype=object)
+
+
+def generate(rows, seed=0, start='2016-01-01', days=365, cases=2000, run_size=250, endpoints=20, services=40,
+             failed_run_rate=0.05, gci_rate=0.03, db_id_rate=0.02, outlier_rate=0.005):
+    """
+    Generate a test_result dataframe, with case_timestamp stored as strings like the PYNET table does.
+
+    Keyword arguments:
+    rows -- number of rows
+    seed -- random seed, the same arguments always give the same frame (default 0)
+    start -- first day of the data (default 2016-01-01)
+    days -- days the runs are spread over (default 365)
+    cases -- distinct case_ids (default 2000)
+    run_size -- mean number of cases per run (default 250)
+    endpoints -- distinct case_endpoints, a few of them IPs (default 20)
+    services -- distinct case_service_names (default 40)
+    failed_run_rate -- share of runs where every case failed (default 0.05)
+    gci_rate -- share of rows with a GCI looking case_action (default 0.03)
+    db_id_rate -- share of rows with a 15 digit database id in the case_action (default 0.02)
+    outlier_rate -- share of rows with a huge duration (default 0.005)
+    """
+    rng = np.random.default_rng(seed)
+    runs = max(1, rows // run_size)
+    run_of_row = np.sort(rng.integers(0, runs, rows))
+    run_start = pd.Timestamp(start).value + np.sort(rng.integers(0, days * 86400, runs)) * 10 ** 9
+
+    case_ids = np.array(['{:03d}-{:03d}-{:04d}'.format(i % services, i % 37, i) for i in range(cases)], dtype=object)
+    case_of_row = rng.integers(0, cases, rows)
+    # every case has its own typical duration, skewed so most are quick and a few are slow
+    case_scale = rng.lognormal(0, 1.2, cases)
+    durations = case_scale[case_of_row] * rng.lognormal(0, 0.4, rows)
+    outliers = rng.random(rows) < outlier_rate
+    durations[outliers] *= rng.uniform(50, 500, outliers.sum())
+
+    endpoint_names = np.concatenate([_labels('qacombo{:03d}', endpoints - 3),
+                                     np.array(['10.0.0.{}'.format(i) for i in range(1, 4)], dtype=object)])
+    endpoint_of_run = rng.integers(0, len(endpoint_names), runs)
+
+    statuses = STATUSES[rng.choice(4, rows, p=[0.9, 0.06, 0.03, 0.01])]
+    failed_runs = rng.random(runs) < failed_run_rate
+    statuses[failed_runs[run_of_row]] = 'failed'
+
+    actions = np.array(ACTIONS, dtype=object)[rng.integers(0, len(ACTIONS), rows)]
+    kind = rng.random(rows)
+    gci = kind < gci_rate
+    actions[gci] = ['run gci ' + code for code in _labels('QX{:06d}', 50)[rng.integers(0, 50, gci.sum())]]
+    db_id = (kind >= gci_rate) & (kind < gci_rate + db_id_rate)
+    actions[db_id] = ['get record {}'.format(record) for record in rng.integers(10 ** 14, 10 ** 15, db_id.sum())]
+
+    # cases of a run follow each other a duration apart
+    offsets = pd.Series(durations).groupby(run_of_row).cumsum().to_numpy()
+    timestamps = pd.to_datetime(run_start[run_of_row] + (offsets * 10 ** 9).astype(np.int64))
+    return pd.DataFrame({
+        'group_uuid': _hex_ids(rng, runs)[run_of_row],
+        'scenario_uuid': _hex_ids(rng, max(1, runs * 4))[run_of_row * 4 + rng.integers(0, 4, rows)],
+        'case_uuid': _hex_ids(rng, rows),
+        'case_service_name': _labels('service{:02d}', services)[case_of_row % services],
+        'case_id': case_ids[case_of_row],
+        'case_description': _labels('case description {}', cases)[case_of_row],
+        'case_timestamp': timestamps.strftime(DATE_FMT),
+        'case_status': statuses,
+        'case_client_ip': _labels('10.1.0.{}', 50)[rng.integers(0, 50, rows)],
+        'case_endpoint': endpoint_names[endpoint_of_run[run_of_row]],
+        'case_action': actions,
+        'case_duration': durations,
+    })
+
+
+def write_sqlite(df, path, table='test_result', chunksize=100000):
+    """write df to a fresh sqlite database at path, indexed on case_timestamp like PYNET. return its engine"""
+    if os.path.exists(path):
+        os.remove(path)
+    disk_engine = sa.create_engine('sqlite:///' + os.path.abspath(path))
+    df.to_sql(table, disk_engine, index=False, chunksize=chunksize)
+    with disk_engine.begin() as connection:
+        connection.execute(sa.text('CREATE INDEX ix_{0}_case_timestamp ON {0} (case_timestamp)'.format(table)))
+    return disk_engine
+
+
+def synthetic_db(rows, path, seed=0, **kwargs):
+    """engine of a sqlite database at path with generate(rows, seed, **kwargs), reused if it was already written"""
+    if os.path.exists(path):
+        return sa.create_engine('sqlite:///' + os.path.abspath(path))
+    tmp_path = path + '.tmp'
+    write_sqlite(generate(rows, seed, **kwargs), tmp_path).dispose()
+    os.replace(tmp_path, path)
+    return sa.create_engine('sqlite:///' + os.path.abspath(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rows', type=int)
+    parser.add_argument('path')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--cases', type=int, default=2000)
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    df = generate(args.rows, args.seed, days=args.days, cases=args.cases)
+    write_sqlite(df, args.path)
+    print('wrote {} rows to {} in {:.1f}s'.format(len(df), args.path, time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Command line entry point of expd_analytics (installed as expd-analytics).
+
+    expd-analytics serve sqlite:////data/pynet.db --refresh 300 &
+    expd-analytics report highest_failures sigma=2
+    expd-analytics export mean_by ~/pynet-data/mean_by.csv unique_col=case_action
+    expd-analytics status
+
+serve loads the test_result table once and keeps it warm (see _worker), the other commands are thin clients of that
+worker. Only serve imports pandas, so the client commands answer in milliseconds.
+"""
+
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+import _client
+
+
+def parse_kwargs(pairs):
+    """map of key=value arguments, values read as json where they parse (numbers, lists, true/false/null)"""
+    kwargs = {}
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError('report arguments look like key=value, not {}'.format(pair))
+        try:
+            kwargs[key] = json.loads(value)
+        except ValueError:
+            kwargs[key] = value
+    return kwargs
+
+
+def frame_rows(frame):
+    """(header, rows) of a frame encoded by _worker.encode_result, with the index as the leading columns"""
+    index_names = frame.get('index_names') or ['']
+    header = index_names + [str(col) for col in frame['columns']]
+    rows = []
+    for index, data in zip(frame['index'], frame['data']):
+        index = index if isinstance(index, list) else [index]
+        rows.append(['' if value is None else str(value) for value in index + data])
+    return header, rows
+
+
+def format_table(header, rows, max_rows=None):
+    shown = rows if max_rows is None or len(rows) <= max_rows else rows[:max_rows]
+    widths = [max([len(cell) for cell in col]) for col in zip(header, *shown)]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in [header] + shown]
+    if len(shown) < len(rows):
+        lines.append('... {} more rows'.format(len(rows) - len(shown)))
+    return '\n'.join(lines)
+
+
+def print_result(result, output='table', max_rows=None):
+    if result.get('kind') != 'frame':
+        print(json.dumps(result.get('value', result), indent=1))
+        return
+    if output == 'json':
+        print(json.dumps(result))
+        return
+    header, rows = frame_rows(result)
+    if output == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(header)
+        writer.writerows(rows)
+    else:
+        print(format_table(header, rows, max_rows))
+
+
+def call_worker(args, command, **params):
+    """result of command on the worker, exits with a message if there is no worker or the request failed"""
+    try:
+        response = _client.request(command, args.socket, **params)
+    except OSError as exc:
+        sys.exit('no worker on {} ({}), start one with: expd-analytics serve DATABASE_URL'.format(
+            args.socket or _client.default_socket_path(), exc))
+    if not response.get('ok'):
+        sys.exit(response.get('error'))
+    if args.timing:
+        print('{} answered in {:.1f} ms'.format(command, response['seconds'] * 1000), file=sys.stderr)
+    return response['result']
+
+
+def serve(args):
+    # the only command that needs the data stack
+    import _worker
+    _worker.serve(args.database_url, args.socket, args.refresh, strict=not args.plain, snapshot_dir=args.snapshot_dir,
+                  partitions=args.partitions, compact=args.compact, dump=args.dump)
+
+
+def report(args):
+    result = call_worker(args, 'report', name=args.name, kwargs=parse_kwargs(args.kwargs))
+    print_result(result, args.output, args.max_rows)
+
+
+def export(args):
+    written = call_worker(args, 'export', name=args.name, path=os.path.abspath(os.path.expanduser(args.path)),
+                          kwargs=parse_kwargs(args.kwargs), fmt=args.fmt, partition_by_day=args.partition_by_day)
+    print(written or 'unchanged since the last export, nothing written')
+
+
+def simple(command):
+    def run(args):
+        result = call_worker(args, command)
+        print(result if isinstance(result, str) else json.dumps(result, indent=1))
+    return run
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--socket', help='worker socket (default $EXPD_WORKER_SOCKET or ~/pynet-data/worker.sock)')
+    common.add_argument('--timing', action='store_true', help="print how long the worker took to stderr")
+    parser = argparse.ArgumentParser(prog='expd-analytics', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', parents=[common], help='load the data and answer the other commands')
+    serve_parser.add_argument('database_url', help='sqlalchemy url of the PYNET database')
+    serve_parser.add_argument('--refresh', type=float, default=300, help='seconds between refreshes, 0 for never')
+    serve_parser.add_argument('--plain', action='store_true', help="startup instead of strict_startup (no cleaning)")
+    serve_parser.add_argument('--snapshot-dir', help='keep a local snapshot of the table here')
+    serve_parser.add_argument('--partitions', type=int, default=5)
+    serve_parser.add_argument('--compact', action='store_true', help='keep string columns as categories')
+    serve_parser.add_argument('--dump', action='store_true', help='run the periodic data_dump too')
+    serve_parser.set_defaults(run=serve)
+
+    report_parser = commands.add_parser('report', parents=[common], help='run a report on the warm data')
+    report_parser.add_argument('name')
+    report_parser.add_argument('kwargs', nargs='*', metavar='key=value', help='report arguments')
+    report_parser.add_argument('--output', choices=('table', 'csv', 'json'), default='table')
+    report_parser.add_argument('--max-rows', type=int, default=50, help='rows shown as a table (default 50)')
+    report_parser.set_defaults(run=report)
+
+    export_parser = commands.add_parser('export', parents=[common], help='write a report to a file, see AnyData.export')
+    export_parser.add_argument('name')
+    export_parser.add_argument('path')
+    export_parser.add_argument('kwargs', nargs='*', metavar='key=value', help='report arguments')
+    export_parser.add_argument('--fmt', default='csv', help='csv, parquet, feather or arrow (default csv)')
+    export_parser.add_argument('--partition-by-day', action='store_true')
+    export_parser.set_defaults(run=export)
+
+    for command, help_text in (('status', 'rows, refreshes and cache stats of the worker'),
+                               ('reports', 'names of the reports'), ('refresh', 'refresh the data now'),
+                               ('ping', 'check the worker is up'), ('stop', 'stop the worker')):
+        commands.add_parser(command, parents=[common], help=help_text).set_defaults(run=simple(command))
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.run(args)
+    except argparse.ArgumentTypeError as exc:
+        sys.exit(str(exc))
+
+
+if __name__ == '__main__':
+    main()
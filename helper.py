@@ -1,7 +1,30 @@
+import importlib.util
 import os
+import sys
 
 
 def direc_check(directory):
     """ check if directory called exists, if it doesn't, recursively create the whole path. """
     if not os.path.exists(directory):
-        os.makedirs(directory)
\ No newline at end of file
+        os.makedirs(directory)
+
+
+def has_module(name):
+    """ check if top level module name can be imported, without importing it. """
+    return name in sys.modules or importlib.util.find_spec(name) is not None
+
+
+def lazy_import(name):
+    """ return module name, but only really import it when one of its attributes is first used.
+    for heavy dependencies that only some code paths need. raises ImportError if it isn't installed. """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError('No module named {}'.format(name), name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -1,18 +1,30 @@
 import os
 import datetime
-import threading
+import importlib
 
 import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-
-from time import sleep
-from pandas.util.testing import test_parallel
 
+import _aggregate
+import _buffer
+import _calendar
 import _data
-import _graphs
+import _export
+import _groups
+import _instrument
+import _loader
+import _memo
+import _resolver
+import _rollup
+import _scheduler
+import _snapshot
+import _stats
+import _stream
 import helper
 
+# sqlalchemy is only loaded once a query is built, plotting (plt, _graphs) once something asks for it
+sa = helper.lazy_import('sqlalchemy')
+_LAZY_MODULES = {'plt': 'matplotlib.pyplot', '_graphs': '_graphs'}
+
 REGEX_PATTERN_GCI = r'[A-Z]\w{5,7}'
 REGEX_PATTERN_DB_ID = r'[0-9]{15}'
 TIMESTAMP_PARSE_DICT = {'case_timestamp': '%Y-%m-%dT%H:%M:%S.%fZ'}
@@ -20,6 +32,14 @@ TIMESTAMP_PARSE_DICT = {'case_timestamp': '%Y-%m-%dT%H:%M:%S.%fZ'}
 # http://blog.thedataincubator.com/2015/09/painlessly-deploying-data-apps-with-bokeh-flask-and-heroku/
 
 
+def __getattr__(name):
+    # pn_analyze.plt / pn_analyze._graphs import matplotlib the first time they are used
+    if name in _LAZY_MODULES:
+        module = globals()[name] = importlib.import_module(_LAZY_MODULES[name])
+        return module
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
 def load_up_initial_db(sql_table, disk_engine, date_fmt):
     # param date_fmt dict like in read_sql_table
     df_tot = []
@@ -29,19 +49,34 @@ def load_up_initial_db(sql_table, disk_engine, date_fmt):
     return metrics
 
 
+def load_rows_since(sql_table, disk_engine, date_fmt, time_col, watermark):
+    """load the rows of sql_table where time_col is newer than watermark (compared as stored in the database).
+    A watermark of None loads the whole table.
+    Returns (dataframe, largest time_col value of the rows as stored in the database or None if there were none),
+    the second being the next watermark."""
+    table = sa.table(sql_table, sa.column(time_col))
+    query = sa.select(sa.literal_column('*')).select_from(table)
+    if watermark is not None:
+        query = query.where(table.c[time_col] > watermark)
+    frame = pd.read_sql_query(query, disk_engine)
+    latest = _loader.stored_latest(frame, time_col)
+    return _loader.parse_dates(frame, date_fmt), latest
+
+
+def load_run_rows(sql_table, disk_engine, date_fmt, time_col, runs, watermark):
+    """load the rows of the group_uuids in runs where time_col is at or before watermark (compared as stored in the
+    database), the rows of those runs that earlier loads got"""
+    table = sa.table(sql_table, sa.column(time_col), sa.column('group_uuid'))
+    query = sa.select(sa.literal_column('*')).select_from(table).where(table.c.group_uuid.in_(list(runs)))
+    if watermark is not None:
+        query = query.where(table.c[time_col] <= watermark)
+    return _loader.parse_dates(pd.read_sql_query(query, disk_engine), date_fmt)
+
+
 def get_case_list_by_group(config):
-    """given a PYNET config map, return the full case lists (including dependent groups) of each group"""
-    # Identity = namedtuple('Identity', ['service', 'id'])
-    groups = config.get('groups')
-    full_case_lists = {}
-    for group_name, group in groups.items():
-        cases = group['cases']
-        if group.get('dependencies'):
-            for dep in group.get('dependencies'):
-                dependencies_tests = groups.get(dep).get('cases')
-                cases += dependencies_tests
-        full_case_lists[group_name] = cases
-    return full_case_lists
+    """given a PYNET config map, return the full case lists (including dependent groups) of each group.
+    dependencies are followed all the way down and every case is listed once, see _groups.DependencyIndex"""
+    return _groups.DependencyIndex(config).case_lists()
 
 
 # def strict_startup(table):
@@ -52,18 +87,35 @@ def get_case_list_by_group(config):
 
 
 class AnyData:
-    def __init__(self, disk_engine, table):
+    # column to split the table on when loading, see _loader.load_partitioned. None means the integer primary key
+    # if the table has one, otherwise a single read
+    partition_col = None
+
+    def __init__(self, disk_engine, table, partitions=5):
         self.disk_engine = disk_engine
         self.table = table
+        self.partitions = partitions
+        self.load_stats = []
         self.df = pd.DataFrame()
 
-    # TODO: LOOK INTO DASK:: https://dask.readthedocs.io/en/latest/
-    @test_parallel(num_threads=5)
     def load_up_initial_db(self, date_dict):
-        df_tot = []
-        for chunk in pd.read_sql_table(self.table, self.disk_engine, chunksize=10000, parse_dates=date_dict):
-            df_tot.append(chunk)
-        self.df = pd.concat(df_tot)
+        """
+        Load a database by table into a pandas dataframe, reading partitions of it concurrently.
+
+        Keyword argument:
+        date_dict -- Map of columns : date string format to parse into type(pd.Timestamp)
+        """
+        frames = self._read_partitions(date_dict)
+        self.df = pd.concat(frames, ignore_index=True)
+
+    @_instrument.instrumented()
+    def _read_partitions(self, date_dict):
+        """read the table as self.partitions partitions, keeping the per partition timings in self.load_stats"""
+        partition_col = _loader.pick_partition_col(self.disk_engine, self.table, fallback=self.partition_col)
+        frames, self.load_stats = _loader.load_partitioned(self.table, self.disk_engine, date_dict,
+                                                           partitions=self.partitions, partition_col=partition_col)
+        _loader.print_load_stats(self.table, self.load_stats)
+        return frames
 
     def dump_to_csv(self, function, path, kwargs=None):
         """dump a smaller dataframe to a csv file
@@ -72,13 +124,29 @@ class AnyData:
 
         :param function: function to apply to df (groupby/aggregation.. basically to get valuable data)
         :param kwargs: map of keyword args to also pass to *function* (default empty)
-        :param path: filepath to dump to
+        :param path: filepath to dump to, written as is (see export for other formats and skipping unchanged results)
+
+        """
+        if not kwargs:
+            kwargs = {}
+        df_to_dump = function(self.df, **kwargs)
+        _export.atomic_write(df_to_dump, path, 'csv')
+
+    def export(self, function, path, kwargs=None, fmt='csv', partition_by_day=False):
+        """dump a smaller dataframe to a file, see _export.Exporter.
+        the file is written atomically, and not rewritten if the result hasn't changed since the last export.
 
+        :param function: function to apply to df (groupby/aggregation.. basically to get valuable data)
+        :param path: filepath to dump to, the extension is replaced by the one of fmt
+        :param kwargs: map of keyword args to also pass to *function* (default empty)
+        :param fmt: csv, parquet, feather or arrow (default csv)
+        :param partition_by_day: add a new file per export under path/day=YYYY-MM-DD/ instead of overwriting
+        :return: path written, or None if the result was unchanged
         """
         if not kwargs:
             kwargs = {}
         df_to_dump = function(self.df, **kwargs)
-        df_to_dump.to_csv(path)
+        return _export.Exporter(fmt, partition_by_day=partition_by_day).export(df_to_dump, path)
 
 
 def return_date_mask(func):
@@ -87,13 +155,144 @@ def return_date_mask(func):
 
 
 class PynetData(AnyData):
-    def __init__(self, disk_engine, table):
-        super().__init__(disk_engine, table)
+    time_col = 'case_timestamp'
+    partition_col = 'case_timestamp'
+    compact = False
+    # _resolver.HostnameResolver of the hostname column, see add_hostname_column
+    resolver = None
+    # bumped whenever the data changes, so anything computed from it can tell it is stale
+    data_version = 0
+    # largest time_col value loaded, exactly as the database stores it. newer rows are the ones greater than this
+    _high_water = None
+
+    def __init__(self, disk_engine, table, snapshot_dir=None, partitions=5, compact=False, executor=None):
+        super().__init__(disk_engine, table, partitions=partitions)
+        self.compact = compact
+        # _parallel.ProcessBackend to run the per case/endpoint analyses on, None runs them in this process
+        self.executor = executor
+        self.snapshot = _snapshot.Snapshot(snapshot_dir, table, compact) if snapshot_dir else None
         self._config_group_data = None
         self.time = datetime.datetime.now()
-        self._this_month = None
-        self._this_year = None
-        self._today = None
+        self.queries = _memo.QueryCache()
+
+    @property
+    def df(self):
+        """
+        The data, as a dataframe over views of the column buffers.
+        Assigning a dataframe replaces the data and rebuilds the calendar index. Columns set directly on the returned
+        frame are not kept once rows get appended, assign a new frame instead.
+        """
+        return self._buffer.frame()
+
+    @df.setter
+    def df(self, frame):
+        self._set_buffer(_buffer.ColumnBuffer.from_frame(self._compacted(frame)))
+
+    @property
+    def data_key(self):
+        """data_version told apart from the ones of other objects, for caches shared between them (an executor)"""
+        return id(self), self.data_version
+
+    @property
+    def memory_per_row(self):
+        """bytes of memory per row of the data"""
+        return _data.memory_per_row(self.df)
+
+    def _compacted(self, frame):
+        """frame in the compact schema if this object is compact (see _data.compact_frame), otherwise frame"""
+        if self.compact and len(frame.columns):
+            return _data.compact_frame(frame)
+        return frame
+
+    def _set_buffer(self, buffer):
+        """replace the data with buffer, and build the calendar index over its time column"""
+        self._buffer = buffer
+        self.data_version += 1
+        frame = buffer.frame()
+        has_time = self.time_col in frame.columns and len(frame)
+        self._latest = frame[self.time_col].max() if has_time else None
+        self._calendar = _calendar.CalendarIndex(frame[self.time_col] if has_time else ())
+        self._aggregates = None
+        self._duration_stats = None
+        self._case_stats = None
+        self._rollups = None
+
+    @property
+    def aggregates(self):
+        """
+        _aggregate.AggregateStore of per case_id/case_endpoint/group_uuid statistics, built on first use once the
+        numeric columns exist and then kept up to date as rows are appended. None before that.
+        """
+        if self._aggregates is None and 'numeric_status' in self._buffer.columns:
+            self._aggregates = _aggregate.AggregateStore.from_frame(self.df)
+        return self._aggregates
+
+    @property
+    def duration_stats(self):
+        """
+        _stats.ColumnStats of case_duration (running mean/std/min/max, median and MAD), built on first use and then
+        kept up to date as rows are appended.
+        """
+        if self._duration_stats is None:
+            self._duration_stats = _stats.ColumnStats()
+            self._duration_stats.update(self.df.case_duration)
+        return self._duration_stats
+
+    @property
+    def case_stats(self):
+        """_stats.KeyedStats of case_duration per case_id, built on first use and then kept up to date"""
+        if self._case_stats is None:
+            self._case_stats = _stats.KeyedStats('case_id', 'case_duration')
+            self._case_stats.update(self.df)
+        return self._case_stats
+
+    @property
+    def rollups(self):
+        """
+        _rollup.RollupStore of hourly/daily/weekly case_duration and pass rate buckets per case_id/case_endpoint,
+        built on first use once date_int exists and then kept up to date as rows are appended. None before that.
+        """
+        if self._rollups is None and 'date_int' in self._buffer.columns:
+            self._rollups = _rollup.RollupStore.from_frame(self.df)
+        return self._rollups
+
+    def over_time(self, case_id=None, endpoint=None, start=None, end=None, resolution=None):
+        """
+        Duration (count, mean, p50/p90/p99) and pass rate of a case, an endpoint or everything over time, from the
+        rollups at the coarsest resolution that fits start/end (see _rollup.RollupStore.over_time).
+        """
+        if case_id is not None:
+            return self.rollups.over_time('case_id', case_id, start, end, resolution)
+        if endpoint is not None:
+            return self.rollups.over_time('case_endpoint', endpoint, start, end, resolution)
+        return self.rollups.over_time(None, None, start, end, resolution)
+
+    def in_norm(self, sigma, by_case=False):
+        """
+        mask of rows with a case_duration within sigma standard deviations of the mean, from the kept stats.
+        by_case compares each row against its own case_id's mean/std instead.
+        """
+        if by_case:
+            return self.case_stats.sigma_mask(self.df, sigma)
+        return _data.return_in_norm_df(self.df, 'case_duration', sigma, stats=self.duration_stats)
+
+    def robust_mask(self, threshold=3.5, by_case=False):
+        """
+        mask of rows with a case_duration robust z score (median/MAD based, so the huge outliers don't drag it)
+        within threshold. by_case scores each row against its own case_id's median/MAD.
+        """
+        if by_case:
+            return self.case_stats.robust_mask(self.df, threshold)
+        return self.duration_stats.robust_mask(self.df.case_duration, threshold)
+
+    def query(self, func, *args, **kwargs):
+        """
+        func(self.df, *args, **kwargs) through the query cache, so asking for the same view again is free until
+        the data changes (load, refresh, clean and the numeric columns all bump data_version).
+        e.g. test_result.query(_data.highest_failures_by_df_stdev, 'case_id', sigma=1.8)
+        The cache's hit/miss counts are in self.queries.stats.
+        """
+        return self.queries.call(func, self.df, args, kwargs, self.data_version)
 
     @property
     def now(self):
@@ -106,116 +305,266 @@ class PynetData(AnyData):
 
     @property
     def config_group_data(self):
+        """_groups.DependencyIndex of the PYNET config, once load_config has been called"""
         return self._config_group_data
 
+    def load_config(self, config):
+        """
+        Resolve the groups of a PYNET config map and add a case_group category column (the group that lists
+        each row's case). Rows appended later get theirs too.
+        """
+        self._config_group_data = _groups.DependencyIndex(config)
+        if len(self._buffer.columns):
+            self._buffer.assign(pd.DataFrame({'case_group': self._config_group_data.case_group_column(self.df)}))
+            self.data_version += 1
+
+    def add_hostname_column(self, resolver=None, timeout=None):
+        """
+        Add a hostname category column with the case_endpoint IPs resolved (through resolver, default the shared
+        _resolver.default_resolver()). Rows appended later get theirs too.
+        """
+        self.resolver = resolver or _resolver.default_resolver()
+        self._buffer.assign(self.resolver.hostname_column(self.df, timeout=timeout).to_frame())
+        self.data_version += 1
+
+    def group_rollup(self):
+        """coverage and failures by config group (each case counted in every group that has it), see load_config"""
+        return self._config_group_data.rollup(self.df)
+
     @property
     def this_month(self):
-        """mask of dataframe that corrasdfesponds to current month"""
-        if self.time.month != datetime.datetime.now().month or self._this_month is None:
-            self._update_time()
-        return self._this_month
+        """mask of dataframe that corresponds to current month"""
+        return self._period_mask('month')
 
     @property
     def this_year(self):
         """mask of dataframe that corresponds to current year"""
-        if self.time.year != datetime.datetime.now().year or self._this_year is None:
-            self._update_time()
-        return self._this_year
+        return self._period_mask('year')
 
     @property
     def today(self):
         """mask of dataframe that corresponds to current day"""
-        if self.time.day != datetime.datetime.now().day or self._today is None:
-            self._update_time()
-        return self._today
-
-    def _update_time(self):
-        """update all the masks, then reset the time so it won't do it again"""
-        if self.time.year != datetime.datetime.now().year or self._this_year is None:
-            self._this_year = _data.this_year(self.df, 'case_timestamp')
-        if self.time.month != datetime.datetime.now().month or self._this_month is None:
-            self._this_month = _data.this_month(self.df, 'case_timestamp')
-        if self.time.day != datetime.datetime.now().day or self._today is None:
-            self._today = _data.today(self.df, 'case_timestamp')
+        return self._period_mask('day')
+
+    def _period_mask(self, period):
         self.time = datetime.datetime.now()
+        return pd.Series(self._calendar.period_mask(period, self.time), index=self.df.index)
 
-    def load_up_initial_db(self, date_dict):
+    def between(self, start=None, end=None):
+        """rows with start <= case_timestamp < end, found through the calendar index. either end can be None"""
+        return self.df.iloc[self._calendar.positions(start, end)]
+
+    @_instrument.instrumented()
+    def _append(self, new_rows):
+        """
+        Append rows to the data in place. The derived columns that already exist (numeric status, date_int), the
+        calendar index entries and the aggregates are built for just these rows, so this costs time proportional to
+        new_rows.
         """
-        Load a database by table into a pandas dataframe in chunks.
+        if new_rows.empty:
+            return
+        derived = [new_rows]
+        if 'numeric_status' in self._buffer.columns:
+            derived.append(_data.numeric_status_frame(new_rows, dummies=not self.compact))
+        if 'date_int' in self._buffer.columns:
+            derived.append(pd.DataFrame({'date_int': _data.date_integer(new_rows[self.time_col])}))
+        if 'case_group' in self._buffer.columns:
+            derived.append(self._config_group_data.case_group_column(new_rows).to_frame())
+        if 'hostname' in self._buffer.columns:
+            derived.append((self.resolver or _resolver.default_resolver()).hostname_column(new_rows).to_frame())
+        new_rows = pd.concat(derived, axis=1)
+        self._buffer.append(new_rows)
+        self.data_version += 1
+        self._calendar.extend(new_rows[self.time_col])
+        if self._aggregates is not None:
+            self._aggregates.update(new_rows)
+        if self._duration_stats is not None:
+            self._duration_stats.update(new_rows.case_duration)
+        if self._case_stats is not None:
+            self._case_stats.update(new_rows)
+        if self._rollups is not None:
+            self._rollups.update(new_rows, self.between)
+        new_latest = new_rows[self.time_col].max()
+        if self._latest is None or new_latest > self._latest:
+            self._latest = new_latest
+
+    def longest_case_over_time(self, aggregation):
+        """_data.return_longest_case_over_time of the data, on the executor if there is one"""
+        if self.executor is None:
+            return _data.return_longest_case_over_time(self.df, aggregation)
+        return self.executor.longest_case_over_time(self.df, self.data_key, aggregation)
+
+    def endpoints_v_duration(self, endpoints=None, as_frame=False):
+        """_data.endpoints_v_duration of the data, on the executor if there is one"""
+        if self.executor is None:
+            return _data.endpoints_v_duration(self.df, endpoints, as_frame)
+        return self.executor.endpoints_v_duration(self.df, self.data_key, endpoints, as_frame)
+
+    def highest_failures_by_df_stdev(self, groupby_key, sigma=0):
+        """_data.highest_failures_by_df_stdev of the data, on the executor if there is one"""
+        if self.executor is None:
+            return _data.highest_failures_by_df_stdev(self.df, groupby_key, sigma)
+        return self.executor.highest_failures_by_df_stdev(self.df, self.data_key, groupby_key, sigma)
+
+    @_instrument.instrumented()
+    def load_up_initial_db(self, date_dict, chunksize=None):
+        """
+        Load a database by table into a pandas dataframe, reading partitions of it concurrently.
+        If a snapshot directory was given, load the local snapshot instead and only fetch the rows newer than it,
+        then save the result back as the new snapshot.
 
         Keyword argument:
         date_dict -- Map of columns : date string format to parse into type(pd.Timestamp)
+        chunksize -- streaming mode: don't load anything into self.df, return a generator of dataframes of up to
+            chunksize rows instead, for tables that don't fit in memory (default None). see _stream
         """
-        df_tot = []
-        for chunk in pd.read_sql_table(self.table, self.disk_engine, chunksize=10000, parse_dates=date_dict):
-            df_tot.append(chunk)
-        self.df = pd.concat(df_tot)
-
+        if chunksize:
+            return _stream.iter_chunks(self.table, self.disk_engine, date_dict, chunksize)
+        if self.snapshot is None or not self.snapshot.available:
+            self._read_table(date_dict)
+            return
+        schema = _snapshot.table_schema(self.disk_engine, self.table)
+        snapshot_df, watermark = self.snapshot.load(schema, date_dict)
+        if snapshot_df is None:
+            self._read_table(date_dict)
+        else:
+            newer, newer_latest = load_rows_since(self.table, self.disk_engine, date_dict, self.time_col, watermark)
+            print('loaded {} rows from snapshot, {} newer rows from {}'.format(len(snapshot_df), len(newer),
+                                                                             self.table))
+            # the snapshot is read memory mapped, but this copies it into the column buffers (rows get appended to
+            # them), so the load saves the database read, not the copy
+            self.df = snapshot_df
+            self._high_water = _loader.latest_of([watermark, newer_latest])
+            if newer.empty:
+                return
+            self._append(newer)
+        if not self.df.empty:
+            self.snapshot.save(self.df, self._watermark(date_dict), schema, date_dict)
+
+    @_instrument.instrumented()
+    def _read_table(self, date_dict):
+        """read the whole table in partitions, copying each one straight into a buffer sized for all of them"""
+        frames = [self._compacted(frame) for frame in self._read_partitions(date_dict)]
+        self._set_buffer(_buffer.ColumnBuffer.from_frames(frames))
+        self._high_water = _loader.latest_of([partition['latest'].get(self.time_col) for partition in self.load_stats])
+        if self.compact:
+            print('{} loaded compact: {:.0f} bytes per row'.format(self.table, self.memory_per_row))
+
+    def _watermark(self, date_dict):
+        """latest time_col value as it is stored in the database, what newer rows are compared against"""
+        if self._high_water is not None:
+            return self._high_water
+        if self._latest is None:
+            return None
+        # data that wasn't read from the database, the best that can be done is formatting it back
+        return _snapshot.format_watermark(self._latest, (date_dict or {}).get(self.time_col))
+
+    @_instrument.instrumented()
     def create_numeric_status(self):
         """To be run on startup:
-        create a numeric representation of the case_status to be used for analysis
+        create a numeric representation of the case_status to be used for analysis.
+        Compact frames only get the numeric_status code, not a dummy column per status.
         """
-        boolean_map = {"passed": 1, "failed": 0, "running": 3, "skipped": 2}
-        self.df['numeric_status'] = pd.Series(self.df.case_status.map(boolean_map), index=self.df.index)
-        df_status = pd.get_dummies(self.df.case_status)
-        self.df = pd.concat([self.df, df_status], axis=1)
+        self._buffer.assign(_data.numeric_status_frame(self.df, dummies=not self.compact))
+        self._aggregates = None
+        self.data_version += 1
 
+    @_instrument.instrumented()
     def create_date_integer(self):
         """To be run on startup:
         Create integer representation of the case_timestamp
         """
-        self.df['date_int'] = self.df.case_timestamp.astype(np.int64)
+        self._buffer.assign(pd.DataFrame({'date_int': _data.date_integer(self.df[self.time_col])}))
+        self._rollups = None
+        self.data_version += 1
 
 
 class TestResult(PynetData):
     """ class that represents/manipulates the data from the test_result table in the PYNET database."""
-    def __init__(self, disk_engine, wait_interval=86400, writing_to_csv=True):
-        super().__init__(disk_engine, 'test_result')
+    # formats data_dump writes, the ones that need pyarrow are skipped without it
+    dump_formats = ('csv', 'feather')
+
+    def __init__(self, disk_engine, wait_interval=86400, writing_to_csv=True, snapshot_dir=None, partitions=5,
+                 compact=False, executor=None):
+        super().__init__(disk_engine, 'test_result', snapshot_dir=snapshot_dir, partitions=partitions,
+                         compact=compact, executor=executor)
         self.is_cleaned = False
+        self._passing_runs = set()
+        # runs removed by clean for having no passing case yet, see _data.remove_totally_failed_tests
+        self._failed_runs = set()
         self.wait_interval = wait_interval
         self.writing_to_csv = writing_to_csv
-        self._csv_thread = None
+        self.scheduler = _scheduler.ExportScheduler()
         if self.writing_to_csv:
             self._much_dump()
 
     def _much_dump(self):
         # basically on instantiation of the class, you're going to be dumping valuable info to a csv for
         # the luigi pipeline to pick up. or you're going to just be dumping data for nothing. either way.
-        # you gonna need it.
+        # you gonna need it. runs on the scheduler's thread, so the constructor returns right away.
         print('_much_dump has been activated with {} s wait time'.format(self.wait_interval))
-        while True:
-            if self.df.empty:
-                print('DF IS EMPTY. SLEEPING 35 S')
-                # no use in trying to run anything if the dataframe doesn't exist.
-                sleep(35)
-                continue
-            self._csv_thread = threading.Timer(self.wait_interval, self.data_dump)
-            self._csv_thread.start()
-            self._csv_thread.join()
-            if not self.writing_to_csv:
-                break
+        self.scheduler.register('data_dump', self.data_dump, self.wait_interval, version=self._dump_version)
+        self.scheduler.start()
+
+    def _dump_version(self):
+        """data_version while there is data to dump. the dump is skipped while this doesn't change"""
+        if self.df.empty:
+            # no use in trying to run anything if the dataframe doesn't exist.
+            return None
+        return self.data_version
 
     def _terminate_dump(self):
-        self._writing_to_csv = False
+        self.writing_to_csv = False
+        self.scheduler.stop()
 
+    @_instrument.instrumented()
     def data_dump(self):
         dump_path = os.path.join(os.path.expanduser('~'), 'pynet-data', 'test-result')
         helper.direc_check(dump_path)
-        # dump a bunch of specific useful datas to CSV
+        # dump a bunch of specific useful datas to CSV, and to the binary formats next to it for faster readers
         # YES I'M AWARE THIS SHOULD BE BETTER
         print('DUMPING TO CSV!!!!!!!ASLDKFJASL;KDJFLK;ASDJF')
-        self.dump_to_csv(_data.highest_failures_by_df_stdev,
-                         os.path.join(dump_path, 'highest_failures_by_caseid_stdev.csv'),
-                         {'groupby_key': 'case_id', 'sigma': 1.8})
+        highest_failures = _data.highest_failures_by_df_stdev(self.df, groupby_key='case_id', sigma=1.8,
+                                                              store=self.aggregates)
+        for fmt in self.dump_formats:
+            if fmt in _export.available_formats():
+                _export.Exporter(fmt).export(highest_failures,
+                                             os.path.join(dump_path, 'highest_failures_by_caseid_stdev.csv'))
+
+    @_instrument.instrumented()
+    def refresh_metrics(self, table=None):
+        """
+        Append the rows newer than the latest case_timestamp. Only the new rows get pruned, filtered and have their
+        numeric columns and masks built, so a refresh costs time proportional to the new rows, not the history.
+        A run that clean removed (no passing case yet) and that passes now gets its earlier rows fetched back.
 
-    def refresh_metrics(self, table):
-        latest = self.df.case_timestamp.max()
-        latest_df = pd.read_sql('select * from {0} where case_timestamp > {1}'.format(table, latest),  self.disk_engine)
+        Keyword arguments:
+        table -- table to pull new rows from (default self.table)
+
+        Return:
+        number of rows appended
+        """
+        table = table or self.table
+        watermark = self._watermark(TIMESTAMP_PARSE_DICT)
+        latest_df, fetched_latest = load_rows_since(table, self.disk_engine, TIMESTAMP_PARSE_DICT, self.time_col,
+                                                    watermark)
+        if latest_df.empty:
+            return 0
         if self.is_cleaned:
             latest_df = _data.prune(latest_df, [REGEX_PATTERN_GCI, REGEX_PATTERN_DB_ID])
-            latest_df, _ = _data.remove_totally_failed_tests(latest_df)
-        self.df = self.df.append(latest_df)
 
+            def earlier_rows(runs):
+                # rows of runs that were going at the watermark and only now got a passing case
+                rows = load_run_rows(table, self.disk_engine, TIMESTAMP_PARSE_DICT, self.time_col, runs, watermark)
+                return _data.prune(rows, [REGEX_PATTERN_GCI, REGEX_PATTERN_DB_ID])
+            latest_df, _ = _data.remove_totally_failed_tests(latest_df, self._passing_runs, self._failed_runs,
+                                                             earlier_rows)
+        self._append(latest_df)
+        # the watermark moves past rows that got pruned too, otherwise they're fetched again on every refresh
+        self._high_water = _loader.latest_of([self._high_water, fetched_latest])
+        return len(latest_df)
+
+    @_instrument.instrumented()
     def clean(self):
         """
             Remove any test runs that have no passing tests, they were likely garbage,
@@ -223,9 +572,32 @@ class TestResult(PynetData):
 
         """
         self.df = _data.prune(self.df, [REGEX_PATTERN_GCI, REGEX_PATTERN_DB_ID])
-        self.df, _ = _data.remove_totally_failed_tests(self.df)
+        self._passing_runs = set()
+        self._failed_runs = set()
+        self.df, _ = _data.remove_totally_failed_tests(self.df, self._passing_runs, self._failed_runs)
         self.is_cleaned = True
 
+    def stream(self, chunksize=_stream.DEFAULT_CHUNK_ROWS, strict=True):
+        """
+        Streaming mode: generator of chunks of the table that went through the same steps as strict_startup
+        (prune, remove totally failed runs, numeric columns), without ever holding the whole table.
+        With strict, a first pass over group_uuid/case_status/case_action finds the runs to keep.
+        """
+        chunks = self.load_up_initial_db(TIMESTAMP_PARSE_DICT, chunksize=chunksize)
+        if strict:
+            regex_list = [REGEX_PATTERN_GCI, REGEX_PATTERN_DB_ID]
+            passing_runs = _stream.find_passing_runs(self.table, self.disk_engine, regex_list, chunksize)
+            chunks = _stream.without_failed_runs(_stream.pruned(chunks, regex_list), passing_runs)
+        return _stream.with_numeric_cols(chunks, self.time_col)
+
+    def stream_report(self, chunksize=_stream.DEFAULT_CHUNK_ROWS, strict=True, **kwargs):
+        """
+        Full history _stream.StreamReport (highest failures, means by unique value, sigma bands) built in bounded
+        memory from self.stream(). kwargs go to StreamReport.
+        """
+        return _stream.StreamReport(**kwargs).consume(self.stream(chunksize, strict))
+
+    @_instrument.instrumented()
     def add_numeric_cols(self):
         """Create numeric via get_dummies,
         and one from a map (which one is more useful? idk. we'll see.)
@@ -233,11 +605,13 @@ class TestResult(PynetData):
         self.create_numeric_status()
         self.create_date_integer()
 
+    @_instrument.instrumented()
     def startup(self):
         """Startup without removing failed tests or pruning the gci tests"""
         self.load_up_initial_db(TIMESTAMP_PARSE_DICT)
         self.add_numeric_cols()
 
+    @_instrument.instrumented()
     def strict_startup(self):
         """Startup with removing completely failed test runs and pruning gci tests."""
         self.load_up_initial_db(TIMESTAMP_PARSE_DICT)
@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 
 setup(
     name='expd_analytics',
@@ -7,7 +7,9 @@ setup(
     url='',
     license='',
     install_requires=['pandas',
-                      'matplotlib'],
+                      'matplotlib',
+                      'sqlalchemy'],
+    entry_points={'console_scripts': ['expd-analytics = cli:main']},
     author='Jessi Shank',
     author_email='jessishank1@gmail.com',
     description='analytics library'
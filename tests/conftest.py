@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import sqlalchemy as sa
+
+# the modules live flat in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def result_frame(rows, seed=0, start='2026-01-05', runs=20):
+    """
+    A small test_result frame. case_timestamp is stored with milliseconds ('2026-01-05T00:00:01.250Z') like PYNET
+    writes it, not the 6 digits the parse format gives back.
+    """
+    rng = np.random.default_rng(seed)
+    seconds = np.sort(rng.integers(0, 30 * 86400, rows))
+    millis = rng.integers(0, 1000, rows)
+    stamps = pd.Timestamp(start) + pd.to_timedelta(seconds, unit='s') + pd.to_timedelta(millis, unit='ms')
+    run_of_row = np.sort(rng.integers(0, runs, rows))
+    return pd.DataFrame({
+        'case_id': rng.choice(['case_{}'.format(i) for i in range(15)], rows),
+        'case_status': rng.choice(['passed', 'failed', 'skipped'], rows, p=[0.75, 0.2, 0.05]),
+        'case_action': rng.choice(['get shipment', 'post booking', 'login'], rows),
+        'case_endpoint': rng.choice(['localhost', 'qacombo016', '10.0.0.1', '10.0.0.11'], rows),
+        'case_service_name': rng.choice(['svcA', 'svcB'], rows),
+        'case_duration': rng.lognormal(0, 1, rows),
+        'case_timestamp': [stamp.strftime('%Y-%m-%dT%H:%M:%S.') + '{:03d}Z'.format(stamp.microsecond // 1000)
+                           for stamp in stamps],
+        'group_uuid': np.array(['run{:03d}'.format(i) for i in range(runs)])[run_of_row],
+    })
+
+
+@pytest.fixture
+def make_engine(tmp_path):
+    """function of a frame returning an engine of a fresh sqlite file holding it as test_result"""
+    def make(frame, name='pynet.db'):
+        engine = sa.create_engine('sqlite:///' + str(tmp_path / name))
+        frame.to_sql('test_result', engine, index=False)
+        return engine
+    return make
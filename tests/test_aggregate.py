@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+import _data
+import pn_analyze
+from conftest import result_frame
+
+
+@pytest.fixture
+def test_result(make_engine):
+    test_result = pn_analyze.TestResult(make_engine(result_frame(1000)), writing_to_csv=False)
+    test_result.strict_startup()
+    return test_result
+
+
+def test_stored_results_match_groupby(test_result):
+    df = test_result.df
+    for key in ('case_id', 'case_endpoint'):
+        stored = test_result.aggregates.groupby(key)
+        grouped = df.groupby(key)
+        for method in ('count', 'sum', 'mean', 'std', 'max'):
+            pd.testing.assert_series_equal(getattr(stored.case_duration, method)(),
+                                           getattr(grouped.case_duration, method)(), check_dtype=False,
+                                           check_index_type=False, check_categorical=False)
+        pd.testing.assert_series_equal(stored.numeric_status.mean(), grouped.numeric_status.mean(),
+                                       check_index_type=False)
+
+
+def test_highest_failures_keeps_its_column_name(test_result):
+    df = test_result.df
+    stored = _data.highest_failures_by_df_stdev(df, 'case_id', 0, store=test_result.aggregates)
+    assert stored.name == 'numeric_status'
+    assert list(stored.to_frame().reset_index().columns) == ['case_id', 'numeric_status']
+
+
+def test_unkept_statistics_raise_attribute_error(test_result):
+    with pytest.raises(AttributeError):
+        test_result.aggregates.groupby('case_id').numeric_status.max()
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+import _calendar
+import _data
+
+
+def brute_positions(timestamps, start, end):
+    timestamps = pd.Series(timestamps)
+    keep = timestamps.notna()
+    if start is not None:
+        keep &= timestamps >= start
+    if end is not None:
+        keep &= timestamps < end
+    return np.flatnonzero(keep.to_numpy())
+
+
+def random_timestamps(count, seed):
+    rng = np.random.default_rng(seed)
+    stamps = pd.Timestamp('2025-11-20') + pd.to_timedelta(rng.integers(0, 90 * 86400, count), unit='s')
+    stamps = pd.Series(stamps)
+    stamps[rng.random(count) < 0.02] = pd.NaT
+    return stamps
+
+
+WINDOWS = [(None, None), ('2025-12-01', '2026-01-01'), ('2026-01-15 12:00', None), (None, '2025-12-24'),
+           ('2026-05-01', '2026-06-01')]
+
+
+def test_windows_match_a_scan():
+    stamps = random_timestamps(2000, 0)
+    index = _calendar.CalendarIndex(stamps)
+    for start, end in WINDOWS:
+        np.testing.assert_array_equal(index.positions(start, end), brute_positions(stamps, start, end))
+    for period in ('day', 'month', 'year'):
+        when = pd.Timestamp('2025-12-31 23:59')
+        start, end = _calendar.window_bounds(period, when)
+        np.testing.assert_array_equal(index.period_mask(period, when),
+                                      np.isin(np.arange(len(stamps)), brute_positions(stamps, start, end)))
+
+
+def test_extend_in_and_out_of_order():
+    batches = [random_timestamps(500, seed) for seed in range(4)]
+    # the second batch is later than the first, the others overlap what is already indexed
+    batches[1] = batches[1] + pd.Timedelta(days=200)
+    index = _calendar.CalendarIndex(batches[0])
+    for batch in batches[1:]:
+        index.extend(batch)
+    stamps = pd.concat(batches, ignore_index=True)
+    assert len(index) == len(stamps)
+    for start, end in WINDOWS + [('2026-06-10', '2026-09-01')]:
+        np.testing.assert_array_equal(index.positions(start, end), brute_positions(stamps, start, end))
+
+
+def test_this_month_is_the_calendar_month():
+    now = pd.Timestamp.now()
+    last_year = now - pd.DateOffset(years=1)
+    df = pd.DataFrame({'case_timestamp': pd.Series([now, last_year, now - pd.DateOffset(months=1), pd.NaT],
+                                                   dtype='datetime64[ns]')})
+    mask = _data.this_month(df, 'case_timestamp')
+    assert mask.tolist() == [True, False, False, False]
+    np.testing.assert_array_equal(_calendar.CalendarIndex(df.case_timestamp).period_mask('month', now), mask)
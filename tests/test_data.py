@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+import _data
+from conftest import result_frame
+
+
+def split_run_frame():
+    """result_frame with the run going at row 300 failing entirely before it and passing from it on"""
+    frame = result_frame(600)
+    run = frame.group_uuid == frame.group_uuid[300]
+    frame.loc[run & (frame.index < 300), 'case_status'] = 'failed'
+    frame.loc[run & (frame.index >= 300), 'case_status'] = 'passed'
+    assert run[:300].any() and run[300:].any()
+    return frame, frame.group_uuid[300]
+
+
+def test_run_spanning_two_batches_keeps_all_its_rows():
+    frame, split_run = split_run_frame()
+    expected, _ = _data.remove_totally_failed_tests(frame)
+    first, second = frame.iloc[:300], frame.iloc[300:]
+    passing_runs, failed_runs = set(), set()
+    kept_first, removed = _data.remove_totally_failed_tests(first, passing_runs, failed_runs)
+    assert split_run in removed and split_run in failed_runs
+
+    def fetch_runs(runs):
+        return first[first.group_uuid.isin(runs)]
+    kept_second, _ = _data.remove_totally_failed_tests(second, passing_runs, failed_runs, fetch_runs)
+    assert split_run not in failed_runs
+    incremental = pd.concat([kept_first, kept_second])
+    assert (incremental.group_uuid == split_run).sum() == (frame.group_uuid == split_run).sum()
+    pd.testing.assert_frame_equal(incremental.sort_values(['case_timestamp', 'case_id']).reset_index(drop=True),
+                                  expected.sort_values(['case_timestamp', 'case_id']).reset_index(drop=True))
+
+
+PATTERNS = [r'[A-Z]\w{5,7}', r'[0-9]{15}']
+
+
+class CountingRegex:
+    """stands in for a compiled regex, counting the values it is run on"""
+    def __init__(self, regex):
+        self.regex = regex
+        self.searched = []
+
+    def search(self, value):
+        self.searched.append(value)
+        return self.regex.search(value)
+
+
+def test_pruner_matches_each_value_once():
+    pruner = _data.RegexPruner(PATTERNS)
+    pruner.regex = CountingRegex(pruner.regex)
+    actions = pd.Series(['get shipment', 'get SHIP12345', 'id 123456789012345', 'get shipment'])
+    assert pruner.matches(actions).tolist() == [False, True, True, False]
+    assert pruner.matches(actions.astype('category')).tolist() == [False, True, True, False]
+    assert pruner.matches(pd.Series(['login', 'get shipment'])).tolist() == [False, False]
+    assert sorted(pruner.regex.searched) == ['get SHIP12345', 'get shipment', 'id 123456789012345', 'login']
+    assert _data.get_pruner(PATTERNS) is _data.get_pruner(list(PATTERNS))
+
+
+def test_pruner_keeps_missing_values():
+    pruner = _data.RegexPruner(PATTERNS)
+    for actions in (pd.Series(['get SHIP12345', None, np.nan, 'login'], dtype=object),
+                    pd.Series(['get SHIP12345', None, np.nan, 'login'], dtype='category'),
+                    pd.Series(['get SHIP12345', None, None, 'login'], dtype='string'),
+                    pd.Series([None, np.nan], dtype=object)):
+        expected = [isinstance(value, str) and value.startswith('get') for value in actions]
+        assert pruner.matches(actions).tolist() == expected
+    frame = pd.DataFrame({'case_action': ['get SHIP12345', None, 'login'], 'case_id': ['a', 'b', 'c']})
+    assert _data.prune(frame, PATTERNS).case_id.tolist() == ['b', 'c']
@@ -0,0 +1,30 @@
+import os
+
+import pn_analyze
+from conftest import result_frame
+
+
+def mean_by_case(df):
+    return df.groupby('case_id').case_duration.mean()
+
+
+def test_dump_to_csv_writes_exactly_path(make_engine, tmp_path):
+    test_result = pn_analyze.TestResult(make_engine(result_frame(300)), writing_to_csv=False)
+    test_result.startup()
+    path = str(tmp_path / 'means.txt')
+    test_result.dump_to_csv(mean_by_case, path)
+    os.remove(path)
+    # written again even though the result didn't change, and nothing but path is written
+    test_result.dump_to_csv(mean_by_case, path)
+    assert sorted(os.listdir(tmp_path)) == ['means.txt', 'pynet.db']
+    with open(path) as dumped:
+        assert dumped.readline().strip() == 'case_id,case_duration'
+
+
+def test_export_skips_unchanged_results(make_engine, tmp_path):
+    test_result = pn_analyze.TestResult(make_engine(result_frame(300)), writing_to_csv=False)
+    test_result.startup()
+    path = str(tmp_path / 'means.txt')
+    assert test_result.export(mean_by_case, path) == str(tmp_path / 'means.csv')
+    assert test_result.export(mean_by_case, path) is None
+    assert os.path.exists(str(tmp_path / 'means.csv.sha1'))
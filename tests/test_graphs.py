@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('matplotlib')
+
+import _graphs
+
+
+def tick_pairs(axis):
+    return list(zip(axis.get_ticklocs(), [label.get_text() for label in axis.get_ticklabels()]))
+
+
+def test_scatter_labels_each_string_once_at_its_rows():
+    strings = np.array(['b', 'a', 'b', 'c', 'a', 'b'] * 30, dtype=object)
+    fig = _graphs.plot_string_2d(strings, np.arange(len(strings), dtype=float), 70, mode='scatter', max_ticks=10,
+                                 headless=True)
+    ticks = tick_pairs(fig.axes[0].xaxis)
+    assert [label for _, label in ticks] == ['b', 'a', 'c']
+    for position, label in ticks:
+        assert strings[int(position)] == label
+
+
+def test_scatter_ticks_are_capped_over_distinct_strings():
+    strings = np.array(['s{}'.format(i % 100) for i in range(1000)], dtype=object)
+    fig = _graphs.plot_string_2d(strings, np.ones(len(strings)), 70, mode='scatter', max_ticks=10, headless=True)
+    labels = [label for _, label in tick_pairs(fig.axes[0].xaxis)]
+    assert len(labels) == 10 and len(set(labels)) == 10
+    assert labels[0] == 's0' and labels[-1] == 's99'
+
+
+def test_scatter_over_plot_labels_line_up_with_mapped_values():
+    names = ['x{}'.format(i) for i in range(100)]
+    frame = pd.DataFrame({'x': np.arange(100), 'y': np.arange(100) % 7})
+    fig = _graphs.generic_scatter_over_plot([frame], 'x', 'y', ['all'], xtick_label=names, max_ticks=10,
+                                            headless=True)
+    ticks = tick_pairs(fig.axes[0].xaxis)
+    assert len(ticks) == 10
+    for position, label in ticks:
+        assert names[int(position)] == label
@@ -0,0 +1,36 @@
+import copy
+
+import pandas as pd
+
+import _groups
+import pn_analyze
+
+CONFIG = {'groups': {
+    'base': {'cases': ['case_1', 'case_2', 'case_2']},
+    'mid': {'cases': ['case_3'], 'dependencies': ['base']},
+    'top': {'cases': ['case_4', 'case_1'], 'dependencies': ['mid', 'base']},
+}}
+
+
+def test_case_lists_are_the_config_entries():
+    config = copy.deepcopy(CONFIG)
+    assert pn_analyze.get_case_list_by_group(config) == {
+        'base': ['case_1', 'case_2'], 'mid': ['case_3', 'case_1', 'case_2'],
+        'top': ['case_4', 'case_1', 'case_3', 'case_2']}
+    assert config == CONFIG
+    qualified = {'groups': {'a': {'cases': [{'service': 'svcA', 'id': 'case_1'}, ['svcB', 'case_2'],
+                                            {'service': 'svcA', 'id': 'case_1'}]}}}
+    assert pn_analyze.get_case_list_by_group(qualified) == {
+        'a': [{'service': 'svcA', 'id': 'case_1'}, ['svcB', 'case_2']]}
+
+
+def test_service_and_id_keys_dont_collide():
+    config = {'groups': {'one': {'cases': [['a1', '2']]}, 'two': {'cases': [['a', '12']]}}}
+    index = _groups.DependencyIndex(config)
+    df = pd.DataFrame({'case_service_name': ['a1', 'a', 'a', 'b'], 'case_id': ['2', '12', '12', '2'],
+                       'case_status': ['passed', 'failed', 'passed', 'passed']})
+    groups = index.case_group_column(df)
+    assert groups.tolist()[:3] == ['one', 'two', 'two'] and groups.isna()[3]
+    rollup = index.rollup(df)
+    assert rollup.loc['one', 'rows'] == 1 and rollup.loc['two', 'rows'] == 2
+    assert rollup.loc['two', 'failures'] == 1
@@ -0,0 +1,25 @@
+import pytest
+import sqlalchemy as sa
+
+import _loader
+import pn_analyze
+from conftest import result_frame
+
+
+def test_in_memory_sqlite_loads_on_the_calling_thread():
+    engine = sa.create_engine('sqlite://')
+    result_frame(500).to_sql('test_result', engine, index=False)
+    assert not _loader.shares_connections(engine)
+    test_result = pn_analyze.TestResult(engine, writing_to_csv=False)
+    test_result.strict_startup()
+    assert len(test_result.load_stats) == 1
+    assert 0 < len(test_result.df) <= 500
+
+
+def test_unparseable_timestamps_raise(make_engine):
+    frame = result_frame(200)
+    frame.loc[10, 'case_timestamp'] = 'not a time'
+    test_result = pn_analyze.TestResult(make_engine(frame), writing_to_csv=False)
+    assert _loader.shares_connections(test_result.disk_engine)
+    with pytest.raises(ValueError, match='not a time'):
+        test_result.startup()
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+import _memo
+import pn_analyze
+from conftest import result_frame
+
+
+def counting(results):
+    """function of (data, key) returning results[key], counting its calls in calls"""
+    calls = []
+
+    def func(data, key):
+        calls.append(key)
+        return results[key]
+    return func, calls
+
+
+def test_version_bump_invalidates():
+    func, calls = counting({'a': 1, 'b': 2})
+    cache = _memo.QueryCache()
+    assert cache.call(func, None, ('a',), version=1) == 1
+    assert cache.call(func, None, ('a',), version=1) == 1
+    assert calls == ['a']
+    cache.call(func, None, ('b',), version=1)
+    assert cache.call(func, None, ('a',), version=2) == 1
+    assert calls == ['a', 'b', 'a']
+    assert len(cache) == 1 and cache.invalidations == 2
+
+
+def test_data_version_bump_through_query(make_engine):
+    frame = result_frame(800)
+    engine = make_engine(frame.iloc[:500])
+    test_result = pn_analyze.TestResult(engine, writing_to_csv=False)
+    test_result.strict_startup()
+    first = test_result.query(len)
+    assert test_result.query(len) == first == len(test_result.df)
+    assert test_result.queries.stats['hits'] == 1
+    frame.iloc[500:].to_sql('test_result', engine, if_exists='append', index=False)
+    assert test_result.refresh_metrics()
+    assert test_result.query(len) == len(test_result.df) > first
+
+
+def test_evicts_least_recently_used_at_capacity():
+    func, calls = counting({key: key for key in 'abcd'})
+    cache = _memo.QueryCache(max_entries=2)
+    for key in 'baba':
+        cache.call(func, None, (key,))
+    cache.call(func, None, ('c',))
+    assert cache.evictions == 1 and len(cache) == 2
+    # a was used after b, so b went
+    cache.call(func, None, ('a',))
+    cache.call(func, None, ('b',))
+    assert calls == ['b', 'a', 'c', 'b']
+
+
+def test_evicts_by_bytes():
+    frames = {key: pd.DataFrame({'x': np.zeros(1000)}) for key in 'abc'}
+    size = _memo.result_size(frames['a'])
+    func, calls = counting(frames)
+    cache = _memo.QueryCache(max_bytes=2 * size)
+    for key in 'abc':
+        cache.call(func, None, (key,))
+    assert len(cache) == 2 and cache.bytes == 2 * size
+    # bigger than the whole cache: handed back but not kept
+    big = _memo.QueryCache(max_bytes=size - 1)
+    assert big.call(func, None, ('a',)) is frames['a']
+    assert len(big) == 0 and big.bytes == 0
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+import _data
+import _parallel
+import pn_analyze
+from conftest import result_frame
+
+AGGREGATION = {'case_duration': [('mean_duration', 'mean')]}
+
+
+@pytest.fixture
+def executor():
+    backend = _parallel.ProcessBackend(workers=2)
+    yield backend
+    backend.close()
+
+
+def test_two_instances_on_one_executor_match_serial(make_engine, executor):
+    # both objects reach the same data_version, the executor mustn't hand one of them the other's columns
+    test_results = []
+    for seed, rows in ((0, 3000), (1, 3200)):
+        test_result = pn_analyze.TestResult(make_engine(result_frame(rows, seed=seed), 'db{}.db'.format(seed)),
+                                            writing_to_csv=False, executor=executor)
+        test_result.strict_startup()
+        test_results.append(test_result)
+    assert test_results[0].data_version == test_results[1].data_version
+    for _ in range(2):
+        for test_result in test_results:
+            df = test_result.df
+            pd.testing.assert_series_equal(test_result.highest_failures_by_df_stdev('case_id', 0),
+                                           _data.highest_failures_by_df_stdev(df, 'case_id', 0))
+            pd.testing.assert_frame_equal(test_result.longest_case_over_time(AGGREGATION),
+                                          _data.return_longest_case_over_time(df, AGGREGATION))
+
+
+def test_endpoints_match_exactly(executor):
+    df = result_frame(2000)
+    # one endpoint per run, so the runs of 10.0.0.1 and 10.0.0.11 differ
+    endpoints = ['localhost', 'qacombo016', '10.0.0.1', '10.0.0.11']
+    df['case_endpoint'] = [endpoints[int(run[3:]) % 4] for run in df.group_uuid]
+    df['case_timestamp'] = pd.to_datetime(df.case_timestamp, format=pn_analyze.TIMESTAMP_PARSE_DICT['case_timestamp'])
+    by_endpoint = _data.endpoints_v_duration(df, as_frame=True)
+    for endpoint in ('10.0.0.1', '10.0.0.11'):
+        runs = set(df.group_uuid[df.case_endpoint == endpoint])
+        assert set(by_endpoint[endpoint].index) == runs
+    parallel = executor.endpoints_v_duration(df, None, as_frame=True)
+    assert list(parallel) == list(by_endpoint)
+    for endpoint, runs in by_endpoint.items():
+        pd.testing.assert_frame_equal(parallel[endpoint], runs)
@@ -0,0 +1,47 @@
+import pandas as pd
+
+import pn_analyze
+from conftest import result_frame
+
+SORT = ['case_timestamp', 'case_id', 'case_action', 'case_duration']
+
+
+def cut_through_runs(frame, cuts):
+    """frame with the run going at each cut failing entirely before it and passing from it on"""
+    frame = frame.copy()
+    for cut in cuts:
+        run = frame.group_uuid == frame.group_uuid[cut]
+        frame.loc[run & (frame.index < cut), 'case_status'] = 'failed'
+        frame.loc[run & (frame.index >= cut), 'case_status'] = 'passed'
+    return frame
+
+
+def sorted_rows(df):
+    return df.sort_values(SORT).reset_index(drop=True)
+
+
+def test_refresh_matches_full_reload(make_engine):
+    cuts = [600, 1200]
+    frame = cut_through_runs(result_frame(1500), cuts)
+    engine = make_engine(frame.iloc[:cuts[0]])
+    refreshed = pn_analyze.TestResult(engine, writing_to_csv=False)
+    refreshed.strict_startup()
+    # build everything that is kept up to date incrementally
+    assert refreshed.aggregates is not None and refreshed.rollups is not None
+    refreshed.duration_stats, refreshed.case_stats
+    for start, end in zip(cuts, cuts[1:] + [len(frame)]):
+        frame.iloc[start:end].to_sql('test_result', engine, if_exists='append', index=False)
+        refreshed.refresh_metrics()
+
+    reloaded = pn_analyze.TestResult(engine, writing_to_csv=False)
+    reloaded.strict_startup()
+    pd.testing.assert_frame_equal(sorted_rows(refreshed.df), sorted_rows(reloaded.df))
+    for key in ('case_id', 'case_endpoint', 'group_uuid'):
+        for col in ('case_duration', 'numeric_status'):
+            pd.testing.assert_series_equal(getattr(refreshed.aggregates.groupby(key), col).mean(),
+                                           getattr(reloaded.aggregates.groupby(key), col).mean())
+    for table, rollup in refreshed.rollups.tables.items():
+        pd.testing.assert_frame_equal(rollup, reloaded.rollups.tables[table])
+    assert refreshed.duration_stats.count == reloaded.duration_stats.count
+    assert abs(refreshed.duration_stats.mean - reloaded.duration_stats.mean) < 1e-9
+    pd.testing.assert_frame_equal(refreshed.case_stats.stats.sort_index(), reloaded.case_stats.stats.sort_index())
@@ -0,0 +1,79 @@
+import threading
+
+import pandas as pd
+
+import _resolver
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def stub_lookup(hosts):
+    """lookup of hosts (address : host name), raising OSError for the rest, with its calls in calls"""
+    calls = []
+
+    def lookup(address):
+        calls.append(address)
+        if address not in hosts:
+            raise OSError('unknown host')
+        return hosts[address]
+    return lookup, calls
+
+
+def test_failures_are_cached_for_the_negative_ttl():
+    lookup, calls = stub_lookup({'10.0.0.1': 'qacombo016'})
+    clock = Clock()
+    resolver = _resolver.HostnameResolver(lookup, ttl=100, negative_ttl=10, clock=clock)
+    try:
+        addresses = ['10.0.0.1', '10.0.0.2', '10.0.0.1']
+        assert resolver.resolve_many(addresses) == {'10.0.0.1': 'qacombo016', '10.0.0.2': None}
+        assert sorted(calls) == ['10.0.0.1', '10.0.0.2']
+        clock.now = 9
+        resolver.resolve_many(addresses)
+        assert len(calls) == 2
+        # the failure expired, the host name didn't
+        clock.now = 10
+        resolver.resolve_many(addresses)
+        assert sorted(calls) == ['10.0.0.1', '10.0.0.2', '10.0.0.2']
+        assert resolver.stats['failures'] == 2
+        clock.now = 100
+        resolver.resolve_many(addresses)
+        assert calls.count('10.0.0.1') == 2
+    finally:
+        resolver.close()
+
+
+def test_slow_lookup_times_out_then_is_cached():
+    answer = threading.Event()
+
+    def lookup(address):
+        answer.wait(5)
+        return 'slowhost'
+    resolver = _resolver.HostnameResolver(lookup, timeout=0.05)
+    try:
+        assert resolver.resolve('10.0.0.1') is None
+        assert resolver.stats['timeouts'] == 1
+        in_flight = resolver._pending['10.0.0.1']
+        answer.set()
+        in_flight.result(5)
+        assert resolver.resolve('10.0.0.1', timeout=0) == 'slowhost'
+    finally:
+        resolver.close()
+
+
+def test_hostname_column():
+    lookup, calls = stub_lookup({'10.0.0.1': 'qacombo016'})
+    resolver = _resolver.HostnameResolver(lookup)
+    try:
+        df = pd.DataFrame({'case_endpoint': ['10.0.0.1', 'localhost', None, '10.0.0.11', '10.0.0.1']})
+        hostnames = resolver.hostname_column(df)
+        assert hostnames.tolist()[:2] + hostnames.tolist()[4:] == ['qacombo016', 'localhost', 'qacombo016']
+        assert hostnames.isna().tolist() == [False, False, True, True, False]
+        assert sorted(calls) == ['10.0.0.1', '10.0.0.11']
+    finally:
+        resolver.close()
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+import _data
+import _rollup
+import pn_analyze
+from conftest import result_frame
+
+
+def rollup_frame(rows=3000):
+    frame = result_frame(rows)
+    frame['case_timestamp'] = pd.to_datetime(frame.case_timestamp,
+                                             format=pn_analyze.TIMESTAMP_PARSE_DICT['case_timestamp'])
+    frame.loc[frame.index[::97], 'case_duration'] = np.nan
+    frame['date_int'] = _data.date_integer(frame.case_timestamp)
+    return frame
+
+
+def test_incremental_updates_match_a_rebuild():
+    frame = rollup_frame()
+    cuts = [1200, 1900, 2400, 2401, len(frame)]
+    store = _rollup.RollupStore.from_frame(frame.iloc[:cuts[0]])
+    for start, end in zip(cuts, cuts[1:]):
+        seen = frame.iloc[:end]
+
+        def rows_since(timestamp):
+            return seen[seen.date_int >= timestamp]
+        store.update(frame.iloc[start:end], rows_since)
+    rebuilt = _rollup.RollupStore.from_frame(frame)
+    assert set(store.tables) == set(rebuilt.tables)
+    for table, rollup in store.tables.items():
+        pd.testing.assert_frame_equal(rollup, rebuilt.tables[table])
+    assert (store.first, store.last) == (rebuilt.first, rebuilt.last)
+
+
+def test_buckets_match_pandas():
+    frame = rollup_frame()
+    day = frame.case_timestamp.dt.floor('D')
+    expected = frame.groupby(['case_id', day]).case_duration
+    daily = _rollup.RollupStore.from_frame(frame).tables[('day', 'case_id')]
+    np.testing.assert_allclose(daily['mean'].to_numpy(), expected.mean().to_numpy())
+    np.testing.assert_allclose(daily['p90'].to_numpy(), expected.quantile(0.9).to_numpy())
+    np.testing.assert_array_equal(daily['rows'].to_numpy(), expected.size().to_numpy())
+    passed = (frame.case_status == 'passed').groupby([frame.case_id, day]).mean()
+    np.testing.assert_allclose(daily['pass_rate'].to_numpy(), passed.to_numpy())
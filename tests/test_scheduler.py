@@ -0,0 +1,83 @@
+import threading
+import time
+
+import _scheduler
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def test_a_slow_write_is_not_run_again_until_it_finishes():
+    release = threading.Event()
+    running = []
+    overlapped = []
+
+    def write():
+        overlapped.append(bool(running))
+        running.append(True)
+        release.wait(5)
+        running.pop()
+    scheduler = _scheduler.ExportScheduler()
+    scheduler.register('dump', write, interval=0.01, first_delay=0)
+    scheduler.start()
+    try:
+        wait_for(lambda: running)
+        # several intervals pass while the write is going
+        time.sleep(0.1)
+        assert scheduler.jobs['dump'].runs == 0 and len(overlapped) == 1
+        release.set()
+        wait_for(lambda: scheduler.jobs['dump'].runs >= 2)
+        assert not any(overlapped)
+    finally:
+        release.set()
+        scheduler.stop(5)
+
+
+def test_skips_while_the_version_does_not_change():
+    version = [None]
+    written = []
+    scheduler = _scheduler.ExportScheduler()
+    scheduler.register('dump', lambda: written.append(version[0]), interval=0.01, version=lambda: version[0],
+                       first_delay=0)
+    scheduler.start()
+    try:
+        wait_for(lambda: scheduler.jobs['dump'].skips >= 3)
+        version[0] = 1
+        wait_for(lambda: written)
+        skips = scheduler.jobs['dump'].skips
+        wait_for(lambda: scheduler.jobs['dump'].skips >= skips + 3)
+        assert written == [1]
+    finally:
+        scheduler.stop(5)
+
+
+def test_stop_waits_for_the_running_job_then_runs_nothing():
+    started = threading.Event()
+    calls = []
+
+    def write():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+    scheduler = _scheduler.ExportScheduler()
+    scheduler.register('dump', write, interval=0.01, first_delay=0)
+    scheduler.start()
+    assert started.wait(5)
+    scheduler.stop(5)
+    assert not scheduler.running
+    count = len(calls)
+    time.sleep(0.1)
+    assert len(calls) == count == 1
+
+
+def test_stop_with_a_long_interval_returns_right_away():
+    scheduler = _scheduler.ExportScheduler()
+    scheduler.register('dump', lambda: None, interval=3600)
+    scheduler.start()
+    start = time.monotonic()
+    scheduler.stop(5)
+    assert time.monotonic() - start < 1 and not scheduler.running
@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+import pn_analyze
+from conftest import result_frame
+
+pytest.importorskip('pyarrow')
+
+
+def load(engine, snapshot_dir):
+    test_result = pn_analyze.TestResult(engine, writing_to_csv=False, snapshot_dir=str(snapshot_dir))
+    test_result.startup()
+    return test_result
+
+
+def test_snapshot_reload_with_millisecond_timestamps(make_engine, tmp_path):
+    frame = result_frame(400)
+    engine = make_engine(frame.iloc[:300])
+    assert len(load(engine, tmp_path / 'snap').df) == 300
+    # the newest row of the snapshot isn't fetched again
+    reloaded = load(engine, tmp_path / 'snap')
+    assert len(reloaded.df) == 300
+    frame.iloc[300:].to_sql('test_result', engine, if_exists='append', index=False)
+    assert len(load(engine, tmp_path / 'snap').df) == 400
+
+
+def test_refresh_with_millisecond_timestamps(make_engine, tmp_path):
+    frame = result_frame(400)
+    engine = make_engine(frame.iloc[:300])
+    test_result = load(engine, tmp_path / 'snap')
+    assert test_result.refresh_metrics() == 0
+    frame.iloc[300:].to_sql('test_result', engine, if_exists='append', index=False)
+    assert test_result.refresh_metrics() == 100
+    assert test_result.refresh_metrics() == 0
+    assert len(test_result.df) == 400
+
+
+def test_compact_and_full_loads_dont_share_a_snapshot(make_engine, tmp_path):
+    engine = make_engine(result_frame(300))
+    direct = pn_analyze.TestResult(engine, writing_to_csv=False)
+    direct.startup()
+    for compact in (True, False, True):
+        test_result = pn_analyze.TestResult(engine, writing_to_csv=False, snapshot_dir=str(tmp_path / 'snap'),
+                                            compact=compact)
+        test_result.startup()
+        if not compact:
+            pd.testing.assert_frame_equal(test_result.df, direct.df)
+    assert str(test_result.df.case_duration.dtype) == 'float32'
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+import _stats
+from conftest import result_frame
+
+QUANTILES = (0.01, 0.1, 0.5, 0.9, 0.99)
+
+
+def durations(rows=20000, seed=0):
+    values = pd.Series(np.random.default_rng(seed).lognormal(0, 2, rows))
+    values[::50] = np.nan
+    return values
+
+
+def batches(values, count=7):
+    cuts = np.linspace(0, len(values), count + 1).astype(int)
+    return [values.iloc[start:end] for start, end in zip(cuts, cuts[1:])]
+
+
+def test_sketch_quantiles_within_accuracy():
+    values = durations()
+    sketch = _stats.QuantileSketch()
+    for batch in batches(values):
+        sketch.update(batch)
+    assert sketch.count == values.count()
+    for q in QUANTILES:
+        # the sketch gives the lower of two middle values, like interpolation='lower'
+        expected = values.quantile(q, interpolation='lower')
+        assert abs(sketch.quantile(q) - expected) <= _stats.DEFAULT_ACCURACY * expected
+
+
+def test_keyed_medians_within_accuracy():
+    frame = result_frame(5000)
+    keyed = _stats.KeyedStats()
+    for batch in batches(frame):
+        keyed.update(batch)
+    expected = frame.groupby('case_id').case_duration.quantile(0.5, interpolation='lower')
+    median = keyed.stats['median'].reindex(expected.index)
+    assert ((median - expected).abs() <= _stats.DEFAULT_ACCURACY * expected).all()
+
+
+def test_running_mean_std_match_pandas():
+    values = durations()
+    running = _stats.RunningStats()
+    for batch in batches(values):
+        running.update(batch)
+    merged = _stats.RunningStats()
+    for batch in batches(values, 3):
+        part = _stats.RunningStats()
+        part.update(batch)
+        merged.merge(part)
+    for stats in (running, merged):
+        assert stats.count == values.count()
+        np.testing.assert_allclose([stats.mean, stats.std, stats.min, stats.max],
+                                   [values.mean(), values.std(), values.min(), values.max()], rtol=1e-10)
+
+
+def test_keyed_mean_std_match_pandas():
+    frame = result_frame(5000)
+    frame.loc[frame.index[::13], 'case_duration'] = np.nan
+    keyed = _stats.KeyedStats()
+    for batch in batches(frame):
+        keyed.update(batch)
+    grouped = frame.groupby('case_id').case_duration
+    stats = keyed.stats.reindex(grouped.mean().index)
+    np.testing.assert_allclose(stats['count'], grouped.count())
+    np.testing.assert_allclose(stats['mean'], grouped.mean(), rtol=1e-10)
+    np.testing.assert_allclose(stats['std'], grouped.std(), rtol=1e-10)
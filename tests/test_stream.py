@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import _data
+import pn_analyze
+from conftest import result_frame
+
+
+def frame_with_failed_runs():
+    frame = result_frame(1500)
+    # a couple of runs that failed entirely, for the strict pass to drop
+    frame.loc[frame.group_uuid.isin(['run003', 'run011']), 'case_status'] = 'failed'
+    return frame
+
+
+def test_stream_report_matches_in_memory(make_engine):
+    engine = make_engine(frame_with_failed_runs())
+    in_memory = pn_analyze.TestResult(engine, writing_to_csv=False)
+    in_memory.strict_startup()
+    df = in_memory.df
+    report = pn_analyze.TestResult(engine, writing_to_csv=False).stream_report(chunksize=200)
+    assert report.rows == len(df) and report.chunks > 1
+    pd.testing.assert_series_equal(report.highest_failures_by_df_stdev('case_id', 0),
+                                   _data.highest_failures_by_df_stdev(df, 'case_id', 0), check_dtype=False)
+    pd.testing.assert_series_equal(report.highest_failures_by_groupby_count('case_id', 5),
+                                   _data.highest_failures_by_groupby_count(df.groupby('case_id'), 5),
+                                   check_dtype=False)
+    means = report.mean_from_unique_vals('case_duration', 'case_id', as_frame=True)
+    expected = _data.create_mean_col_from_unique_vals(df, 'case_duration', 'case_id', 'case_service_name',
+                                                      as_frame=True)
+    pd.testing.assert_frame_equal(means.sort_index(), expected.sort_index(), check_dtype=False,
+                                  check_index_type=False)
+    low, high = report.norm_bounds('case_duration', 2)
+    mean, std = df.case_duration.mean(), df.case_duration.std()
+    assert np.isclose(low, mean - 2 * std) and np.isclose(high, mean + 2 * std)
+
+
+def test_stream_raises_on_bad_timestamps(make_engine):
+    frame = result_frame(300)
+    frame.loc[250, 'case_timestamp'] = 'not a time'
+    test_result = pn_analyze.TestResult(make_engine(frame), writing_to_csv=False)
+    with pytest.raises(ValueError, match='not a time'):
+        list(test_result.stream(chunksize=100, strict=False))
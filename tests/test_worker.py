@@ -0,0 +1,25 @@
+import threading
+
+import _client
+import _worker
+import pn_analyze
+from conftest import result_frame
+
+
+def test_latest_run_and_stop(make_engine, tmp_path):
+    test_result = pn_analyze.TestResult(make_engine(result_frame(500)), writing_to_csv=False)
+    socket_path = str(tmp_path / 'worker.sock')
+    worker = _worker.Worker(test_result, socket_path, refresh_interval=0, strict=False).start()
+    serving = threading.Thread(target=worker.serve_forever)
+    serving.start()
+    try:
+        response = _client.request('report', socket_path, timeout=10, name='latest_run')
+        assert response['ok'], response.get('error')
+        df = test_result.df
+        latest = df.group_uuid[df.case_timestamp == df.case_timestamp.max()].iloc[0]
+        assert len(response['result']['data']) == (df.group_uuid == latest).sum()
+        # answered before the worker goes down
+        assert _client.request('stop', socket_path, timeout=10)['result'] == 'stopping'
+    finally:
+        serving.join(10)
+    assert not serving.is_alive()